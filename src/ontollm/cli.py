@@ -1,14 +1,17 @@
 """Command line interface for ontollm."""
 import codecs
+import csv
+import inspect
 import json
 import logging
 import pickle
 import sys
+from contextlib import nullcontext
 from copy import copy, deepcopy
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
 from io import BytesIO, TextIOWrapper
 from pathlib import Path
-from typing import List, Optional, Union
+from typing import Iterator, List, Optional, Tuple, Union
 
 import click
 import jsonlines
@@ -45,6 +48,7 @@ from ontollm.evaluation.resolver import create_evaluator
 from ontollm.io.csv_wrapper import output_parser, write_obj_as_csv
 from ontollm.io.html_exporter import HTMLExporter
 from ontollm.io.markdown_exporter import MarkdownExporter
+from ontollm.utils.adapter_registry import DEFAULT_MAX_OPEN_ADAPTERS, adapter_registry
 from ontollm.utils.gene_set_utils import (
     GeneSet,
     _is_human,
@@ -52,6 +56,9 @@ from ontollm.utils.gene_set_utils import (
     parse_gene_set,
 )
 from ontollm.utils.gpt4all_runner import chain_gpt4all_model, set_up_gpt4all_model
+from ontollm.utils.mapping_index import MappingIndex
+from ontollm.utils.run_journal import DEFAULT_JOURNAL_DB, RunJournal
+from ontollm.utils.work_queue import DEFAULT_LEASE_SECONDS, WorkQueue, input_shard
 
 __all__ = [
     "main",
@@ -62,18 +69,57 @@ from ontollm.io.rdf_exporter import RDFExporter
 from ontollm.io.yaml_wrapper import dump_minimal_yaml
 from ontollm.templates.core import ExtractionResult
 
+# Defaults of the sampling options of commands that generate text
+DEFAULT_MAX_GEN_LEN = 16000
+DEFAULT_TEMPERATURE = 0.6
+DEFAULT_TOP_P = 0.9
+
 
 @dataclass
 class Settings:
     """Global command line settings."""
 
     cache_db: Optional[str] = None
+    grounding_cache_db: Optional[str] = None
+    mapping_index: Optional[str] = None
     skip_annotators: Optional[List[str]] = None
 
 
 settings = Settings()
 
 
+def _configure_engine(
+    ke: KnowledgeEngine,
+    cache_db: Optional[str] = None,
+    grounding_cache_db: Optional[str] = None,
+    mapping_index: Optional[str] = None,
+    skip_annotators: Optional[List[str]] = None,
+) -> None:
+    """Apply the global command line settings to an engine.
+
+    :param ke: the engine
+    :param cache_db: path to the cache of completions, used by the engine and its client
+    :param grounding_cache_db: path to the cache of groundings
+    :param mapping_index: path to a local mapping index, used instead of the translator;
+        it must be given to the engine constructor as mapping_index_path, so that the
+        engine does not set up the translator in the first place
+    :param skip_annotators: annotators not to use
+    """
+    if cache_db:
+        ke.cache_db_path = cache_db
+        client = getattr(ke, "client", None)
+        if client is not None and hasattr(client, "cache_db_path"):
+            client.cache_db_path = cache_db
+    if grounding_cache_db:
+        ke.grounding_cache_path = grounding_cache_db
+    if mapping_index != ke.mapping_index_path:
+        raise ValueError(
+            f"Engine created with mapping index {ke.mapping_index_path}, not {mapping_index}"
+        )
+    if skip_annotators:
+        ke.skip_annotators = skip_annotators
+
+
 def _as_text_writer(f):
     if isinstance(f, TextIOWrapper):
         return f
@@ -123,6 +169,86 @@ def write_extraction(
             output.write(dump_minimal_yaml(results))  # type: ignore
 
 
+def _journaled_output(output: str) -> Optional[str]:
+    """Get the path of an output whose offsets are journaled; None for standard output."""
+    return None if output == "-" else output
+
+
+def _open_output(output: str, journal: Optional[RunJournal] = None):
+    """Open an output file for writing, or standard output for '-'.
+
+    With a journal, the file is appended to, once truncated to the end of
+    the last results recorded as done, dropping any partly written ones.
+    """
+    if output == "-":
+        return nullcontext(sys.stdout)
+    if journal is None:
+        return open(output, "wb")
+    file = open(output, "ab")
+    offset = journal.output_offset()
+    if offset is None:
+        journal.set_output_offset(file.tell())
+    elif offset < file.tell():
+        logging.warning(f"Truncating {output} to the results written before the run stopped")
+        file.truncate(offset)
+    return file
+
+
+def _write_journaled_extraction(
+    results: ExtractionResult,
+    output,
+    output_format: str,
+    knowledge_engine: KnowledgeEngine,
+    journal: Optional[RunJournal] = None,
+):
+    """Write results of extraction, then record them as done in the run journal."""
+    write_extraction(results, output, output_format, knowledge_engine)
+    if journal is None:
+        return
+    output.flush()
+    try:
+        offset = output.tell()
+    except (OSError, ValueError):
+        offset = None
+    journal.done(results.input_text, output_offset=offset, input_id=results.input_id)
+
+
+def _extraction_kwargs(knowledge_engine: KnowledgeEngine, **kwargs) -> dict:
+    """Keep the keyword arguments that the extract_from_text method of an engine accepts.
+
+    Not all engines take sampling parameters (e.g. GPT4AllEngine does not).
+    """
+    parameters = inspect.signature(knowledge_engine.extract_from_text).parameters
+    return {k: v for k, v in kwargs.items() if k in parameters}
+
+
+def _read_documents(
+    input: str, text_field: str = "text", id_field: str = "id"
+) -> Iterator[Tuple[str, str]]:
+    """Read (input_id, text) pairs from a directory, a JSONL file or a TSV file.
+
+    Files in a directory are read in name order, with their path as id.
+    Records of JSONL and TSV files are read in order, with the value of
+    id_field as id, or the record number if that is missing.
+    """
+    path = Path(input)
+    if path.is_dir():
+        for file in sorted(p for p in path.iterdir() if p.is_file()):
+            yield str(file), file.read_text()
+    elif path.suffix == ".jsonl":
+        with jsonlines.open(path) as reader:
+            for n, record in enumerate(reader):
+                yield str(record.get(id_field, n)), record[text_field]
+    elif path.suffix in (".tsv", ".tab"):
+        with path.open(newline="") as file:
+            for n, row in enumerate(csv.DictReader(file, delimiter="\t")):
+                yield str(row.get(id_field) or n), row[text_field]
+    else:
+        raise click.BadParameter(
+            f"Expected a directory, .jsonl or .tsv file, not {input}", param_hint="input"
+        )
+
+
 def get_model_by_name(modelname: str):
     """Retrieve a model name and metadata from those available.
 
@@ -179,6 +305,24 @@ output_option_wb = click.option(
 output_option_txt = click.option(
     "-o", "--output", type=click.File(mode="w"), default=sys.stdout, help="Output file."
 )
+resumable_output_option = click.option(
+    "-o",
+    "--output",
+    default="-",
+    show_default=True,
+    help="Output file. With --run-id, results are appended, so that a resumed run adds to it.",
+)
+run_id_option = click.option(
+    "--run-id",
+    help="Identifier of a resumable run. Rerunning with the same id skips documents "
+    "already written, retries failed ones and appends to the output.",
+)
+journal_db_option = click.option(
+    "--journal-db",
+    default=DEFAULT_JOURNAL_DB,
+    show_default=True,
+    help="Path to sqlite database journaling the documents of resumable runs.",
+)
 output_format_options = click.option(
     "-O",
     "--output-format",
@@ -199,21 +343,23 @@ show_prompt_option = click.option(
 )
 max_gen_len_option = click.option(
     "--max-gen-len",
-    default=16000,
+    default=DEFAULT_MAX_GEN_LEN,
     type=click.INT,
-    help="Maximum length of generated sequences. Default is 16000.",
+    help=f"Maximum length of generated sequences. Default is {DEFAULT_MAX_GEN_LEN}.",
 )
 temperature_option = click.option(
     "--temperature",
-    default=0.6,
+    default=DEFAULT_TEMPERATURE,
     type=click.FLOAT,
-    help="The temperature value for controlling randomness in generation.  Default is 0.6",
+    help="The temperature value for controlling randomness in generation. "
+    f"Default is {DEFAULT_TEMPERATURE}",
 )
 top_p_option = click.option(
     "--top-p",
-    default=0.9,
+    default=DEFAULT_TOP_P,
     type=click.FLOAT,
-    help="The top p sampling parameter for controlling diversity in generation. Default is 0.9",
+    help="The top p sampling parameter for controlling diversity in generation. "
+    f"Default is {DEFAULT_TOP_P}",
 )
 
 
@@ -221,13 +367,36 @@ top_p_option = click.option(
 @click.option("-v", "--verbose", count=True)
 @click.option("-q", "--quiet")
 @click.option("--cache-db", help="Path to sqlite database to cache prompt-completion results")
+@click.option(
+    "--grounding-cache-db",
+    help="Path to sqlite database to cache groundings of named entities across runs",
+)
+@click.option(
+    "--mapping-index",
+    help="Path to a local mapping index, made with build-mapping-index, used to normalize"
+    " identifiers instead of the online translator service",
+)
+@click.option(
+    "--max-open-adapters",
+    type=click.INT,
+    help="Number of ontology adapters kept open at once; the least recently used are closed."
+    f" Default is {DEFAULT_MAX_OPEN_ADAPTERS}",
+)
 @click.option(
     "--skip-annotator",
     multiple=True,
     help="Skip one or more annotators (e.g. --skip-annotator gilda)",
 )
 @click.version_option(__version__)
-def main(verbose: int, quiet: bool, cache_db: str, skip_annotator):
+def main(
+    verbose: int,
+    quiet: bool,
+    cache_db: str,
+    grounding_cache_db: str,
+    mapping_index: str,
+    max_open_adapters: Optional[int],
+    skip_annotator,
+):
     """CLI for ontollm.
 
     :param verbose: Verbosity while running.
@@ -245,6 +414,12 @@ def main(verbose: int, quiet: bool, cache_db: str, skip_annotator):
     logger.info(f"Logger {logger.name} set to level {logger.level}")
     if cache_db:
         settings.cache_db = cache_db
+    if grounding_cache_db:
+        settings.grounding_cache_db = grounding_cache_db
+    if mapping_index:
+        settings.mapping_index = mapping_index
+    if max_open_adapters is not None:
+        adapter_registry().max_open = max_open_adapters
     if skip_annotator:
         settings.skip_annotators = list(skip_annotator)
 
@@ -326,14 +501,16 @@ def extract(
     # TODO Make SPIRESEngine work without OpenAI, and change the model_source
     # here
     if model_source == "OpenAI":
-        ke = SPIRESEngine(template=template, model=model_name, **kwargs)
-        if settings.cache_db:
-            ke.client.cache_db_path = settings.cache_db
-        if settings.skip_annotators:
-            ke.client.skip_annotators = settings.skip_annotators
+        ke = SPIRESEngine(
+            template=template, model=model_name, mapping_index_path=settings.mapping_index, **kwargs
+        )
+        _configure_engine(ke, **asdict(settings))
 
     elif model_source == "GPT4All":
-        ke = GPT4AllEngine(template=template, model=model_name, **kwargs)
+        ke = GPT4AllEngine(
+            template=template, model=model_name, mapping_index_path=settings.mapping_index, **kwargs
+        )
+        _configure_engine(ke, **asdict(settings))
 
     elif model_source == "HuggingFace Hub":
         raise NotImplementedError("HF Hub support temporarily disabled. Sorry!")
@@ -358,6 +535,247 @@ def extract(
     write_extraction(results, output, output_format, ke)
 
 
+@main.command()
+@template_option
+@target_class_option
+@model_option
+@recurse_option
+@resumable_output_option
+@click.option("--dictionary")
+@output_format_options
+@auto_prefix_option
+@show_prompt_option
+@max_gen_len_option
+@temperature_option
+@top_p_option
+@run_id_option
+@journal_db_option
+@click.option(
+    "--workers",
+    "-w",
+    default=4,
+    show_default=True,
+    type=click.INT,
+    help="Number of documents extracted concurrently.",
+)
+@click.option(
+    "--ordered/--unordered",
+    default=True,
+    show_default=True,
+    help="Write results in input order, or as soon as each document is done.",
+)
+@click.option(
+    "--text-field",
+    default="text",
+    show_default=True,
+    help="Field (JSONL) or column (TSV) holding the document text.",
+)
+@click.option(
+    "--id-field",
+    default="id",
+    show_default=True,
+    help="Field (JSONL) or column (TSV) holding the document identifier.",
+)
+@click.option(
+    "--shard-index",
+    type=click.INT,
+    help="Only extract the documents in this shard, from 0 to shard count - 1.",
+)
+@click.option(
+    "--shard-count",
+    type=click.INT,
+    help="Number of shards the input is split into, by a hash of each document.",
+)
+@click.option(
+    "--work-queue/--no-work-queue",
+    default=False,
+    show_default=True,
+    help="Claim documents from a queue in the journal database, shared by all processes "
+    "running the same --run-id (e.g. on several nodes, with the database on a shared disk).",
+)
+@click.option(
+    "--lease-seconds",
+    default=DEFAULT_LEASE_SECONDS,
+    show_default=True,
+    type=click.FLOAT,
+    help="Seconds after which a document claimed by a process that stopped is claimed again.",
+)
+@click.argument("input")
+def batch_extract(
+    input,
+    template,
+    target_class,
+    dictionary,
+    output,
+    output_format,
+    model,
+    show_prompt,
+    max_gen_len,
+    temperature,
+    top_p,
+    run_id,
+    journal_db,
+    workers,
+    ordered,
+    text_field,
+    id_field,
+    shard_index,
+    shard_count,
+    work_queue,
+    lease_seconds,
+    **kwargs,
+):
+    """Extract knowledge from a corpus of documents, using a pool of workers.
+
+    The input is a directory of text files, a JSONL file with one document
+    per line, or a TSV file with a header row. All workers share a single
+    loaded model; results are written as they become available.
+
+    With --run-id, the run is journaled: if it is interrupted, rerunning
+    the same command skips the documents already written and appends
+    the rest to the output.
+
+    A corpus can be split across processes or nodes either statically,
+    with --shard-index and --shard-count, or dynamically, with --work-queue,
+    where each process claims documents as it goes. Each process writes its
+    own output; combine them afterwards with merge-extractions.
+
+    Example:
+
+        ontollm batch-extract -t drug.DrugMechanism -w 8 -o results.yaml abstracts.jsonl
+
+        ontollm batch-extract -t drug.DrugMechanism --shard-index 0 --shard-count 4
+            -o results.0.yaml abstracts.jsonl
+    """
+    if (shard_index is None) != (shard_count is None):
+        raise click.UsageError("--shard-index and --shard-count must be given together")
+    if shard_count is not None and not 0 <= shard_index < shard_count:
+        raise click.BadParameter(
+            f"must be from 0 to {shard_count - 1}", param_hint="--shard-index"
+        )
+    if work_queue and not run_id:
+        raise click.UsageError("--work-queue requires a --run-id")
+    logging.info(f"Creating for {template}")
+
+    if not model:
+        model = DEFAULT_MODEL
+    selectmodel = get_model_by_name(model)
+    model_source = selectmodel["provider"]
+    model_name = selectmodel["alternative_names"][0]
+
+    if model_source == "OpenAI":
+        ke = SPIRESEngine(
+            template=template, model=model_name, mapping_index_path=settings.mapping_index, **kwargs
+        )
+        _configure_engine(ke, **asdict(settings))
+
+    elif model_source == "GPT4All":
+        ke = GPT4AllEngine(
+            template=template, model=model_name, mapping_index_path=settings.mapping_index, **kwargs
+        )
+        _configure_engine(ke, **asdict(settings))
+
+    elif model_source == "HuggingFace Hub":
+        raise NotImplementedError("HF Hub support temporarily disabled. Sorry!")
+
+    if dictionary:
+        ke.load_dictionary(dictionary)
+    if target_class:
+        target_class_def = ke.schemaview.get_class(target_class)
+    else:
+        target_class_def = None
+    documents = _read_documents(input, text_field=text_field, id_field=id_field)
+    if shard_count is not None:
+        documents = (d for d in documents if input_shard(d[1], shard_count) == shard_index)
+    journal: Optional[RunJournal] = None
+    if work_queue:
+        journal = WorkQueue(
+            run_id, journal_db, lease_seconds=lease_seconds, output=_journaled_output(output)
+        )
+        journal.enqueue(documents)
+        documents = journal.claims()
+    elif run_id:
+        journal = RunJournal(run_id, journal_db, output=_journaled_output(output))
+    with _open_output(output, journal) as output_file:
+        extraction_kwargs = _extraction_kwargs(ke, class_def=target_class_def,
+                                               show_prompt=show_prompt,
+                                               max_gen_len=max_gen_len,
+                                               temperature=temperature,
+                                               top_p=top_p)
+        for results in ke.extract_from_texts(documents, workers=workers, ordered=ordered,
+                                             journal=journal, **extraction_kwargs):
+            _write_journaled_extraction(results, output_file, output_format, ke, journal)
+    if journal:
+        logging.info(f"Run {run_id}: {journal.counts()}")
+        journal.close()
+
+
+@main.command()
+@output_option_txt
+@click.option(
+    "--sort/--no-sort",
+    default=False,
+    show_default=True,
+    help="Sort results by input id, rather than keeping the order of the inputs.",
+)
+@click.argument("inputs", nargs=-1, required=True)
+def merge_extractions(inputs, output, sort):
+    """Merge YAML extraction results written by several processes into one.
+
+    Results for the same input (e.g. a document extracted again after its
+    lease expired) are only kept once.
+
+    Example:
+
+        ontollm merge-extractions -o results.yaml results.*.yaml
+    """
+    seen = set()
+    merged = []
+    for input in inputs:
+        with open(input) as file:
+            for doc in yaml.safe_load_all(file):
+                if not doc:
+                    continue
+                key = (doc.get("input_id"), doc.get("input_text"))
+                if key in seen:
+                    continue
+                seen.add(key)
+                merged.append(doc)
+    if sort:
+        merged.sort(key=lambda doc: str(doc.get("input_id") or ""))
+    logging.info(f"Merged {len(merged)} results from {len(inputs)} files")
+    for doc in merged:
+        output.write("---\n")
+        output.write(dump_minimal_yaml(doc))
+
+
+@main.command()
+@click.option(
+    "-o", "--output", required=True, help="Path to the sqlite database to write the index to."
+)
+@click.argument("inputs", nargs=-1, required=True)
+def build_mapping_index(inputs, output):
+    """Index identifier mappings locally, for normalizing identifiers offline.
+
+    Inputs are SSSOM TSV files or OAK adapter selectors of ontologies
+    carrying mappings; an existing index is added to.
+
+    Example:
+
+        ontollm build-mapping-index -o mappings.db mondo.sssom.tsv sqlite:obo:hp
+
+        ontollm --mapping-index mappings.db extract -t mendelian_disease ...
+    """
+    index = MappingIndex(output)
+    for input in inputs:
+        if Path(input).exists():
+            index.load_sssom_tsv(input)
+        else:
+            index.load_adapter(input)
+    logging.info(f"Indexed {index.count()} mappings in {output}")
+    index.close()
+
+
 @main.command()
 @template_option
 @model_option
@@ -383,15 +801,15 @@ def generate_extract(model, entity, template, output, output_format, show_prompt
     # TODO Make SPIRESEngine work without OpenAI, and change the model_source
     # here
     if model_source == "OpenAI":
-        ke = SPIRESEngine(template, **kwargs)
-        if settings.cache_db:
-            ke.client.cache_db_path = settings.cache_db
-        if settings.skip_annotators:
-            ke.skip_annotators = settings.skip_annotators
+        ke = SPIRESEngine(template, mapping_index_path=settings.mapping_index, **kwargs)
+        _configure_engine(ke, **asdict(settings))
 
     elif model_source == "GPT4All":
         model_name = selectmodel["alternative_names"][0]
-        ke = GPT4AllEngine(template=template, model=model_name, **kwargs)
+        ke = GPT4AllEngine(
+            template=template, model=model_name, mapping_index_path=settings.mapping_index, **kwargs
+        )
+        _configure_engine(ke, **asdict(settings))
 
     logging.debug(f"Input entity: {entity}")
     results = ke.generate_and_extract(entity=entity, prompt_template=template,
@@ -434,9 +852,9 @@ def iteratively_generate_extract(
     ontology,
     show_prompt,
     i,
-    max_gen_len=max_gen_len,
-    temperature=temperature,
-    top_p=top_p,
+    max_gen_len=DEFAULT_MAX_GEN_LEN,
+    temperature=DEFAULT_TEMPERATURE,
+    top_p=DEFAULT_TOP_P,
     **kwargs,
 ):
     """Iterate through generate-extract."""
@@ -450,15 +868,15 @@ def iteratively_generate_extract(
     # TODO Make SPIRESEngine work without OpenAI, and change the model_source
     # here
     if model_source == "OpenAI":
-        ke = SPIRESEngine(template, **kwargs)
-        if settings.cache_db:
-            ke.client.cache_db_path = settings.cache_db
-        if settings.skip_annotators:
-            ke.skip_annotators = settings.skip_annotators
+        ke = SPIRESEngine(template, mapping_index_path=settings.mapping_index, **kwargs)
+        _configure_engine(ke, **asdict(settings))
 
     elif model_source == "GPT4All":
         model_name = selectmodel["alternative_names"][0]
-        ke = GPT4AllEngine(template=template, model=model_name, **kwargs)
+        ke = GPT4AllEngine(
+            template=template, model=model_name, mapping_index_path=settings.mapping_index, **kwargs
+        )
+        _configure_engine(ke, **asdict(settings))
 
     logging.debug(f"Input entity: {entity}")
     adapter = get_adapter(ontology)
@@ -494,7 +912,8 @@ def iteratively_generate_extract(
     help="Attempt to parse PubMed Central full text(s) instead of abstract(s) alone.",
 )
 @click.argument("pmid")
-def pubmed_extract(model, pmid, template, output, output_format, get_pmc, show_prompt, **kwargs):
+def pubmed_extract(model, pmid, template, output, output_format, get_pmc, show_prompt,
+                   max_gen_len, temperature, top_p, **kwargs):
     """Extract knowledge from a single PubMed ID."""
     logging.info(f"Creating for {template}")
 
@@ -506,15 +925,15 @@ def pubmed_extract(model, pmid, template, output, output_format, get_pmc, show_p
     # TODO Make SPIRESEngine work without OpenAI, and change the model_source
     # here
     if model_source == "OpenAI":
-        ke = SPIRESEngine(template, **kwargs)
-        if settings.cache_db:
-            ke.client.cache_db_path = settings.cache_db
-        if settings.skip_annotators:
-            ke.skip_annotators = settings.skip_annotators
+        ke = SPIRESEngine(template, mapping_index_path=settings.mapping_index, **kwargs)
+        _configure_engine(ke, **asdict(settings))
 
     elif model_source == "GPT4All":
         model_name = selectmodel["alternative_names"][0]
-        ke = GPT4AllEngine(template=template, model=model_name, **kwargs)
+        ke = GPT4AllEngine(
+            template=template, model=model_name, mapping_index_path=settings.mapping_index, **kwargs
+        )
+        _configure_engine(ke, **asdict(settings))
 
     pmc = PubmedClient()
     if get_pmc:
@@ -535,12 +954,14 @@ def pubmed_extract(model, pmid, template, output, output_format, get_pmc, show_p
 @template_option
 @model_option
 @recurse_option
-@output_option_wb
+@resumable_output_option
 @output_format_options
 @show_prompt_option
 @max_gen_len_option
 @temperature_option
 @top_p_option
+@run_id_option
+@journal_db_option
 @click.option(
     "--limit",
     default=20,
@@ -554,7 +975,7 @@ def pubmed_extract(model, pmid, template, output, output_format, get_pmc, show_p
 @click.argument("search")
 def pubmed_annotate(
     model, search, template, output, output_format, limit, get_pmc, show_prompt,
-    max_gen_len, temperature, top_p,
+    max_gen_len, temperature, top_p, run_id, journal_db,
     **kwargs
 ):
     """Retrieve a collection of PubMed IDs for a search term; annotate them using a template.
@@ -562,6 +983,8 @@ def pubmed_annotate(
     Example:
     ontogpt pubmed-annotate -t phenotype "Takotsubo Cardiomyopathy: A Brief Review"
         --get-pmc --model gpt-3.5-turbo-16k --limit 3
+
+    With --run-id, an interrupted run can be resumed by rerunning the same command.
     """
     logging.info(f"Creating for {template}")
 
@@ -571,15 +994,15 @@ def pubmed_annotate(
     model_source = selectmodel["provider"]
 
     if model_source == "OpenAI":
-        ke = SPIRESEngine(template, **kwargs)
-        if settings.cache_db:
-            ke.client.cache_db_path = settings.cache_db
-        if settings.skip_annotators:
-            ke.skip_annotators = settings.skip_annotators
+        ke = SPIRESEngine(template, mapping_index_path=settings.mapping_index, **kwargs)
+        _configure_engine(ke, **asdict(settings))
 
     elif model_source == "GPT4All":
         model_name = selectmodel["alternative_names"][0]
-        ke = GPT4AllEngine(template=template, model=model_name, **kwargs)
+        ke = GPT4AllEngine(
+            template=template, model=model_name, mapping_index_path=settings.mapping_index, **kwargs
+        )
+        _configure_engine(ke, **asdict(settings))
 
     pubmed_annotate_limit = limit
     pmc = PubmedClient()
@@ -589,13 +1012,19 @@ def pubmed_annotate(
         textlist = pmc.text(pmids[: pubmed_annotate_limit + 1], pubmedcental=True)
     else:
         textlist = pmc.text(pmids[: pubmed_annotate_limit + 1])
-    for text in textlist:
-        logging.debug(f"Input text: {text}")
-        results = ke.extract_from_text(text=text, show_prompt=show_prompt,
-                                       max_gen_len=max_gen_len,
-                                       temperature=temperature,
-                                       top_p=top_p)
-        write_extraction(results, output, output_format, ke)
+    journal = RunJournal(run_id, journal_db, output=_journaled_output(output)) if run_id else None
+    with _open_output(output, journal) as output_file:
+        extraction_kwargs = _extraction_kwargs(ke, show_prompt=show_prompt,
+                                               max_gen_len=max_gen_len,
+                                               temperature=temperature,
+                                               top_p=top_p)
+        for results in ke.extract_from_texts(textlist, workers=1, journal=journal,
+                                             **extraction_kwargs):
+            logging.debug(f"Input text: {results.input_text}")
+            _write_journaled_extraction(results, output_file, output_format, ke, journal)
+    if journal:
+        logging.info(f"Run {run_id}: {journal.counts()}")
+        journal.close()
 
 
 @main.command()
@@ -621,15 +1050,17 @@ def wikipedia_extract(model, article, template, output, output_format,
     # TODO Make SPIRESEngine work without OpenAI, and change the model_source
     # here
     if model_source == "OpenAI":
-        ke = SPIRESEngine(template=template, model=model, **kwargs)
-        if settings.cache_db:
-            ke.client.cache_db_path = settings.cache_db
-        if settings.skip_annotators:
-            ke.skip_annotators = settings.skip_annotators
+        ke = SPIRESEngine(
+            template=template, model=model, mapping_index_path=settings.mapping_index, **kwargs
+        )
+        _configure_engine(ke, **asdict(settings))
 
     elif model_source == "GPT4All":
         model_name = selectmodel["alternative_names"][0]
-        ke = GPT4AllEngine(template=template, model=model_name, **kwargs)
+        ke = GPT4AllEngine(
+            template=template, model=model_name, mapping_index_path=settings.mapping_index, **kwargs
+        )
+        _configure_engine(ke, **asdict(settings))
 
     logging.info(f"Creating for {template} => {article}")
     client = WikipediaClient()
@@ -669,11 +1100,17 @@ def wikipedia_search(model, topic, keyword, template, output, output_format,
     model_source = selectmodel["provider"]
 
     if model_source == "OpenAI":
-        ke = SPIRESEngine(template=template, model=model, **kwargs)
+        ke = SPIRESEngine(
+            template=template, model=model, mapping_index_path=settings.mapping_index, **kwargs
+        )
+        _configure_engine(ke, **asdict(settings))
 
     elif model_source == "GPT4All":
         model_name = selectmodel["alternative_names"][0]
-        ke = GPT4AllEngine(template=template, model=model_name, **kwargs)
+        ke = GPT4AllEngine(
+            template=template, model=model_name, mapping_index_path=settings.mapping_index, **kwargs
+        )
+        _configure_engine(ke, **asdict(settings))
 
     logging.info(f"Creating for {template} => {topic}")
     client = WikipediaClient()
@@ -729,11 +1166,15 @@ def search_and_extract(
     model_source = selectmodel["provider"]
 
     if model_source == "OpenAI":
-        ke = SPIRESEngine(template, **kwargs)
+        ke = SPIRESEngine(template, mapping_index_path=settings.mapping_index, **kwargs)
+        _configure_engine(ke, **asdict(settings))
 
     elif model_source == "GPT4All":
         model_name = selectmodel["alternative_names"][0]
-        ke = GPT4AllEngine(template=template, model=model_name, **kwargs)
+        ke = GPT4AllEngine(
+            template=template, model=model_name, mapping_index_path=settings.mapping_index, **kwargs
+        )
+        _configure_engine(ke, **asdict(settings))
 
     term = " ".join(term_tokens)
     logging.info(f"Creating for {template}; search={term} kw={keyword}")
@@ -753,16 +1194,11 @@ def search_and_extract(
     logging.info(f"PMID={pmid}")
     text = pmc.text(pmid)
     logging.info(f"Input text: {text}")
-<<<<<<<
-    results = ke.extract_from_text(text=text, show_prompt=show_prompt)
-    write_extraction(results, output, output_format, ke)
-=======
     results = ke.extract_from_text(text=text, show_prompt=show_prompt,
                                    max_gen_len=max_gen_len,
                                    temperature=temperature,
                                    top_p=top_p)
-    write_extraction(results, output, output_format)
->>>>>>>
+    write_extraction(results, output, output_format, ke)
 
 
 @main.command()
@@ -787,15 +1223,17 @@ def web_extract(model, template, url, output, output_format, show_prompt,
     model_source = selectmodel["provider"]
 
     if model_source == "OpenAI":
-        ke = SPIRESEngine(template=template, model=model, **kwargs)
-        if settings.cache_db:
-            ke.client.cache_db_path = settings.cache_db
-        if settings.skip_annotators:
-            ke.skip_annotators = settings.skip_annotators
+        ke = SPIRESEngine(
+            template=template, model=model, mapping_index_path=settings.mapping_index, **kwargs
+        )
+        _configure_engine(ke, **asdict(settings))
 
     elif model_source == "GPT4All":
         model_name = selectmodel["alternative_names"][0]
-        ke = GPT4AllEngine(template=template, model=model_name, **kwargs)
+        ke = GPT4AllEngine(
+            template=template, model=model_name, mapping_index_path=settings.mapping_index, **kwargs
+        )
+        _configure_engine(ke, **asdict(settings))
 
     web_client = SoupClient()
     text = web_client.text(url)
@@ -846,15 +1284,15 @@ def recipe_extract(
     # TODO Make SPIRESEngine work without OpenAI, and change the model_source
     # here
     if model_source == "OpenAI":
-        ke = SPIRESEngine(template, **kwargs)
-        if settings.cache_db:
-            ke.client.cache_db_path = settings.cache_db
-        if settings.skip_annotators:
-            ke.skip_annotators = settings.skip_annotators
+        ke = SPIRESEngine(template, mapping_index_path=settings.mapping_index, **kwargs)
+        _configure_engine(ke, **asdict(settings))
 
     elif model_source == "GPT4All":
         model_name = selectmodel["alternative_names"][0]
-        ke = GPT4AllEngine(template=template, model=model_name, **kwargs)
+        ke = GPT4AllEngine(
+            template=template, model=model_name, mapping_index_path=settings.mapping_index, **kwargs
+        )
+        _configure_engine(ke, **asdict(settings))
 
     if recipes_urls_file:
         with open(recipes_urls_file, "r") as f:
@@ -903,11 +1341,15 @@ def convert(model, template, input, output, output_format, **kwargs):
     # TODO Make SPIRESEngine work without OpenAI, and change the model_source
     # here
     if model_source == "OpenAI":
-        ke = SPIRESEngine(template, **kwargs)
+        ke = SPIRESEngine(template, mapping_index_path=settings.mapping_index, **kwargs)
+        _configure_engine(ke, **asdict(settings))
 
     elif model_source == "GPT4All":
         model_name = selectmodel["alternative_names"][0]
-        ke = GPT4AllEngine(template=template, model=model_name, **kwargs)
+        ke = GPT4AllEngine(
+            template=template, model=model_name, mapping_index_path=settings.mapping_index, **kwargs
+        )
+        _configure_engine(ke, **asdict(settings))
 
     class_def = ke.template_pyclass
     with open(input, "r") as f:
@@ -1086,13 +1528,14 @@ def enrichment(
         gene_set = parse_gene_set(input_file)
     if not gene_set:
         raise ValueError("No genes passed")
-    ke = create_engine(None, EnrichmentEngine, model=model)
+    ke = create_engine(
+        None, EnrichmentEngine, model=model, mapping_index_path=settings.mapping_index
+    )
     if end_marker:
         ke.end_marker = end_marker
     if interactive:
         ke.client.interactive = True
-    if settings.cache_db:
-        ke.client.cache_db_path = settings.cache_db
+    _configure_engine(ke, **asdict(settings))
     if not isinstance(ke, EnrichmentEngine):
         raise ValueError(f"Expected EnrichmentEngine, got {type(ke)}")
     if resolver:
@@ -1624,10 +2067,14 @@ def fill(model, template, object: str, examples, output, output_format,
     # TODO Make SPIRESEngine work without OpenAI, and change the model_source
     # here
     if model_source == "OpenAI":
-        ke = SPIRESEngine(template=template, **kwargs)
+        ke = SPIRESEngine(template=template, mapping_index_path=settings.mapping_index, **kwargs)
+        _configure_engine(ke, **asdict(settings))
     else:
         model_name = selectmodel["alternative_names"][0]
-        ke = GPT4AllEngine(template=template, model=model_name, **kwargs)
+        ke = GPT4AllEngine(
+            template=template, model=model_name, mapping_index_path=settings.mapping_index, **kwargs
+        )
+        _configure_engine(ke, **asdict(settings))
 
     an_object = yaml.safe_load(object)
     logging.info(f"Object to fill =  {object}")
@@ -1671,7 +2118,8 @@ def complete(model, input, output, output_format, show_prompt,
 
     elif model_source == "GPT4All":
         c = set_up_gpt4all_model(modelname=model_name)
-        results = chain_gpt4all_model(model=c, prompt_text=text)
+        results = chain_gpt4all_model(model=c, prompt_text=text,
+                                      cache_db_path=settings.cache_db)
 
     output.write(results)
 
@@ -1682,7 +2130,8 @@ def complete(model, input, output, output_format, show_prompt,
 def parse(template, input):
     """Parse LLM results."""
     logging.info(f"Creating for {template}")
-    ke = SPIRESEngine(template)
+    ke = SPIRESEngine(template, mapping_index_path=settings.mapping_index)
+    _configure_engine(ke, **asdict(settings))
     text = input.read()
     logging.debug(f"Input text: {text}")
     # ke.annotator = BioPortalImplementation()
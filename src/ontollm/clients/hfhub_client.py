@@ -1,12 +1,16 @@
 """HuggingFace Hub Client."""
 import logging
 from dataclasses import dataclass
+from typing import Optional
+
 # TODO: Replace langchain with guidance https://github.com/guidance-ai/guidance
 from langchain import HuggingFaceHub, LLMChain, PromptTemplate
 import numpy as np
 from oaklib.utilities.apikey_manager import get_apikey_value
 from sentence_transformers import SentenceTransformer
 
+from ontollm.utils.completion_cache import DEFAULT_CACHE_DB, get_completion_cache
+
 # Note: See https://huggingface.co/models?pipeline_tag=text-generation&sort=downloads
 # for all relevant models
 
@@ -49,10 +53,22 @@ class HFHubClient:
         return model
 
 
-    def query_hf_model(self, llm, prompt_text):
-        """Interact with a GPT4All model."""
-        logging.info(f"Complete: prompt[{len(prompt_text)}]={prompt_text[0:100]}...")
+    def query_hf_model(self, llm, prompt_text, cache_db_path: Optional[str] = None):
+        """Interact with a HuggingFace Hub model.
 
+        Completions are cached in the sqlite database at cache_db_path
+        (or the default cache database), keyed on the model, prompt and
+        the model's generation parameters.
+        """
+        logging.info(f"Complete: prompt[{len(prompt_text)}]={prompt_text[0:100]}...")
+        cache = get_completion_cache(cache_db_path or DEFAULT_CACHE_DB)
+        model_kwargs = getattr(llm, "model_kwargs", None) or {}
+        return cache.get_or_compute(getattr(llm, "repo_id", None), prompt_text,
+                                    lambda: self._run_hf_chain(llm, prompt_text),
+                                    **model_kwargs)
+
+    def _run_hf_chain(self, llm, prompt_text):
+        """Run a prompt through a LangChain chain over the model."""
         template = """{prompt_text}"""
 
         prompt = PromptTemplate(template=template, input_variables=["prompt_text"])
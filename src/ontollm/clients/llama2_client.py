@@ -1,20 +1,41 @@
 """Llama 2 Client."""
 
+from concurrent.futures import Future
 from dataclasses import dataclass
 import glob
 import logging
 import os
-from pathlib import Path
-import sqlite3
-from typing import Iterator, Tuple
+from queue import Empty, Queue
+import threading
+import time
+import warnings
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 
-from codellama.llama.generation import Llama
+from codellama.llama.generation import B_INST, B_SYS, E_INST, E_SYS, Llama, sample_top_p
 from codellama.llama.tokenizer import Tokenizer
+import torch
 from torch import Tensor, device
 
 import numpy as np
 
+from ontollm.utils.completion_cache import CompletionCache, completion_params, get_completion_cache
+from ontollm.utils.parse_utils import IncrementalDecoder, find_stop_sequence
+
 LLAMA2_MAX_LEN = 16000
+LLAMA2_CACHE_DB = ".llama2_cache.db"
+
+# Parameters of the completions stored by earlier versions of the client,
+# in a legacy table keyed by prompt alone; only read for these
+LLAMA2_LEGACY_COMPLETE_PARAMS = dict(max_gen_len=LLAMA2_MAX_LEN, temperature=0.6, top_p=0.9,
+                                     stop=None)
+LLAMA2_LEGACY_CHAT_PARAMS = dict(max_gen_len=LLAMA2_MAX_LEN, temperature=0.2, top_p=0.9)
+
+# How long the micro-batching queue waits for further concurrent
+# complete() calls before dispatching what it has collected.
+LLAMA2_BATCH_WAIT_MS = 5.0
+
+SAMPLING_PARAMS = Tuple[int, float, float, Tuple[str, ...]]
+STOP_CONDITION = Callable[[str], bool]
 
 # This module is for interacting directly with a self-hosted Llama 2 model,
 # together with a sentence embedding model.
@@ -24,6 +45,92 @@ LLAMA2_MAX_LEN = 16000
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class _PendingCompletion:
+    """A completion request waiting in the micro-batching queue."""
+
+    prompt: str
+    params: SAMPLING_PARAMS
+    future: Future
+    stop_condition: Optional[STOP_CONDITION] = None
+
+
+class _MicroBatcher:
+    """Collects concurrent completion requests and dispatches them as batches.
+
+    Requests arriving within `wait_ms` of each other (up to `max_batch_size`)
+    are grouped by sampling parameters and handed to `dispatch` together, so
+    that concurrent callers share a single forward pass.
+    """
+
+    def __init__(self, dispatch: Callable[..., List[str]],
+                 max_batch_size: int, wait_ms: float):
+        self.dispatch = dispatch
+        self.max_batch_size = max_batch_size
+        self.wait_ms = wait_ms
+        self._queue: Queue = Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, prompt: str, max_gen_len: int,
+               temperature: float, top_p: float,
+               stop: Optional[List[str]] = None,
+               stop_condition: Optional[STOP_CONDITION] = None) -> str:
+        """Queue a prompt and block until its completion is available."""
+        pending = _PendingCompletion(prompt=prompt,
+                                     params=(max_gen_len, temperature, top_p,
+                                             tuple(stop or ())),
+                                     future=Future(),
+                                     stop_condition=stop_condition)
+        self._ensure_worker()
+        self._queue.put(pending)
+        return pending.future.result()
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run,
+                                                name="llama2-micro-batcher",
+                                                daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.wait_ms / 1000
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except Empty:
+                    break
+            self._flush(batch)
+
+    def _flush(self, batch: List[_PendingCompletion]):
+        groups: Dict[SAMPLING_PARAMS, List[_PendingCompletion]] = {}
+        for pending in batch:
+            groups.setdefault(pending.params, []).append(pending)
+        for params, pendings in groups.items():
+            max_gen_len, temperature, top_p, stop = params
+            logger.info(f"Dispatching micro-batch of {len(pendings)} prompts")
+            try:
+                payloads = self.dispatch([p.prompt for p in pendings],
+                                         max_gen_len=max_gen_len,
+                                         temperature=temperature,
+                                         top_p=top_p,
+                                         stop=list(stop),
+                                         stop_conditions=[p.stop_condition
+                                                          for p in pendings])
+            except Exception as e:
+                for pending in pendings:
+                    pending.future.set_exception(e)
+                continue
+            for pending, payload in zip(pendings, payloads):
+                pending.future.set_result(payload)
+
+
 @dataclass
 class Llama2Client:
     """A client for interacting with self-hosted Llama 2."""
@@ -31,14 +138,21 @@ class Llama2Client:
         """Please make sure you have cloned the llama repository, run
         download.sh, and downloaded some models, after having received
         the download email from Meta AI."""
-    cache_db_path_str: str = None
+    cache_db_path: str = None
 
     def __init__(self, checkpoint_dir_path: str, tokenizer_path: str,
-                 max_seq_len : int = 512, max_batch_size : int = 8):
+                 max_seq_len : int = 512, max_batch_size : int = 8,
+                 batch_wait_ms: float = LLAMA2_BATCH_WAIT_MS):
+        """Load a Llama 2 model.
+
+        :param batch_wait_ms: how long complete() waits to collect concurrent
+            calls into one batch; if 0 or None, each call is dispatched alone.
+        """
         self.checkpoint_dir_path = checkpoint_dir_path
         self.tokenizer_filepath = tokenizer_path
         self.max_seq_len = max_seq_len
         self.max_batch_size = max_batch_size
+        self.batch_wait_ms = batch_wait_ms
         if not os.path.exists(self.tokenizer_filepath):
             raise ValueError(
                 f"Didn't find {self.tokenizer_filepath}.\n"
@@ -53,126 +167,395 @@ class Llama2Client:
             max_seq_len=self.max_seq_len,
             max_batch_size=self.max_batch_size)
         self.model_name = os.path.basename(checkpoint_dir_path)
+        # Generation keeps per-call state in the model, so only one
+        # generation may run at a time
+        self.model_lock = threading.RLock()
+        self.batcher = None
+        if self.batch_wait_ms and self.max_batch_size > 1:
+            self.batcher = _MicroBatcher(self._generate_batch,
+                                         max_batch_size=self.max_batch_size,
+                                         wait_ms=self.batch_wait_ms)
+
+    @property
+    def cache(self) -> CompletionCache:
+        """The completion cache shared by all clients using the same database."""
+        if not self.cache_db_path:
+            self.cache_db_path = LLAMA2_CACHE_DB
+        return get_completion_cache(self.cache_db_path)
+
+    @property
+    def cache_db_path_str(self) -> str:
+        """Deprecated alias of cache_db_path."""
+        warnings.warn("cache_db_path_str is deprecated; use cache_db_path",
+                      DeprecationWarning, stacklevel=2)
+        return self.cache_db_path
+
+    @cache_db_path_str.setter
+    def cache_db_path_str(self, path: str) -> None:
+        warnings.warn("cache_db_path_str is deprecated; use cache_db_path",
+                      DeprecationWarning, stacklevel=2)
+        self.cache_db_path = path
+
+    @staticmethod
+    def _legacy(params: dict, stop_condition: Optional[STOP_CONDITION]) -> bool:
+        """Whether completions with these parameters may be read from the legacy cache table."""
+        return stop_condition is None and params == LLAMA2_LEGACY_COMPLETE_PARAMS
+
+    def _generate_batch(self, prompts: List[str],
+                        max_gen_len: int = LLAMA2_MAX_LEN,
+                        temperature: float = 0.6,
+                        top_p: float = 0.9,
+                        stop: Optional[List[str]] = None,
+                        stop_conditions: Optional[List[Optional[STOP_CONDITION]]] = None
+                        ) -> List[str]:
+        """Run text completion on prompts, at most max_batch_size at a time.
+
+        Returns one payload per prompt, in order; prompts in a failed
+        batch get an empty payload.
+        If stop sequences or stop conditions are given, generation of each
+        prompt halts as soon as one is met.
+        """
+        if stop_conditions is None:
+            stop_conditions = [None] * len(prompts)
+        payloads = []
+        for start in range(0, len(prompts), self.max_batch_size):
+            batch = prompts[start:start + self.max_batch_size]
+            batch_conditions = stop_conditions[start:start + self.max_batch_size]
+            try:
+                if stop or any(batch_conditions):
+                    prompt_tokens = [self.llama.tokenizer.encode(x, bos=True, eos=False)
+                                     for x in batch]
+                    payloads.extend(self._generate_until_stop(
+                        prompt_tokens,
+                        max_gen_len=max_gen_len,
+                        temperature=temperature,
+                        top_p=top_p,
+                        stop=stop,
+                        stop_conditions=batch_conditions,
+                    ))
+                    continue
+                with self.model_lock:
+                    responses = self.llama.text_completion(
+                        batch,
+                        max_gen_len=max_gen_len,
+                        temperature=temperature,
+                        top_p=top_p,
+                    )
+            except ValueError as e:
+                logging.error(e)
+                responses = []
+            if len(responses) == len(batch):
+                payloads.extend(r['generation'] for r in responses)
+            else:
+                payloads.extend("" for _ in batch)
+        return payloads
+
+    @torch.inference_mode()
+    def _generate_until_stop(self, prompt_tokens: List[List[int]],
+                             max_gen_len: int = LLAMA2_MAX_LEN,
+                             temperature: float = 0.6,
+                             top_p: float = 0.9,
+                             stop: Optional[List[str]] = None,
+                             stop_conditions: Optional[List[Optional[STOP_CONDITION]]] = None,
+                             on_text: Optional[Callable[[int, str], None]] = None
+                             ) -> List[str]:
+        """Generate from tokenized prompts, checking for stops token by token.
 
-    def db_cursor(self):
-        if not self.cache_db_path_str:
-            self.cache_db_path_str = ".llama2_cache.db"
-        cache_db_path = Path(self.cache_db_path_str)
-        logger.info(f"Caching Llama 2 responses to {cache_db_path.absolute()}")
-        should_create = not cache_db_path.exists()
-        connection = sqlite3.connect(self.cache_db_path_str)
-        cur = connection.cursor()
-        if should_create:
-            cur.execute("CREATE TABLE cache (user_prompt, system_prompt, payload)")
-        return cur
+        This follows Llama.generate, but after each token the text generated
+        so far for each prompt is checked against the stop sequences and its
+        stop condition; a prompt that has stopped no longer holds up the batch.
+
+        :param prompt_tokens: one token list per prompt, at most max_batch_size
+        :param stop: stop sequences; the payload is truncated before them
+        :param stop_conditions: optional predicate per prompt over the text
+            generated so far; generation stops once it returns True
+        :param on_text: called with the prompt index and each newly
+            generated piece of text, as it is generated
+        :return: one payload per prompt
+        """
+        with self.model_lock:
+            return self._generate_until_stop_locked(prompt_tokens, max_gen_len, temperature,
+                                                    top_p, stop, stop_conditions, on_text)
+
+    def _generate_until_stop_locked(self, prompt_tokens, max_gen_len, temperature, top_p,
+                                    stop, stop_conditions, on_text) -> List[str]:
+        llama = self.llama
+        tokenizer = llama.tokenizer
+        params = llama.model.params
+        bsz = len(prompt_tokens)
+        if stop_conditions is None:
+            stop_conditions = [None] * bsz
+        min_prompt_len = min(len(t) for t in prompt_tokens)
+        max_prompt_len = max(len(t) for t in prompt_tokens)
+        if max_prompt_len > params.max_seq_len:
+            raise ValueError(f"Prompt of {max_prompt_len} tokens exceeds {params.max_seq_len}")
+        total_len = min(params.max_seq_len, max_gen_len + max_prompt_len)
+        model_device = next(llama.model.parameters()).device
+        pad_id = tokenizer.pad_id
+        tokens = torch.full((bsz, total_len), pad_id, dtype=torch.long, device=model_device)
+        for k, t in enumerate(prompt_tokens):
+            tokens[k, : len(t)] = torch.tensor(t, dtype=torch.long, device=model_device)
+        input_text_mask = tokens != pad_id
+        payloads: List[Optional[str]] = [None] * bsz
+        decoders = [IncrementalDecoder(tokenizer.decode) for _ in range(bsz)]
+        emitted = [0] * bsz
+        lookback = max([len(s) for s in stop or []] + [0])
+        prev_pos = 0
+        for cur_pos in range(min_prompt_len, total_len):
+            logits = llama.model.forward(tokens[:, prev_pos:cur_pos], prev_pos)
+            if temperature > 0:
+                probs = torch.softmax(logits[:, -1] / temperature, dim=-1)
+                next_token = sample_top_p(probs, top_p)
+            else:
+                next_token = torch.argmax(logits[:, -1], dim=-1)
+            next_token = next_token.reshape(-1)
+            next_token = torch.where(input_text_mask[:, cur_pos], tokens[:, cur_pos], next_token)
+            tokens[:, cur_pos] = next_token
+            prev_pos = cur_pos
+            step_tokens = next_token.tolist()
+            for k in range(bsz):
+                if payloads[k] is not None or cur_pos < len(prompt_tokens[k]):
+                    continue
+                decoder = decoders[k]
+                if step_tokens[k] == tokenizer.eos_id:
+                    decoder.flush()
+                    payloads[k] = decoder.text
+                    continue
+                # only the end of the text can contain a new stop sequence
+                start = max(0, len(decoder.text) - lookback)
+                if not decoder.push(step_tokens[k]):
+                    continue
+                text = decoder.text
+                pos = find_stop_sequence(text[start:], stop)
+                if pos is not None:
+                    payloads[k] = text[: start + pos]
+                elif stop_conditions[k] is not None and stop_conditions[k](text):
+                    payloads[k] = text
+                if on_text is not None:
+                    # hold back a possible partial stop sequence until it is resolved
+                    visible = payloads[k] if payloads[k] is not None else text
+                    if payloads[k] is None and stop:
+                        visible = text[: max(emitted[k], len(text) - lookback)]
+                    if len(visible) > emitted[k]:
+                        on_text(k, visible[emitted[k]:])
+                        emitted[k] = len(visible)
+            if all(p is not None for p in payloads):
+                break
+        for k in range(bsz):
+            if payloads[k] is None:
+                decoders[k].flush()
+                payloads[k] = decoders[k].text
+            if on_text is not None and len(payloads[k]) > emitted[k]:
+                on_text(k, payloads[k][emitted[k]:])
+        logger.info(f"Generated {bsz} payloads, stopping after {prev_pos + 1} tokens")
+        return payloads  # type: ignore
 
     def complete(self, prompt : str,
                  show_prompt : bool = False,
                  max_gen_len: int = LLAMA2_MAX_LEN,
                  temperature: float = 0.6,
-                 top_p: float = 0.9):
-        """Complete text using a Llama 2 model."""
+                 top_p: float = 0.9,
+                 stop: Optional[List[str]] = None,
+                 stop_condition: Optional[STOP_CONDITION] = None):
+        """Complete text using a Llama 2 model.
+
+        Concurrent calls are collected by the micro-batching queue and
+        sent to the model together.
+
+        :param stop: stop sequences; generation halts at the first one,
+            which is not included in the payload
+        :param stop_condition: predicate over the text generated so far;
+            generation halts once it returns True. The completion is cached
+            under the condition's `cache_key`, and not at all without one
+        """
         logger.info(f"Complete: prompt[{len(prompt)}]={prompt[0:256]}...")
         if show_prompt:
             logger.info(f" SENDING PROMPT\n{prompt}")
-        cur = self.db_cursor()
-        cached = cur.execute("SELECT payload FROM cache WHERE user_prompt=:prompt",
-                             {"prompt" : prompt})
-        payload = cached.fetchone()
-        if payload:
-            prompt_peek = str(prompt)[0:80].replace("\n", "\\n")
-            logger.info(f"Using cached payload for prompt: {prompt_peek}...")
-            return payload[0]
-        try:
-            responses = self.llama.text_completion(
-                [prompt],
-                max_gen_len=max_gen_len,
-                temperature=temperature,
-                top_p=top_p,
-            )
-        except ValueError as e:
-            logging.error(e)
-            responses = []
+        params = dict(max_gen_len=max_gen_len, temperature=temperature, top_p=top_p,
+                      stop=stop)
+        cache = self.cache
+        cache_params = completion_params(stop_condition, **params)
+        if cache_params is not None:
+            payload = cache.lookup(self.model_name, prompt,
+                                   read_legacy=self._legacy(params, stop_condition),
+                                   **cache_params)
+            if payload is not None:
+                return payload
+        if self.batcher:
+            payload = self.batcher.submit(prompt, stop_condition=stop_condition, **params)
+        else:
+            payload = self._generate_batch([prompt], stop_conditions=[stop_condition],
+                                           **params)[0]
+        if payload and cache_params is not None:
+            cache.store(self.model_name, prompt, payload, **cache_params)
+        return payload
 
-        if len(responses) > 0:
-            payload = responses[0]['generation']
-            logger.info(f"Storing paylod of len: {len(payload)}")
-            cur.execute("INSERT INTO cache (user_prompt, system_prompt, payload) VALUES (:user_prompt, NULL, :payload)",
-                        {"user_prompt": prompt, "payload": payload})
-            cur.connection.commit()
-            return payload
+    def complete_batch(self, prompts: List[str],
+                       show_prompt : bool = False,
+                       max_gen_len: int = LLAMA2_MAX_LEN,
+                       temperature: float = 0.6,
+                       top_p: float = 0.9,
+                       stop: Optional[List[str]] = None,
+                       stop_conditions: Optional[List[Optional[STOP_CONDITION]]] = None
+                       ) -> List[str]:
+        """Complete a list of prompts using a Llama 2 model.
 
-        return ""
+        The cache is consulted per prompt; the remaining distinct prompts
+        are sent to the model in batches of up to max_batch_size.
+
+        :param prompts: prompts to complete
+        :param stop_conditions: optional stop condition per prompt; for
+            repeated prompts, the first one is used
+        :return: one payload per prompt, in the same order
+        """
+        logger.info(f"Complete batch of {len(prompts)} prompts")
+        if show_prompt:
+            for prompt in prompts:
+                logger.info(f" SENDING PROMPT\n{prompt}")
+        params = dict(max_gen_len=max_gen_len, temperature=temperature, top_p=top_p,
+                      stop=stop)
+        cache = self.cache
+        conditions: Dict[str, Optional[STOP_CONDITION]] = {}
+        for prompt, condition in zip(prompts, stop_conditions or [None] * len(prompts)):
+            conditions.setdefault(prompt, condition)
+        payloads: Dict[str, str] = {}
+        misses = []
+        for prompt, condition in conditions.items():
+            cache_params = completion_params(condition, **params)
+            payload = None
+            if cache_params is not None:
+                payload = cache.lookup(self.model_name, prompt,
+                                       read_legacy=self._legacy(params, condition),
+                                       **cache_params)
+            if payload is None:
+                misses.append(prompt)
+            else:
+                payloads[prompt] = payload
+        if misses:
+            generated = self._generate_batch(misses,
+                                             stop_conditions=[conditions[p] for p in misses],
+                                             **params)
+            for prompt, payload in zip(misses, generated):
+                payloads[prompt] = payload
+                cache_params = completion_params(conditions[prompt], **params)
+                if payload and cache_params is not None:
+                    cache.store(self.model_name, prompt, payload, **cache_params)
+        return [payloads[prompt] for prompt in prompts]
+
+    def complete_stream(self, prompt : str,
+                        show_prompt : bool = False,
+                        max_gen_len: int = LLAMA2_MAX_LEN,
+                        temperature: float = 0.6,
+                        top_p: float = 0.9,
+                        stop: Optional[List[str]] = None,
+                        stop_condition: Optional[STOP_CONDITION] = None) -> Iterator[str]:
+        """Complete text using a Llama 2 model, yielding text as it is generated.
+
+        The concatenation of the yielded pieces equals what complete() would
+        return. A cached payload is yielded in one piece; a generated one is
+        stored in the cache once generation finishes.
+        """
+        logger.info(f"Complete (streaming): prompt[{len(prompt)}]={prompt[0:256]}...")
+        if show_prompt:
+            logger.info(f" SENDING PROMPT\n{prompt}")
+        params = dict(max_gen_len=max_gen_len, temperature=temperature, top_p=top_p,
+                      stop=stop)
+        cache = self.cache
+        cache_params = completion_params(stop_condition, **params)
+        if cache_params is not None:
+            payload = cache.lookup(self.model_name, prompt,
+                                   read_legacy=self._legacy(params, stop_condition),
+                                   **cache_params)
+            if payload is not None:
+                yield payload
+                return
+        pieces: Queue = Queue()
+        done = object()
+        result: Dict[str, str] = {}
+
+        def _generate():
+            try:
+                prompt_tokens = [self.llama.tokenizer.encode(prompt, bos=True, eos=False)]
+                result["payload"] = self._generate_until_stop(
+                    prompt_tokens,
+                    stop_conditions=[stop_condition],
+                    on_text=lambda _, piece: pieces.put(piece),
+                    **params)[0]
+            except ValueError as e:
+                logging.error(e)
+                result["payload"] = ""
+            finally:
+                pieces.put(done)
+
+        threading.Thread(target=_generate, name="llama2-stream", daemon=True).start()
+        while True:
+            piece = pieces.get()
+            if piece is done:
+                break
+            yield piece
+        payload = result.get("payload", "")
+        if payload and cache_params is not None:
+            cache.store(self.model_name, prompt, payload, **cache_params)
 
     def chat_completion(self, user_prompt: str, system_prompt: str = None,
                         show_prompt : bool = False,
                         max_gen_len: int = LLAMA2_MAX_LEN,
                         temperature: float = 0.2,
-                        top_p: float = 0.9):
-        """Chat to a Llama 2 model."""
+                        top_p: float = 0.9,
+                        stop: Optional[List[str]] = None):
+        """Chat to a Llama 2 model.
+
+        :param stop: stop sequences; generation halts at the first one,
+            which is not included in the payload
+        """
         if system_prompt is not None:
-            logger.info(f"Chat system: prompt[{len(prompt)}]={system_prompt[0:256]}...")
-        logger.info(f"Chat user: prompt[{len(prompt)}]={user_prompt[0:256]}...")
+            logger.info(f"Chat system: prompt[{len(system_prompt)}]={system_prompt[0:256]}...")
+        logger.info(f"Chat user: prompt[{len(user_prompt)}]={user_prompt[0:256]}...")
         if show_prompt:
             logger.info(f" SENDING SYSTEM PROMPT\n{system_prompt}")
             logger.info(f" SENDING USER PROMPT\n{user_prompt}")
-        cur = self.db_cursor()
+        params = dict(max_gen_len=max_gen_len, temperature=temperature, top_p=top_p)
+        cache = self.cache
+        payload = cache.lookup(self.model_name, user_prompt, system_prompt, chat=True,
+                               read_legacy=(params == LLAMA2_LEGACY_CHAT_PARAMS and not stop),
+                               stop=stop, **params)
+        if payload is not None:
+            return payload
         if system_prompt is None:
-            cached = cur.execute("SELECT payload FROM cache WHERE user_prompt=:user__prompt AND system_prompt IS NULL",
-                                 {"user_prompt" : user_prompt})
+            dialog = [{"role": "user", "content": user_prompt}]
         else:
-            cached = cur.execute("SELECT payload FROM cache WHERE user_prompt=:user_prompt AND system_prompt=:system_prompt",
-                                 {"user_prompt" : user_prompt,
-                                  "system_prompt": system_prompt})
-        payload = cached.fetchone()
-        if payload:
-            prompt_peek = str(prompt)[0:80].replace("\n", "\\n")
-            logger.info(f"Using cached payload for prompt: {prompt_peek}...")
-            return payload[0]
+            dialog = [{"role": "system", "content": system_prompt},
+                      {"role": "user", "content": user_prompt}]
         try:
-            if system_prompt is None:
-                responses = self.llama.chat_completion(
-                    [{"role": "user", "content": user_prompt}],
-                    max_gen_len=max_gen_len,
-                    temperature=temperature,
-                    top_p=top_p,
-                )
+            if stop:
+                # Same dialog encoding as Llama.chat_completion for a single turn
+                content = user_prompt.strip()
+                if system_prompt is not None:
+                    content = B_SYS + system_prompt + E_SYS + user_prompt
+                dialog_tokens = self.llama.tokenizer.encode(
+                    f"{B_INST} {content.strip()} {E_INST}", bos=True, eos=False)
+                payloads = self._generate_until_stop([dialog_tokens], stop=stop, **params)
+                responses = [{"generation": {"role": "assistant",
+                                             "content": payloads[0].strip()}}]
             else:
-                responses = self.llama.chat_completion(
-                    [{"role": "system", "content": system_prompt},
-                     {"role": "user", "content": user_prompt}],
-                    max_gen_len=max_gen_len,
-                    temperature=temperature,
-                    top_p=top_p,
-                )
+                with self.model_lock:
+                    responses = self.llama.chat_completion([dialog], **params)
         except ValueError as e:
             logging.error(e)
             responses = []
 
         if len(responses) > 0:
-            payload = responses[0]['generation']
-            logger.info(f"Storing paylod of len: {len(payload)}")
-            cur.execute("INSERT INTO cache (user_prompt, system_prompt, payload) VALUES (:user_prompt, :system_prompt, :payload)",
-                        {"user_prompt": user_prompt,
-                         "system_prompt": system_prompt,
-                         "payload": payload})
-            cur.connection.commit()
+            payload = responses[0]['generation']['content']
+            cache.store(self.model_name, user_prompt, payload, system_prompt, chat=True,
+                        stop=stop, **params)
             return payload
 
         return ""
 
     def cached_completions(
-            self, search_term: str = None) -> Iterator[Tuple[str, str]]:
-        if search_term:
-            search_term = search_term.lower()
-        cur = self.db_cursor()
-        responses = cur.execute("SELECT user_prompt, payload, system_prompt FROM cache")
-        for row in respones:
-            if (search_term
-                    and search_term not in row[0].lower()
-                    and search_term not in row[1].lower()):
-                continue
-            yield row
+            self, search_term: str = None) -> Iterator[Tuple[str, str, str]]:
+        """Yield (model, prompt, completion) for cached completions."""
+        yield from self.cache.entries(search_term)
 
     def get_tokenizer(self, model=""):
         return self.llama.tokenizer
@@ -1,26 +1,48 @@
 """Pubmed Client."""
 import logging
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Generator, List, Tuple, Union
+from typing import Any, Callable, Dict, Generator, List, Optional, Tuple, Union
 from urllib import parse
 
 import inflection
 import requests
 from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
 # TODO: Instead of querying the PubMed endpoint, use a self-hosted database of
 # some subset of PubMed 
 from oaklib.utilities.apikey_manager import get_apikey_value
 
+from ontollm.utils.chunking import chunk_sentences
+from ontollm.utils.rate_limiter import RateLimiter
+
 PMID = str
 TITLE_WEIGHT = 5
 MAX_PMIDS = 50
-RETRY_MAX = 2
+MAX_SEARCH_RESULTS = 9999
+
+# Times a request is retried after a connection error, 429 or 5xx response,
+# waiting RETRY_BACKOFF seconds, then twice as long each time
+RETRY_MAX = 3
+RETRY_BACKOFF = 1.0
+
+# Seconds to wait for a response
+TIMEOUT = 60
+
+# Requests per second allowed by NCBI, without and with an API key
+NCBI_RATE = 3
+NCBI_RATE_WITH_KEY = 10
 
 PUBMED = "pubmed"
 EUTILS_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/"
 
 
+_rate_limiters: Dict[Tuple[str, float], RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
 def _normalize(s: str) -> str:
     return inflection.singularize(s).lower()
 
@@ -79,6 +101,10 @@ class PubmedClient:
     """A client for the Pubmed API.
 
     This class is a wrapper around the Entrez API.
+
+    Requests go through one pooled HTTP session per client, and are limited
+    to the rate NCBI allows, across all clients in the process. Independent
+    batches are fetched concurrently, within that limit.
     """
 
     # TODO: this doesn't need to be hardcoded
@@ -97,82 +123,147 @@ class PubmedClient:
         ncbi_key = None
         logging.info("NCBI API key not found. Will use no key.")
 
+    eutils_url: str = EUTILS_URL
+    """Base URL of the E-utilities, e.g. of a local stand-in server in tests"""
+
+    requests_per_second: Optional[float] = None
+    """Maximum rate of requests. If None, the NCBI limit:
+    10 per second with an API key, otherwise 3."""
+
+    max_workers: int = 4
+    """Maximum number of requests made concurrently, within the rate limit"""
+
+    def _credentials(self) -> Dict[str, str]:
+        if self.email and self.ncbi_key:
+            return {"email": self.email, "api_key": self.ncbi_key}
+        return {}
+
+    def session(self) -> requests.Session:
+        """Get the HTTP session of this client, keeping connections open between requests."""
+        session = self.__dict__.get("_session")
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, self.max_workers))
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session = self.__dict__.setdefault("_session", session)
+        return session
+
+    def rate_limiter(self) -> RateLimiter:
+        """Get the rate limiter shared by all clients of the same service and key."""
+        rate = self.requests_per_second
+        if rate is None:
+            rate = NCBI_RATE_WITH_KEY if self._credentials() else NCBI_RATE
+        with _rate_limiters_lock:
+            key = (self.eutils_url, rate)
+            if key not in _rate_limiters:
+                _rate_limiters[key] = RateLimiter(rate)
+            return _rate_limiters[key]
+
+    def _request(self, endpoint: str, params: Dict[str, Any]) -> Optional[requests.Response]:
+        """
+        Make a request to an E-utility, retrying on failure with exponential backoff.
+
+        Connection errors, rate limiting (429) and server errors (5xx) are
+        retried up to RETRY_MAX times; other responses are returned as they are.
+
+        :param endpoint: name of the E-utility, e.g. efetch.fcgi
+        :param params: query parameters; credentials are added if configured
+        :return: the last response, or None if no response was received
+        """
+        url = self.eutils_url + endpoint
+        # We are explicit with the delimiters in this query,
+        # no percent encoding allowed. This mostly just makes it more human readable
+        query = parse.urlencode({**params, **self._credentials()}, safe=",")
+        response = None
+        for attempt in range(RETRY_MAX + 1):
+            if attempt:
+                delay = RETRY_BACKOFF * 2 ** (attempt - 1)
+                retry_after = response.headers.get("Retry-After") if response is not None else None
+                if retry_after and retry_after.isdigit():
+                    delay = max(delay, float(retry_after))
+                logging.info(f"Trying {endpoint} again in {delay:.1f}s...")
+                time.sleep(delay)
+            self.rate_limiter().acquire()
+            try:
+                response = self.session().get(url, params=query, timeout=TIMEOUT)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                logging.error(f"Encountered error in requesting {endpoint}: {e}")
+                response = None
+                continue
+            if response.status_code == 429:
+                logging.error("Too many requests to NCBI API. Try again later, or use API key.")
+            elif response.status_code >= 500:
+                logging.error(f"Encountered error in requesting {endpoint}: {response.status_code}")
+            else:
+                return response
+        status = response.status_code if response is not None else "no response"
+        logging.info(f"Giving up on {endpoint} - last status code {status}")
+        return response
+
+    def _map(self, function: Callable, items: List) -> List:
+        """Apply a function making requests to items concurrently, keeping their order."""
+        if len(items) <= 1 or self.max_workers <= 1:
+            return [function(item) for item in items]
+        with ThreadPoolExecutor(
+            max_workers=min(self.max_workers, len(items)), thread_name_prefix="pubmed"
+        ) as executor:
+            return list(executor.map(function, items))
+
     def get_pmids(self, term: str) -> List[str]:
         """Search PubMed and retrieve a list of PMIDs matching the search term.
 
         :param term: The search term to query PubMed.
         :return: A list of PMIDs matching the search term.
         """
-        pmids = []
-
         batch_size = 5000
 
-        search_url = EUTILS_URL + "esearch.fcgi"
-
         logging.info(f"Finding count of PMIDs matching search term {term}...")
         # If retmax==0, we get only the size of the search result in count of PMIDs
-        if self.email and self.ncbi_key:
-            params = {
-                "db": PUBMED,
-                "term": term,
-                "retmode": "json",
-                "retmax": 0,
-                "email": self.email,
-                "api_key": self.ncbi_key,
-            }
-        else:
-            params = {"db": PUBMED, "term": term, "retmode": "json", "retmax": 0}
-
-        # We are explicit with the delimiters in this query,
-        # no percent encoding allowed. This mostly just makes it more human readable
-        response = requests.get(search_url, params=parse.urlencode(params, safe=","))
-
-        if response.status_code == 200:
-            data = response.json()
-            resultcount = int(data["esearchresult"]["count"])
-            logging.info(f"Search returned {resultcount} PMIDs matching search term {term}")
-        elif response.status_code == 429:
-            logging.error("Too many requests to NCBI API. Try again later, or use API key.")
-        else:
-            logging.error("Encountered error in searching PubMed:", response.status_code)
-
-        if resultcount > 9999:
+        params = {"db": PUBMED, "term": term, "retmode": "json", "retmax": 0}
+        response = self._request("esearch.fcgi", params)
+        if response is None or response.status_code != 200:
+            status = response.status_code if response is not None else "no response"
+            logging.error(f"Encountered error in searching PubMed: {status}")
+            return []
+        resultcount = int(response.json()["esearchresult"]["count"])
+        logging.info(f"Search returned {resultcount} PMIDs matching search term {term}")
+
+        if resultcount > MAX_SEARCH_RESULTS:
             logging.warning("PubMed limits search results to 9999 records.")
-        resultcount = 9999
-
-        # Now we get the list of PMIDs, iterating as needed
+            resultcount = MAX_SEARCH_RESULTS
+
+        def _search_batch(retstart: int) -> List[str]:
+            response = self._request(
+                "esearch.fcgi", {**params, "retstart": retstart, "retmax": batch_size}
+            )
+            if response is None or response.status_code != 200:
+                return []
+            data = response.json(strict=False)
+            try:
+                return data["esearchresult"]["idlist"]
+            except KeyError:  # Likely an error message.
+                errortext = data["esearchresult"]["ERROR"]
+                logging.error(f"Response: {errortext}")
+                return []
+
+        # Now we get the list of PMIDs, in batches
         logging.info(f"Retrieving PMIDs matching search term {term}...")
-        for retstart in range(0, resultcount, batch_size):
-            params["retstart"] = retstart
-            params["retmax"] = batch_size
-
-            response = requests.get(search_url, params=parse.urlencode(params, safe=","))
-
-            trying = True
-            try_count = 0
-            while trying:
-                if response.status_code == 200:
-                    data = response.json(strict=False)
-                    try:
-                        these_ids = data["esearchresult"]["idlist"]
-                        pmids.extend(these_ids)
-                    except KeyError:  # Likely an error message.
-                        errortext = data["esearchresult"]["ERROR"]
-                        logging.error(f"Response: {errortext}")
-                    trying = False
-                else:
-                    logging.error(f"Encountered error in searching PubMed: {response.status_code}")
-                    try_count = try_count + 1
-                    if try_count < RETRY_MAX:
-                        logging.info("Trying again...")
-                        time.sleep(1)
-                    else:
-                        logging.info(f"Giving up - last status code {response.status_code}")
-                        trying = False
+        batches = self._map(_search_batch, list(range(0, resultcount, batch_size)))
+        pmids = [pmid for batch in batches for pmid in batch]
         logging.info("Retrieved all PMIDs.")
 
         return pmids
 
+    def _fetch(self, ids: List[PMID]) -> str:
+        """Fetch the XML of a batch of entries."""
+        params = {"db": PUBMED, "id": ",".join(ids), "rettype": "xml", "retmode": "xml"}
+        response = self._request("efetch.fcgi", params)
+        if response is None or response.status_code != 200:
+            logging.error(f"Could not fetch {len(ids)} entries starting with {ids[0]}")
+            return ""
+        return response.text
+
     def text(
         self, ids: Union[List[PMID], PMID], raw=False, autoformat=True, pubmedcental=False
     ) -> Union[List[str], str]:
@@ -196,140 +287,12 @@ class PubmedClient:
         clean_ids = clean_pmids(ids)
         ids = clean_ids
 
-        # this will store the document data
-        xml_data = ""
-
-        # Check if we have enough IDs to require epost
-        # This is stated as being 10000
-        # But in practice, the API won't even accept more than ~2500
-        # chars worth of IDs, or about 280 to 320 PMIDs.
-        # So instead, we iterate.
-        use_post = False
-        if len(ids) > 275:
-            use_post = True
-
-        fetch_url = EUTILS_URL + "efetch.fcgi"
-
-        if not use_post:
-            if self.email and self.ncbi_key:
-                params = {
-                    "db": PUBMED,
-                    "id": ",".join(ids),
-                    "rettype": "xml",
-                    "retmode": "xml",
-                    "email": self.email,
-                    "api_key": self.ncbi_key,
-                }
-            else:
-                params = {"db": PUBMED, "id": ",".join(ids), "rettype": "xml", "retmode": "xml"}
-
-            for retstart in range(0, len(ids), batch_size):
-                params["retstart"] = retstart
-                params["retmax"] = batch_size
-
-                response = requests.get(fetch_url, params=parse.urlencode(params, safe=","))
-
-                trying = True
-                try_count = 0
-                while trying:
-                    if response.status_code == 200:
-                        xml_data = xml_data + "\n" + response.text
-                        trying = False
-                    else:
-                        logging.error(
-                            f"Encountered error in fetching from PubMed: {response.status_code}"
-                        )
-                        try_count = try_count + 1
-                        if try_count < RETRY_MAX:
-                            logging.info("Trying again...")
-                            time.sleep(1)
-                        else:
-                            logging.info(f"Giving up - last status code {response.status_code}")
-                            trying = False
-            logging.info("Retrieved document data.")
-
-        else:
-            # Do post request first, iterating as needed
-            post_url = EUTILS_URL + "epost.fcgi"
-            if self.email and self.ncbi_key:
-                params = {
-                    "db": PUBMED,
-                    "id": "",
-                    "email": self.email,
-                    "api_key": self.ncbi_key,
-                    "WebEnv": "",
-                }
-            else:
-                params = {"db": PUBMED, "id": ",".join(ids), "WebEnv": ""}
-
-            query_keys = []
-
-            # Need to batch the IDs manually for this endpoint
-            id_batches = [ids[pmid : pmid + batch_size] for pmid in range(0, len(ids), batch_size)]
-
-            for batch in id_batches:
-                params["id"] = ",".join(batch)
-
-                response = requests.post(post_url, params=parse.urlencode(params, safe=","))
-
-                # Get a webenv the first time, then reuse on subsequent requests
-                # import pdb; pdb.set_trace()
-                if params["WebEnv"] == "":
-                    webenv = response.text.split("<WebEnv>")[1].split("</WebEnv>")[0]
-                    params["WebEnv"] = webenv
-                querykey = response.text.split("<QueryKey>")[1].split("</QueryKey>")[0]
-                query_keys.append(querykey)
-
-                trying = True
-                try_count = 0
-                while trying:
-                    if response.status_code == 200:
-                        trying = False
-                    else:
-                        logging.error(
-                            f"Encountered error in posting IDs to PubMed: {response.status_code}"
-                        )
-                        try_count = try_count + 1
-                        if try_count < RETRY_MAX:
-                            logging.info("Trying again...")
-                            time.sleep(0.5)
-                        else:
-                            logging.info(f"Giving up - last status code {response.status_code}")
-                            trying = False
-            logging.info(f"Posted PMIDs to WebEnv:{webenv}.")
-
-            # Now do the fetch
-            params = {
-                "db": PUBMED,
-                "query_key": "",
-                "WebEnv": webenv,
-                "rettype": "xml",
-            }
-
-            # Iterate through the query keys we have
-            for this_key in query_keys:
-                params["query_key"] = this_key
-
-                response = requests.get(fetch_url, params=parse.urlencode(params, safe=","))
-
-                trying = True
-                try_count = 0
-                while trying:
-                    if response.status_code == 200:
-                        xml_data = xml_data + "\n" + response.text
-                        trying = False
-                    else:
-                        logging.error(
-                            f"Encountered error in fetching from PubMed: {response.status_code}"
-                        )
-                        try_count = try_count + 1
-                        if try_count < RETRY_MAX:
-                            logging.info("Trying again...")
-                            time.sleep(0.5)
-                        else:
-                            logging.info(f"Giving up - last status code {response.status_code}")
-                            trying = False
-            logging.info("Retrieved document data.")
+        # The API won't accept more than ~2500 chars worth of IDs in a query,
+        # or about 280 to 320 PMIDs, so we fetch batches of IDs,
+        # concurrently, keeping them in order
+        id_batches = [ids[pmid : pmid + batch_size] for pmid in range(0, len(ids), batch_size)]
+        xml_data = "\n".join([""] + self._map(self._fetch, id_batches))
+        logging.info("Retrieved document data.")
 
         # Parse that xml - this returns a list of strings
         # if raw is True, the tags are kept, but we still get a list of docs
@@ -345,7 +308,9 @@ class PubmedClient:
                 logging.warning(
                     f'Truncating entry beginning "{doc[:50]}" to {str(self.max_text_length)} chars'
                 )
-                shortdoc = doc[0 : self.max_text_length]
+                shortdoc = next(
+                    chunk_sentences(doc, max_tokens=self.max_text_length, count_tokens=len)
+                )
                 txt.append(shortdoc)
             else:
                 txt.append(doc)
@@ -364,44 +329,14 @@ class PubmedClient:
         :param pmc_id: List of PubMed IDs, or string with single PMID
         :return: the text of a single entry as XML
         """
-        xml_data = ""
-
-        fetch_url = EUTILS_URL + "efetch.fcgi"
-
-        if self.email and self.ncbi_key:
-            params = {
-                "db": "pmc",
-                "id": pmc_id,
-                "rettype": "xml",
-                "retmode": "xml",
-                "email": self.email,
-                "api_key": self.ncbi_key,
-            }
-        else:
-            params = {"db": "pmc", "id": pmc_id, "rettype": "xml", "retmode": "xml"}
-
-        response = requests.get(fetch_url, params=parse.urlencode(params, safe=","))
-
-        trying = True
-        try_count = 0
-        while trying:
-            if response.status_code == 200:
-                xml_data = response.text
-                trying = False
-            else:
-                logging.error(
-                    f"Encountered error in fetching from PubMed Central: {response.status_code}"
-                )
-                try_count = try_count + 1
-                if try_count < RETRY_MAX:
-                    logging.info("Trying again...")
-                    time.sleep(1)
-                else:
-                    logging.info(f"Giving up - last status code {response.status_code}")
-                    trying = False
+        params = {"db": "pmc", "id": pmc_id, "rettype": "xml", "retmode": "xml"}
+        response = self._request("efetch.fcgi", params)
+        if response is None or response.status_code != 200:
+            logging.error(f"Could not fetch PubMed Central entry {pmc_id}")
+            return ""
         logging.info(f"Retrieved PubMed Central document data for {pmc_id}.")
 
-        return xml_data
+        return response.text
 
     def search(self, term: str, keywords: List[str]) -> Generator[PMID, None, None]:
         """Get the quality-scored text of PubMed papers relating to a search term and keywords.
@@ -462,6 +397,7 @@ class PubmedClient:
         soup = BeautifulSoup(xml, "xml")
 
         logging.info("Parsing all xml entries...")
+        entries = []
         for pa in soup.find_all(["PubmedArticle", "PubmedBookArticle"]):
             # First check the PMID, and if requested, any PMC ID
             pmid = ""
@@ -483,6 +419,15 @@ class PubmedClient:
                     has_pmc_id = True
             except AttributeError:
                 logging.info(f"PubMed entry {pmid} is missing the expected PubMedData fields.")
+            entries.append((pa, pmid, pmc_id, has_pmc_id))
+
+        # Fetch the PubMed Central texts needed, concurrently
+        pmc_texts = {}
+        if autoformat and not raw:
+            pmc_ids = list(dict.fromkeys(pmc_id for _, _, pmc_id, has_id in entries if has_id))
+            pmc_texts = dict(zip(pmc_ids, self._map(self.pmc_text, pmc_ids)))
+
+        for pa, pmid, pmc_id, has_pmc_id in entries:
             if autoformat and not raw and not has_pmc_id:  # No PMC ID - just use title+abstract
                 ti = ""
                 if pa.find("ArticleTitle"):
@@ -496,7 +441,7 @@ class PubmedClient:
                 txt = f"Title: {ti}\nKeywords: {'; '.join(kw)}\nPMID: {pmid}\nAbstract: {ab}"
                 docs.append(txt)
             elif autoformat and not raw and has_pmc_id:  # PMC ID - get and use that text instead
-                fulltext = self.pmc_text(pmc_id)
+                fulltext = pmc_texts[pmc_id]
                 fullsoup = BeautifulSoup(fulltext, "xml")
                 body = ""
                 if fullsoup.find("pmc-articleset").find("article").find("body"):
@@ -513,12 +458,15 @@ class PubmedClient:
 
                 id_txt = f"Title: {ti}\nKeywords: {'; '.join(kw)}\nPMID: {pmid}\nPMCID: {pmc_id}\n"
                 full_max_len = self.max_text_length - len(id_txt)
-                chunktxt = [body[i : i + full_max_len] for i in range(0, len(body), full_max_len)]
+                # Pack whole sentences into chunks, rather than cutting mid-sentence
+                chunktxt = list(chunk_sentences(body, max_tokens=full_max_len, count_tokens=len))
+                if len(chunktxt) > 1:
+                    logging.info(
+                        f"Splitting PMC text of {pmc_id} into {len(chunktxt)} chunks "
+                        f"of up to {self.max_text_length} chars"
+                    )
                 for txt in chunktxt:
                     docs.append(id_txt + txt)
-                    logging.warning(
-                        f'Truncating entry containing "{txt[:50]}" to {self.max_text_length} chars'
-                    )
             elif raw:
                 docs.append(str(pa))
             else:
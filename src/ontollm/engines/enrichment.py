@@ -8,7 +8,7 @@ from pathlib import Path
 from typing import Dict, List, Optional, Tuple, Union
 
 from jinja2 import Template
-from oaklib import BasicOntologyInterface, get_adapter
+from oaklib import BasicOntologyInterface
 from pydantic import BaseModel
 
 from ontollm import MODELS
@@ -193,7 +193,9 @@ class EnrichmentEngine(KnowledgeEngine):
             annotations=annotations,
             taxon=gene_set.taxon,
         )
-        response_text = self.client.complete(prompt, max_tokens=self.completion_length)
+        response_text = self.client.complete(
+            prompt, max_gen_len=self.completion_length, stop=[self.end_marker]
+        )
         if self.encoding is not None:
             response_token_length = len(self.encoding.encode(response_text))
         else:
@@ -287,7 +289,7 @@ class EnrichmentEngine(KnowledgeEngine):
                     continue
 
     def add_resolver(self, resolver: str):
-        self.label_resolvers[resolver] = get_adapter(resolver)
+        self.label_resolvers[resolver] = self.lease_adapter(resolver)
 
     def process_payload(self, payload: EnrichmentPayload) -> EnrichmentPayload:
         """Process the payload."""
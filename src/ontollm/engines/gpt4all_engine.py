@@ -20,15 +20,14 @@ from linkml_runtime.linkml_model import ClassDefinition, SlotDefinition
 from oaklib import BasicOntologyInterface
 
 from ontollm.engines.knowledge_engine import (
-    ANNOTATION_KEY_PROMPT,
-    ANNOTATION_KEY_PROMPT_SKIP,
+    END_OF_TEXT_MARKER,
     EXAMPLE,
     FIELD,
     OBJECT,
     KnowledgeEngine,
-    chunk_text,
 )
 from ontollm.templates.core import ExtractionResult
+from ontollm.utils.named_entities import NamedEntityRegistry
 from ontollm.utils.gpt4all_runner import chain_gpt4all_model, set_up_gpt4all_model
 
 this_path = Path(__file__).parent
@@ -77,26 +76,21 @@ class GPT4AllEngine(KnowledgeEngine):
         :param an_object: optional stub object
         :return:
         """
-        if self.sentences_per_window:
-            chunks = chunk_text(text, self.sentences_per_window)
-            extracted_object = None
-            for chunk in chunks:
-                raw_text = self._raw_extract(chunk, class_def, an_object=an_object)
-                logging.info(f"RAW TEXT: {raw_text}")
-                if show_prompt:
-                    logging.info(f" PROVIDED PROMPT:\n{self.last_prompt}")
-                next_object = self.parse_completion_payload(raw_text, class_def, an_object=an_object)
-                if extracted_object is None:
-                    extracted_object = next_object
-                else:
-                    for k, v in next_object.items():
-                        if isinstance(v, list):
-                            extracted_object[k] += v
-                        else:
-                            if k not in extracted_object:
-                                extracted_object[k] = v
-                            else:
-                                extracted_object[k] = v
+        chunks = self.text_windows(text, class_def, an_object=an_object)
+        if len(chunks) > 1:
+
+            def _extract_window(chunk: str) -> Tuple[str, Optional[pydantic.BaseModel]]:
+                window_text = self._raw_extract(chunk, class_def, an_object=an_object)
+                logging.info(f"RAW TEXT: {window_text}")
+                return window_text, self.parse_completion_payload(window_text, class_def,
+                                                                  an_object=an_object)
+
+            raw_text, extracted_object = self.extract_from_windows(chunks, _extract_window)
+            if chunks:
+                self.last_prompt = self.get_completion_prompt(class_def, chunks[-1],
+                                                              an_object=an_object)
+            if show_prompt:
+                logging.info(f" PROVIDED PROMPT:\n{self.last_prompt}")
         else:
             raw_text = self._raw_extract(text, class_def, an_object=an_object)
             logging.info(f"RAW TEXT: {raw_text}")
@@ -108,7 +102,7 @@ class GPT4AllEngine(KnowledgeEngine):
             raw_completion_output=raw_text,
             prompt=self.last_prompt,
             extracted_object=extracted_object,
-            named_entities=self.named_entities,
+            named_entities=self.named_entity_registry().entities(),
         )
 
     def _extract_from_text_to_dict(self, text: str, class_def: ClassDefinition = None) -> RESPONSE_DICT:
@@ -166,6 +160,7 @@ class GPT4AllEngine(KnowledgeEngine):
             db["results"].append(result)
             db["processed_entities"].append(next_entity)
             yield result
+            named_entities = NamedEntityRegistry(result.named_entities)
             for s in iteration_slots:
                 # if s not in result.extracted_object:
                 #    raise ValueError(f"Slot {s} not found in {result.extracted_object}")
@@ -177,18 +172,16 @@ class GPT4AllEngine(KnowledgeEngine):
                     vals = [vals]
                 for val in vals:
                     entity = val
-
-                    for ne in result.named_entities:
-                        if ne.id == val:
-                            entity = ne.label
-                            if ne.id.startswith("AUTO"):
-                                # Sometimes the value of some slots will lack
-                                context = next_entity
-                                context = re.sub(r"\(.*\)", "", context)
-                                entity = f"{entity} ({context})"
-                            else:
-                                entity = ne.id
-                            break
+                    ne = named_entities.get(val) if isinstance(val, str) else None
+                    if ne is not None:
+                        entity = ne.label
+                        if ne.id.startswith("AUTO"):
+                            # Sometimes the value of some slots will lack
+                            context = next_entity
+                            context = re.sub(r"\(.*\)", "", context)
+                            entity = f"{entity} ({context})"
+                        else:
+                            entity = ne.id
                     queue_deparenthesized = [
                         _remove_parenthetical_context(e) for e in db["entities_in_queue"]
                     ]
@@ -232,7 +225,7 @@ class GPT4AllEngine(KnowledgeEngine):
             raw_completion_output=payload,
             # prompt=self.last_prompt,
             results=[prediction],
-            named_entities=self.named_entities,
+            named_entities=self.named_entity_registry().entities(),
         )
 
     def map_terms(self, terms: List[str], ontology: str) -> Dict[str, List[str]]:
@@ -351,7 +344,10 @@ class GPT4AllEngine(KnowledgeEngine):
         """
         prompt = self.get_completion_prompt(class_def, text, an_object=an_object)
         self.last_prompt = prompt
-        payload = chain_gpt4all_model(self.loaded_model, prompt)
+        payload = chain_gpt4all_model(self.loaded_model, prompt,
+                                      cache_db_path=self.cache_db_path,
+                                      stop=[END_OF_TEXT_MARKER],
+                                      stop_condition=self.all_slots_emitted_condition(class_def))
         return payload
 
     def get_completion_prompt(
@@ -366,23 +362,7 @@ class GPT4AllEngine(KnowledgeEngine):
             )
         else:
             prompt = "Split the following piece of text into fields in the following format:\n\n"
-        for slot in self.schemaview.class_induced_slots(class_def.name):
-            if ANNOTATION_KEY_PROMPT_SKIP in slot.annotations:
-                continue
-            if ANNOTATION_KEY_PROMPT in slot.annotations:
-                slot_prompt = slot.annotations[ANNOTATION_KEY_PROMPT].value
-            elif slot.description:
-                slot_prompt = slot.description
-            else:
-                if slot.multivalued:
-                    slot_prompt = f"semicolon-separated list of {slot.name}s"
-                else:
-                    slot_prompt = f"the value for {slot.name}"
-            if slot.range in self.schemaview.all_enums():
-                enum_def = self.schemaview.get_enum(slot.range)
-                pvs = [str(k) for k in enum_def.permissible_values.keys()]
-                slot_prompt += f"Must be one of: {', '.join(pvs)}"
-            prompt += f"{slot.name}: <{slot_prompt}>\n"
+        prompt += self.prompt_header(class_def)
         # prompt += "Do not answer if you don't know\n\n"
         prompt = f"{prompt}\n\nText:\n{text}\n\n===\n\n"
         if an_object:
@@ -441,7 +421,6 @@ class GPT4AllEngine(KnowledgeEngine):
     ) -> Optional[Tuple[FIELD, RESPONSE_ATOM]]:
         if class_def is None:
             class_def = self.template_class
-        sv = self.schemaview
         # each line is a key-value pair
         logging.info(f"PARSING LINE: {line}")
         field, val = line.split(":", 1)
@@ -449,19 +428,13 @@ class GPT4AllEngine(KnowledgeEngine):
         # The LLML may mutate the output format somewhat,
         # randomly pluralizing or replacing spaces with underscores
         field = field.lower().replace(" ", "_")
-        cls_slots = sv.class_slots(class_def.name)
-        slot = None
-        if field in cls_slots:
-            slot = sv.induced_slot(field, class_def.name)
-        else:
-            if field.endswith("s"):
-                field = field[:-1]
-            if field in cls_slots:
-                slot = sv.induced_slot(field, class_def.name)
-        if not slot:
+        slot_info = self.slot_index(class_def).lookup(field)
+        if not slot_info:
             logging.error(f"Cannot find slot for {field} in {line}")
             # raise ValueError(f"Cannot find slot for {field} in {line}")
             return
+        slot = slot_info.slot
+        field = slot.name
         if not val:
             msg = f"Empty value in key-value line: {line}"
             if slot.required:
@@ -469,11 +442,8 @@ class GPT4AllEngine(KnowledgeEngine):
             if slot.recommended:
                 logging.warning(msg)
             return
-        inlined = slot.inlined
-        slot_range = sv.get_class(slot.range)
-        if not inlined:
-            if slot.range in sv.all_classes():
-                inlined = sv.get_identifier_slot(slot_range.name) is None
+        inlined = slot_info.inlined
+        slot_range = slot_info.range_class
         val = val.strip()
         if slot.multivalued:
             vals = [v.strip() for v in val.split(";")]
@@ -483,7 +453,7 @@ class GPT4AllEngine(KnowledgeEngine):
         logging.debug(f"SLOT: {slot.name} INL: {inlined} VALS: {vals}")
         if inlined:
             transformed = False
-            slots_of_range = sv.class_slots(slot_range.name)
+            slots_of_range = slot_info.range_slots
             if self.recurse or len(slots_of_range) > 2:
                 vals = [self._extract_from_text_to_dict(v, slot_range) for v in vals]
             else:
@@ -522,7 +492,8 @@ class GPT4AllEngine(KnowledgeEngine):
         logging.debug(f"RAW: {raw}")
         if an_object:
             raw = {**an_object, **raw}
-        return self.ground_annotation_object(raw, class_def)
+        with self.annotated_in_bulk(raw, class_def):
+            return self.ground_annotation_object(raw, class_def)
 
     def ground_annotation_object(
         self, ann: RESPONSE_DICT, class_def: ClassDefinition = None
@@ -541,7 +512,6 @@ class GPT4AllEngine(KnowledgeEngine):
         logging.debug(f"Grounding annotation object {ann}")
         if class_def is None:
             class_def = self.template_class
-        sv = self.schemaview
         new_ann = {}
         if ann is None:
             logging.error(f"Cannot ground None annotation, class_def={class_def.name}")
@@ -552,23 +522,23 @@ class GPT4AllEngine(KnowledgeEngine):
             else:
                 multivalued = False
                 vals = [vals]
-            slot = sv.induced_slot(field, class_def.name)
-            rng_cls = sv.get_class(slot.range)
-            enum_def = None
-            if slot.range:
-                if slot.range in self.schemaview.all_enums():
-                    enum_def = self.schemaview.get_enum(slot.range)
+            slot_info = self.slot_index(class_def).slots.get(field)
+            if slot_info is None:
+                raise ValueError(f"No such slot {field} in class {class_def.name}")
+            slot = slot_info.slot
+            rng_cls = slot_info.range_class
+            enum_def = slot_info.enum_def
             new_ann[field] = []
             for val in vals:
                 if not val:
                     continue
                 if isinstance(val, tuple):
                     # special case for pairs
-                    sub_slots = sv.class_induced_slots(rng_cls.name)
+                    sub_slots = list(self.slot_index(rng_cls).slots.values())
                     obj = {}
                     for i in range(0, len(val)):
-                        sub_slot = sub_slots[i]
-                        sub_rng = sv.get_class(sub_slot.range)
+                        sub_slot = sub_slots[i].slot
+                        sub_rng = sub_slots[i].range_class
                         if not sub_rng:
                             logging.error(f"Cannot find range for {sub_slot.name}")
                         result = self.normalize_named_entity(val[i], sub_slot.range)
@@ -579,14 +549,10 @@ class GPT4AllEngine(KnowledgeEngine):
                 else:
                     obj = self.normalize_named_entity(val, slot.range)
                 if enum_def:
-                    found = False
                     logging.info(f"Looking for {obj} in {enum_def.name}")
-                    for k, _pv in enum_def.permissible_values.items():
-                        if obj.lower() == k.lower():
-                            obj = k
-                            found = True
-                            break
-                    if not found:
+                    if type(obj) is str and obj.lower() in slot_info.enum_values:
+                        obj = slot_info.enum_values[obj.lower()]
+                    else:
                         logging.info(f"Cannot find enum value for {obj} in {enum_def.name}")
                         obj = None
                 if multivalued:
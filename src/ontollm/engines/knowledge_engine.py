@@ -1,22 +1,55 @@
 """Main Knowledge Extractor class."""
+import hashlib
 import importlib
 import logging
 import re
+import threading
+import time
 from abc import ABC
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    TimeoutError,
+    as_completed,
+    wait,
+)
 from dataclasses import dataclass, field
 from pathlib import Path
 from types import ModuleType
-from typing import Dict, Iterator, List, Optional, TextIO, Union
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Pattern,
+    Set,
+    TextIO,
+    Tuple,
+    Union,
+)
 from urllib.parse import quote
 
 import inflection
 import pydantic
 import yaml
 from linkml_runtime import SchemaView
-from linkml_runtime.linkml_model import ClassDefinition, ElementName, SlotDefinition
-from oaklib import BasicOntologyInterface, get_adapter
+from linkml_runtime.dumpers import json_dumper
+from linkml_runtime.linkml_model import (
+    ClassDefinition,
+    ElementName,
+    EnumDefinition,
+    SlotDefinition,
+)
+from oaklib import BasicOntologyInterface
 from oaklib.datamodels.text_annotator import TextAnnotationConfiguration
-from oaklib.implementations import OntoPortalImplementationBase
 from oaklib.interfaces import MappingProviderInterface, TextAnnotatorInterface
 from oaklib.utilities.subsets.value_set_expander import ValueSetExpander
 from requests.exceptions import ConnectionError, HTTPError, ProxyError
@@ -24,6 +57,30 @@ from requests.exceptions import ConnectionError, HTTPError, ProxyError
 from ontollm import DEFAULT_MODEL
 from ontollm.clients import Llama2Client
 from ontollm.templates.core import ExtractionResult, NamedEntity
+from ontollm.utils.adapter_registry import (
+    acquire_shared_adapter,
+    get_shared_adapter,
+    release_shared_adapter,
+)
+from ontollm.utils.bulk_annotation import (
+    annotate_texts,
+    supports_bulk_annotation,
+    supports_partial_matches,
+)
+from ontollm.utils.chunking import chunk_sentences, token_counter
+from ontollm.utils.daemon_executor import DaemonThreadPoolExecutor
+from ontollm.utils.dictionary_index import DictionaryIndex
+from ontollm.utils.grounding_cache import (
+    DEFAULT_MAX_SIZE,
+    NOT_CACHED,
+    GroundingCache,
+    get_grounding_cache,
+    grounding_key,
+)
+from ontollm.utils.mapping_index import MappingIndex, get_mapping_index
+from ontollm.utils.named_entities import NamedEntityRegistry
+from ontollm.utils.run_journal import RunJournal, content_hash
+from ontollm.utils.value_set_cache import get_value_set_cache, value_set_key
 
 this_path = Path(__file__).parent
 logger = logging.getLogger(__name__)
@@ -42,6 +99,28 @@ ANNOTATION_KEY_ANNOTATORS = "annotators"
 ANNOTATION_KEY_RECURSE = "ner.recurse"
 ANNOTATION_KEY_EXAMPLES = "prompt.examples"
 
+# Texts that are already identifiers, e.g. HGNC:1234
+CURIE_TEXT_PATTERN = re.compile(r"^(\S+):(\d+)$")
+
+# Components of texts in brackets or parentheses, grounded separately
+BRACKETED_PATTERN = re.compile(r"\[(.*?)\]")
+PARENTHESIZED_PATTERN = re.compile(r"\((.*?)\)")
+
+# Annotating a text as a whole, then for entities within it
+WHOLE_TEXT_CONFIG = TextAnnotationConfiguration(matches_whole_text=True)
+PARTIAL_TEXT_CONFIG = TextAnnotationConfiguration(matches_whole_text=False)
+
+# Ends the input text in completion prompts; models tend to
+# repeat it once they have filled in the requested fields
+END_OF_TEXT_MARKER = "==="
+
+# Number of extractions kept, once yielded, to serve later identical inputs of a run
+DEDUPLICATION_WINDOW = 1024
+
+# Tokens reserved for the completion when packing text into windows,
+# unless set on the engine; at most a quarter of the context is reserved
+DEFAULT_COMPLETION_TOKENS = 512
+
 # TODO: introspect
 # TODO: move this to its own module
 DATAMODELS = [
@@ -61,12 +140,131 @@ DATAMODELS = [
 ]
 
 
+def _annotated_object_ids(
+    annotator: TextAnnotatorInterface, text: str, config: TextAnnotationConfiguration
+) -> List[str]:
+    """Get the ids of the objects an annotator finds in a text, in the order it gives them."""
+    return [result.object_id for result in annotator.annotate_text(text, config)]
+
+
+def annotator_name(selector: Any) -> str:
+    """Get the name of an annotator: its selector (e.g. "bioportal:"), or its class name."""
+    return selector if isinstance(selector, str) else type(selector).__name__
+
+
 def chunk_text(text: str, window_size=3) -> Iterator[str]:
-    """Chunk text into windows of sentences."""
-    sentences = re.split(r"[.?!]\s+", text)
-    for right_index in range(1, len(sentences)):
-        left_index = max(0, right_index - window_size)
-        yield ". ".join(sentences[left_index:right_index])
+    """Chunk text into consecutive windows of up to window_size sentences."""
+    return chunk_sentences(text, max_sentences=window_size)
+
+
+def merge_extracted_objects(objects: List[Optional[OBJECT]]) -> Optional[OBJECT]:
+    """Merge the objects extracted from successive windows of a text, in order.
+
+    List-valued fields are concatenated; for other fields, a later
+    non-empty value replaces an earlier one.
+
+    :param objects: extracted objects (pydantic models or dicts), in window order
+    :return: the first non-empty object, updated with the rest
+    """
+    merged = None
+    for obj in objects:
+        if obj is None:
+            continue
+        if merged is None:
+            merged = obj
+            continue
+        for k, v in obj.items() if isinstance(obj, dict) else obj:
+            if isinstance(merged, dict):
+                current = merged.get(k)
+            else:
+                current = getattr(merged, k, None)
+            if isinstance(v, list) and isinstance(current, list):
+                v = current + v
+            elif v is None:
+                continue
+            if isinstance(merged, dict):
+                merged[k] = v
+            else:
+                setattr(merged, k, v)
+    return merged
+
+
+@dataclass
+class SlotInfo:
+    """Template metadata about a slot, as needed to parse and ground its values."""
+
+    slot: SlotDefinition
+    range_class: Optional[ClassDefinition] = None
+    range_slots: List[str] = field(default_factory=list)
+    inlined: bool = False
+    enum_def: Optional[EnumDefinition] = None
+    enum_values: Dict[str, str] = field(default_factory=dict)
+    """Permissible values of the range enum, by their lowercase form"""
+
+
+@dataclass
+class ClassSlotIndex:
+    """The slots of a template class, by each field name a model may use for them."""
+
+    slots: Dict[str, SlotInfo] = field(default_factory=dict)
+    """Slots by name"""
+
+    field_names: Dict[str, str] = field(default_factory=dict)
+    """Slot names by normalized field name, including plural forms"""
+
+    promptable_slots: List[SlotDefinition] = field(default_factory=list)
+
+    def lookup(self, field_name: str) -> Optional[SlotInfo]:
+        """Get the slot for a field name normalized to lowercase with underscores."""
+        name = self.field_names.get(field_name)
+        if name is None:
+            return None
+        return self.slots[name]
+
+
+@dataclass
+class IdentifierValidator:
+    """The constraints on the identifiers of a class, compiled for repeated checks."""
+
+    prefixes: Optional[FrozenSet[str]] = None
+    """Allowed prefixes, or None if any prefix is allowed"""
+
+    pattern: Optional[Pattern] = None
+    """Compiled pattern of the identifier slot, if any"""
+
+    value_sets: List[str] = field(default_factory=list)
+    """Names of the enums one of whose expansions an identifier must be in, if any"""
+
+
+@dataclass
+class GroundingPlan:
+    """How texts are grounded to a class, compiled once for all its named entities."""
+
+    config: str
+    """Description of the grounding configuration, as part of grounding cache keys"""
+
+    examples: FrozenSet[str] = frozenset()
+    """Lowercase prompt examples; texts matching these are likely hallucinations"""
+
+    id_prefixes: Dict[str, str] = field(default_factory=dict)
+    """Identifier prefixes of the class, by their uppercase form"""
+
+    annotators: List[Tuple[Any, TextAnnotatorInterface, Optional[float]]] = field(
+        default_factory=list
+    )
+    """Selector, loaded annotator and timeout of each annotator not skipped, by priority"""
+
+    partial_annotators: List[Tuple[Any, TextAnnotatorInterface, Optional[float]]] = field(
+        default_factory=list
+    )
+    """The annotators also queried for partial matches"""
+
+    recurse: bool = False
+    """Whether texts not grounded are extracted from recursively"""
+
+    leases: List[Tuple[str, TextAnnotatorInterface]] = field(default_factory=list)
+    """Selector and adapter of each annotator acquired from the adapter registry,
+    kept open until the plan is dropped"""
 
 
 @dataclass
@@ -98,6 +296,23 @@ class KnowledgeEngine(ABC):
     """LinkML SchemaView over the template.
     This is derived from the template and does not need to be set manually."""
 
+    prompt_headers: Dict[str, str] = field(default_factory=dict)
+    """Rendered slot lines of completion prompts, by class name.
+    This is derived from the template and does not need to be set manually."""
+
+    slot_indexes: Dict[str, ClassSlotIndex] = field(default_factory=dict)
+    """Slot metadata used in parsing and grounding, by class name.
+    This is derived from the template and does not need to be set manually."""
+
+    identifier_validators: Dict[str, IdentifierValidator] = field(default_factory=dict)
+    """Constraints on identifiers, by class name.
+    This is derived from the template and does not need to be set manually."""
+
+    grounding_plans: Dict[str, GroundingPlan] = field(default_factory=dict)
+    """Grounding plans, by class name; call reset_grounding_plans after changing
+    annotators or mappers.
+    This is derived from the template and does not need to be set manually."""
+
     model: str = None
     """Language Model. This may be overridden in subclasses."""
 
@@ -114,25 +329,66 @@ class KnowledgeEngine(ABC):
     """Annotators to skip.
     This overrides any specified in the schema"""
 
+    annotator_workers: int = 8
+    """Maximum number of requests run concurrently by each annotator,
+    across all texts being grounded by this engine. Each annotator has
+    its own threads, so a hung service does not hold up the others."""
+
+    annotator_timeout: Optional[float] = 60.0
+    """Seconds to wait for the results of an annotator for a text,
+    after which grounding goes on without them. If None, there is no limit."""
+
+    annotator_timeouts: Dict[str, float] = field(default_factory=dict)
+    """Timeouts overriding annotator_timeout, by annotator selector (e.g. "bioportal:")
+    or, for annotator objects, by class name."""
+
     mappers: List[BasicOntologyInterface] = None
     """List of concept mappers, to assist in grounding to desired ID prefix"""
 
+    mapping_index_path: Optional[str] = None
+    """Path to a local mapping index (see build-mapping-index), used as the mapper
+    instead of the translator: adapter when mappers are not set."""
+
     labelers: List[BasicOntologyInterface] = None
     """Labelers that map CURIEs to labels"""
 
     client: HFHubClient = None
     """All calls to LLMs are delegated through this client"""
 
+    cache_db_path: Optional[str] = None
+    """Path to the sqlite database caching prompt completions.
+    If not set, the default cache database of the backend is used."""
+
     dictionary: Dict[str, str] = field(default_factory=dict)
     """Local dictionary of strings/labels to IDs"""
 
-    value_set_expansions: Dict[str, List[str]] = field(default_factory=dict)
+    dictionary_index: Optional[DictionaryIndex] = None
+    """Index of the synonyms in the dictionary, to find those occurring in a text.
+    This is derived from the dictionary and does not need to be set manually."""
+
+    dictionary_version: Optional[str] = None
+    """Version of the dictionary, part of the key of cached groundings.
+    If not set, it is derived from the contents of the dictionary."""
+
+    grounding_cache_path: Optional[str] = None
+    """Path to a sqlite database persisting groundings across runs.
+    If not set, groundings are only cached in memory, for the life of the engine."""
+
+    grounding_cache_size: int = DEFAULT_MAX_SIZE
+    """Maximum number of groundings cached in memory."""
+
+    value_set_expansions: Dict[str, FrozenSet[str]] = field(default_factory=dict)
+    """Identifiers in the expansion of each enum used as a value set, by enum name"""
+
+    value_set_cache_path: Optional[str] = None
+    """Path to a sqlite database caching value set expansions across runs.
+    If not set, value sets are expanded anew in each process."""
 
     min_grounding_text_overlap = 0.66
     """Min proportion of overlap in characters between text and grounding. TODO: use tokenization"""
 
-    named_entities: List[NamedEntity] = field(default_factory=list)
-    """Cache of all named entities"""
+    named_entities: NamedEntityRegistry = field(default_factory=NamedEntityRegistry)
+    """Cache of all named entities, by id"""
 
     auto_prefix: str = None
     """If set then non-normalized named entities will be mapped to this prefix"""
@@ -140,8 +396,22 @@ class KnowledgeEngine(ABC):
     last_text: str = None
     """Cache of last text."""
 
-    last_prompt: str = None
-    """Cache of last prompt used."""
+    context_window_tokens: Optional[int] = None
+    """Number of tokens the model can attend to, prompt and completion included.
+    If not set, it is taken from the client (e.g. max_seq_len of a Llama 2 client)
+    where available; texts longer than what fits are split into windows."""
+
+    completion_tokens: Optional[int] = None
+    """Number of tokens of the context reserved for the completion
+    when packing text into windows. If not set, DEFAULT_COMPLETION_TOKENS,
+    but no more than a quarter of the context."""
+
+    window_overlap: int = 0
+    """Number of sentences at the end of a window repeated at the start of the next."""
+
+    window_workers: int = 4
+    """Maximum number of text windows extracted concurrently
+    when a text is split into windows of sentences."""
 
     encoding = None
 
@@ -152,23 +422,277 @@ class KnowledgeEngine(ABC):
             logging.info(f"Using template {self.template_class.name}")
         if not self.model:
             self.model = DEFAULT_MODEL
+        if self.mappers is None and self.mapping_index_path:
+            logging.info(f"Using mapping index {self.mapping_index_path}")
+            self.mappers = [get_mapping_index(self.mapping_index_path)]
         if self.mappers is None:
             logging.info("Using mappers (currently hardcoded)")
-            self.mappers = [get_adapter("translator:")]
+            self.mappers = [self.lease_adapter("translator:")]
 
         self.set_up_client()
         self.encoding = self.tokenizer
 
+    @property
+    def last_prompt(self) -> Optional[str]:
+        """Cache of last prompt used.
+
+        This is kept per thread, so that concurrent extractions each
+        report their own prompt.
+        """
+        return getattr(self._thread_state(), "last_prompt", None)
+
+    @last_prompt.setter
+    def last_prompt(self, prompt: Optional[str]) -> None:
+        self._thread_state().last_prompt = prompt
+
+    def _thread_state(self) -> threading.local:
+        return self.__dict__.setdefault("_local", threading.local())
+
+    def named_entity_registry(self) -> NamedEntityRegistry:
+        """Get the registry of named entities, converting it from a list if one was set."""
+        if not isinstance(self.named_entities, NamedEntityRegistry):
+            self.named_entities = NamedEntityRegistry(self.named_entities)
+        return self.named_entities
+
+    @property
+    def grounding_cache(self) -> GroundingCache:
+        """The cache of groundings of named entities.
+
+        This is the process-wide cache for grounding_cache_path if set,
+        otherwise an in-memory cache of this engine.
+        """
+        if self.grounding_cache_path:
+            return get_grounding_cache(self.grounding_cache_path, self.grounding_cache_size)
+        return self.__dict__.setdefault(
+            "_grounding_cache", GroundingCache(max_size=self.grounding_cache_size)
+        )
+
     def extract_from_text(
         self, text: str, class_def: ClassDefinition = None, an_object: OBJECT = None
     ) -> ExtractionResult:
         raise NotImplementedError
 
-    def extract_from_file(self, file: Union[str, Path, TextIO]) -> pydantic.BaseModel:
+    def extract_from_texts(
+        self,
+        texts: Iterable[Union[str, Tuple[str, str]]],
+        workers: int = 4,
+        ordered: bool = True,
+        journal: Optional[RunJournal] = None,
+        deduplicate: bool = True,
+        **kwargs,
+    ) -> Iterator[ExtractionResult]:
+        """
+        Extract annotations from many texts, using a pool of threads.
+
+        All workers share this engine, and so its loaded model; clients that
+        batch, such as Llama2Client, send concurrent prompts to the model
+        together. Texts are read lazily, with a bounded number in flight,
+        so the input may be a stream of any length.
+
+        Example:
+
+            for result in ke.extract_from_texts(texts, workers=8):
+                write_extraction(result, output, "yaml", ke)
+
+        :param texts: texts, or (input_id, text) pairs
+        :param workers: number of texts extracted concurrently
+        :param ordered: if True, results are yielded in input order;
+            otherwise, as soon as each is done
+        :param journal: if set, texts the journal has as done under the same
+            input_id are skipped,
+            and failures are recorded there and skipped rather than raised;
+            the caller records each result as done once it is written
+        :param deduplicate: if True, texts that only differ in whitespace are
+            extracted once, and the result is copied for each, with its own input_id;
+            beyond the last DEDUPLICATION_WINDOW distinct texts, a text is extracted again
+        :param kwargs: passed to extract_from_text
+        :return: iterator over extraction results
+        """
+
+        def _extract(input_id: Optional[str], text: str) -> Optional[ExtractionResult]:
+            if journal is None:
+                result = self.extract_from_text(text, **kwargs)
+            else:
+                journal.start(text, input_id=input_id)
+                try:
+                    result = self.extract_from_text(text, **kwargs)
+                except Exception as e:
+                    logger.error(f"Extraction failed for {input_id or text[:50]}: {e}")
+                    journal.fail(text, repr(e), input_id=input_id)
+                    return None
+            if input_id is not None:
+                result.input_id = input_id
+            return result
+
+        # Extractions by normalized text, and the number of their results not
+        # yet yielded; once all are, the oldest are dropped beyond
+        # DEDUPLICATION_WINDOW, so that memory stays bounded on long runs
+        extractions: Dict[str, Future] = {}
+        waiting_results: Dict[str, int] = {}
+
+        def _result(
+            future: Future, key: Optional[str], input_id: Optional[str], text: str, original: bool
+        ) -> Optional[ExtractionResult]:
+            try:
+                result = future.result()
+            finally:
+                if key:
+                    _release(key)
+            if original:
+                return result
+            if result is None:
+                if journal is not None:
+                    journal.fail(text, "Extraction of an identical input failed", input_id=input_id)
+                return None
+            logger.info(f"Reusing extraction of an identical input for {input_id or text[:50]}")
+            return result.model_copy(update={"input_id": input_id, "input_text": text})
+
+        def _release(key: str) -> None:
+            waiting_results[key] -= 1
+            if waiting_results[key]:
+                return
+            del waiting_results[key]
+            excess = len(extractions) - DEDUPLICATION_WINDOW
+            for old_key in list(extractions):
+                if excess <= 0:
+                    break
+                if old_key not in waiting_results:
+                    del extractions[old_key]
+                    excess -= 1
+
+        def _tasks(
+            executor: ThreadPoolExecutor,
+        ) -> Iterator[Tuple[Future, Optional[str], Optional[str], str, bool]]:
+            for item in texts:
+                input_id, text = item if isinstance(item, tuple) else (None, item)
+                if journal is not None and journal.is_done(text, input_id=input_id):
+                    continue
+                key = content_hash(text) if deduplicate else None
+                future = extractions.get(key) if key else None
+                original = future is None
+                if original:
+                    future = executor.submit(_extract, input_id, text)
+                if key:
+                    extractions[key] = future
+                    waiting_results[key] = waiting_results.get(key, 0) + 1
+                yield future, key, input_id, text, original
+
+        workers = max(1, workers)
+        max_pending = 2 * workers
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            if ordered:
+                queue: Deque[Tuple[Future, Optional[str], Optional[str], str, bool]] = deque()
+                for task in _tasks(executor):
+                    queue.append(task)
+                    if len(queue) >= max_pending:
+                        result = _result(*queue.popleft())
+                        if result is not None:
+                            yield result
+                while queue:
+                    result = _result(*queue.popleft())
+                    if result is not None:
+                        yield result
+            else:
+                waiting: Dict[Future, List[Tuple[Optional[str], Optional[str], str, bool]]] = {}
+                for future, key, input_id, text, original in _tasks(executor):
+                    if future.done() and future not in waiting:
+                        result = _result(future, key, input_id, text, original)
+                        if result is not None:
+                            yield result
+                        continue
+                    waiting.setdefault(future, []).append((key, input_id, text, original))
+                    if len(waiting) >= max_pending:
+                        done, _ = wait(list(waiting), return_when=FIRST_COMPLETED)
+                        for future in done:
+                            for task in waiting.pop(future):
+                                result = _result(future, *task)
+                                if result is not None:
+                                    yield result
+                for future in as_completed(list(waiting)):
+                    for task in waiting.pop(future):
+                        result = _result(future, *task)
+                        if result is not None:
+                            yield result
+
+    def text_windows(
+        self, text: str, class_def: ClassDefinition = None, an_object: OBJECT = None
+    ) -> List[str]:
+        """
+        Split a text into the windows to extract from.
+
+        Sentences are packed into windows that fit the model's context once
+        the prompt header and the completion budget are taken out, and that
+        hold at most sentences_per_window sentences, if set.
+        A text that fits in a single window is returned as is.
+
+        :param text: the input text
+        :param class_def: the class the prompt is built for
+        :param an_object: optional stub object included in the prompt
+        :return: the windows, in order
+        """
+        max_sentences = getattr(self, "sentences_per_window", None)
+        count_tokens = token_counter(getattr(self, "tokenizer", None))
+        max_tokens = None
+        context = self.context_window_tokens or getattr(self.client, "max_seq_len", None)
+        if context:
+            header = self.get_completion_prompt(class_def, "", an_object=an_object)
+            completion_tokens = self.completion_tokens
+            if completion_tokens is None:
+                completion_tokens = min(DEFAULT_COMPLETION_TOKENS, context // 4)
+            max_tokens = context - count_tokens(header) - completion_tokens
+            if max_tokens <= 0:
+                logger.warning(
+                    f"Prompt header and completion budget exceed the context of {context} tokens"
+                )
+                max_tokens = None
+        if not max_sentences and (not max_tokens or count_tokens(text) <= max_tokens):
+            return [text]
+        windows = list(
+            chunk_sentences(
+                text,
+                max_tokens=max_tokens,
+                count_tokens=count_tokens,
+                max_sentences=max_sentences,
+                overlap=self.window_overlap,
+            )
+        )
+        logger.info(f"Split text of {len(text)} chars into {len(windows)} windows")
+        return windows or [text]
+
+    def extract_from_windows(
+        self,
+        windows: List[str],
+        extract: Callable[[str], Tuple[str, Optional[pydantic.BaseModel]]],
+    ) -> Tuple[str, Optional[pydantic.BaseModel]]:
+        """
+        Extract from windows of a text concurrently, then merge the results.
+
+        Windows are independent, so they are dispatched across a pool of up to
+        window_workers threads (clients that batch, such as Llama2Client, then
+        send them to the model together); the results are merged in window
+        order regardless of the order in which they complete.
+
+        :param windows: the windows of text
+        :param extract: returns the raw completion and parsed object for a window
+        :return: the raw completions joined in order, and the merged object
+        """
+        if not windows:
+            return "", None
+        workers = max(1, min(self.window_workers, len(windows)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(extract, windows))
+        raw_text = "\n".join(raw for raw, _ in results)
+        return raw_text, merge_extracted_objects([obj for _, obj in results])
+
+    def extract_from_file(
+        self, file: Union[str, Path, TextIO], journal: Optional[RunJournal] = None
+    ) -> Optional[ExtractionResult]:
         """
         Extract annotations from the given text.
 
         :param file:
+        :param journal: if set, a file whose text the journal has as done
+            is skipped (returning None), and the outcome is recorded
         :return:
         """
         if isinstance(file, str):
@@ -179,7 +703,19 @@ class KnowledgeEngine(ABC):
         else:
             text = file.read()
         self.last_text = text
-        r = self.extract_from_text(text)
+        if journal is None:
+            r = self.extract_from_text(text)
+        elif journal.is_done(text, input_id=str(file)):
+            logger.info(f"Skipping {file}, done in run {journal.run_id}")
+            return None
+        else:
+            journal.start(text, input_id=str(file))
+            try:
+                r = self.extract_from_text(text)
+            except Exception as e:
+                journal.fail(text, repr(e), input_id=str(file))
+                raise
+            journal.done(text, input_id=str(file))
         r.input_id = str(file)
         return r
 
@@ -190,6 +726,8 @@ class KnowledgeEngine(ABC):
                 return self.load_dictionary(yaml.safe_load(f))
         if self.dictionary is None:
             self.dictionary = {}
+        self.dictionary_version = None
+        self.reset_grounding_plans()
         entries = [(entry["synonym"].lower(), entry["id"]) for entry in path]
         entries = sorted(entries, key=lambda x: len(x[0]), reverse=True)
         for syn, ident in entries:
@@ -197,6 +735,67 @@ class KnowledgeEngine(ABC):
                 logger.warning(f"Duplicate synonym: {syn} => {id}, {self.dictionary[syn]}")
             self.dictionary[syn] = ident
         logger.info(f"Loaded {len(self.dictionary)}")
+        self.dictionary_index = None
+        self.synonym_index()
+
+    def synonym_index(self) -> DictionaryIndex:
+        """
+        Get the index of the synonyms in the dictionary.
+
+        The index is built on loading a dictionary, and rebuilt if entries
+        were added to the dictionary directly since.
+
+        :return: the index, over all synonyms in the dictionary
+        """
+        if self.dictionary_index is None or len(self.dictionary_index) != len(self.dictionary):
+            self.dictionary_index = DictionaryIndex(self.dictionary)
+            logger.info(f"Indexed {len(self.dictionary_index)} dictionary synonyms")
+        return self.dictionary_index
+
+    def get_completion_prompt(
+        self, class_def: ClassDefinition = None, text: str = None, an_object: OBJECT = None
+    ) -> str:
+        raise NotImplementedError
+
+    def prompt_header(self, class_def: ClassDefinition = None) -> str:
+        """
+        Get the slot lines of the completion prompt for a class.
+
+        Each promptable slot gets a line with its name and prompt, including
+        the permissible values of enums. This only depends on the template,
+        so it is rendered once per class and reused for every prompt.
+
+        :param class_def: the class to prompt for
+        :return: the lines, in slot order
+        """
+        if class_def is None:
+            class_def = self.template_class
+        header = self.prompt_headers.get(class_def.name)
+        if header is not None:
+            return header
+        sv = self.schemaview
+        enums = sv.all_enums()
+        lines = []
+        for slot in sv.class_induced_slots(class_def.name):
+            if ANNOTATION_KEY_PROMPT_SKIP in slot.annotations:
+                continue
+            if ANNOTATION_KEY_PROMPT in slot.annotations:
+                slot_prompt = slot.annotations[ANNOTATION_KEY_PROMPT].value
+            elif slot.description:
+                slot_prompt = slot.description
+            else:
+                if slot.multivalued:
+                    slot_prompt = f"semicolon-separated list of {slot.name}s"
+                else:
+                    slot_prompt = f"the value for {slot.name}"
+            if slot.range in enums:
+                enum_def = sv.get_enum(slot.range)
+                pvs = [str(k) for k in enum_def.permissible_values.keys()]
+                slot_prompt += f"Must be one of: {', '.join(pvs)}"
+            lines.append(f"{slot.name}: <{slot_prompt}>\n")
+        header = "".join(lines)
+        self.prompt_headers[class_def.name] = header
+        return header
 
     # @abstractmethod
     def synthesize(self, class_def: ClassDefinition = None, an_object: OBJECT = None) -> ExtractionResult:
@@ -235,6 +834,10 @@ class KnowledgeEngine(ABC):
         self.template_module = mod
         self.template_pyclass = mod.__dict__[class_name]
         self.schemaview = sv
+        self.prompt_headers = {}
+        self.slot_indexes = {}
+        self.identifier_validators = {}
+        self.reset_grounding_plans()
         logger.info(f"Getting class for template {template}")
         class_def = None
         for c in sv.all_classes().values():
@@ -268,21 +871,19 @@ class KnowledgeEngine(ABC):
                 return []
             annotators = class_def.annotations[ANNOTATION_KEY_ANNOTATORS].value.split(", ")
         logger.info(f" Annotators: {annotators} [will skip: {self.skip_annotators}]")
-        annotators = []
+        loaded = []
         for annotator in annotators:
             if isinstance(annotator, str):
                 logger.info(f"Loading annotator {annotator}")
                 if self.skip_annotators and annotator in self.skip_annotators:
                     logger.info(f"Skipping annotator {annotator}")
                     continue
-                if annotator not in self.annotators:
-                    self.annotators[annotator] = get_adapter(annotator)
-                annotators.append(self.annotators[annotator])
+                loaded.append(get_shared_adapter(annotator))
             elif isinstance(annotator, BasicOntologyInterface):
-                annotators.append(annotator)
+                loaded.append(annotator)
             else:
                 raise ValueError(f"Unknown annotator type {annotator}")
-        return annotators
+        return loaded
 
     def promptable_slots(self, class_def: Optional[ClassDefinition] = None) -> List[SlotDefinition]:
         """
@@ -297,10 +898,81 @@ class KnowledgeEngine(ABC):
         :param class_def:
         :return:
         """
+        return list(self.slot_index(class_def).promptable_slots)
+
+    def slot_index(self, class_def: Optional[ClassDefinition] = None) -> ClassSlotIndex:
+        """
+        Get the index of the slots of a class.
+
+        The index is built from the SchemaView on first use, and reused for
+        every line parsed and every field grounded thereafter.
+
+        :param class_def:
+        :return: index of the induced slots of the class
+        """
         if class_def is None:
             class_def = self.template_class
+        index = self.slot_indexes.get(class_def.name)
+        if index is not None:
+            return index
         sv = self.schemaview
-        return [s for s in sv.class_induced_slots(class_def.name) if not self.slot_is_skipped(s)]
+        all_classes = sv.all_classes()
+        all_enums = sv.all_enums()
+        index = ClassSlotIndex()
+        for slot in sv.class_induced_slots(class_def.name):
+            info = SlotInfo(slot=slot, inlined=bool(slot.inlined))
+            if slot.range in all_classes:
+                info.range_class = sv.get_class(slot.range)
+                info.range_slots = sv.class_slots(slot.range)
+                if not info.inlined:
+                    info.inlined = sv.get_identifier_slot(slot.range) is None
+            elif slot.range in all_enums:
+                info.enum_def = sv.get_enum(slot.range)
+                for k in info.enum_def.permissible_values.keys():
+                    if isinstance(k, str):
+                        info.enum_values.setdefault(k.lower(), k)
+            index.slots[slot.name] = info
+        # The model may pluralize field names; exact names take precedence
+        for name in index.slots:
+            index.field_names[f"{name}s"] = name
+        for name in index.slots:
+            index.field_names[name] = name
+        index.promptable_slots = [
+            info.slot for info in index.slots.values() if not self.slot_is_skipped(info.slot)
+        ]
+        self.slot_indexes[class_def.name] = index
+        return index
+
+    def all_slots_emitted_condition(
+        self, class_def: Optional[ClassDefinition] = None
+    ) -> Callable[[str], bool]:
+        """
+        Get a stop condition for completions of the given class.
+
+        The condition holds once the completion has a complete line
+        for every promptable slot, so there is nothing left to generate.
+        Its `cache_key` names the slots, so that completions cut short by it
+        are cached apart from others.
+
+        :param class_def:
+        :return: predicate over the text generated so far
+        """
+        slot_names = {s.name for s in self.promptable_slots(class_def)}
+
+        def _all_slots_emitted(text: str) -> bool:
+            if not text.endswith("\n"):
+                return False
+            fields = set()
+            for line in text.splitlines():
+                if ":" in line:
+                    field = line.split(":", 1)[0].strip().lower().replace(" ", "_")
+                    fields.add(field)
+                    fields.add(field[:-1] if field.endswith("s") else field)
+            return slot_names.issubset(fields)
+
+        key = f"all_slots_emitted:{','.join(sorted(slot_names))}"
+        _all_slots_emitted.cache_key = key  # type: ignore
+        return _all_slots_emitted
 
     def slot_is_skipped(self, slot: SlotDefinition) -> bool:
         sv = self.schemaview
@@ -312,6 +984,7 @@ class KnowledgeEngine(ABC):
         Grounds and normalizes to preferred ID prefixes.
 
         if the entity cannot be grounded and normalized, the original text is returned.
+        Results, including failures to ground, are kept in the grounding cache.
 
         :param text:
         :param class_def:
@@ -321,74 +994,232 @@ class KnowledgeEngine(ABC):
         class_def = sv.get_class(range)
         if class_def is None:
             return text
-        if ANNOTATION_KEY_EXAMPLES in class_def.annotations:
-            examples = class_def.annotations[ANNOTATION_KEY_EXAMPLES].value.split(", ")
-            examples = [x.lower() for x in examples]
-            logger.debug(f"Will exclude if in list of examples: {examples}")
-            if text.lower() in examples:
-                logger.warning(f"Likely a hallucination as it is the example set: {text}")
-                return f"LIKELY HALLUCINATION: {text}"
-        for obj_id in self.groundings(text, class_def):
-            logger.info(f"Grounding {text} to {obj_id}; next step is to normalize")
-            for normalized_id in self.normalize_identifier(obj_id, class_def):
-                if not any(e for e in self.named_entities if e.id == normalized_id):
-                    self.named_entities.append(NamedEntity(id=normalized_id, label=text))
-                logger.info(f"Normalized {text} with {obj_id} to {normalized_id}")
-                return normalized_id
+        plan = self.grounding_plan(class_def)
+        if text.lower() in plan.examples:
+            logger.warning(f"Likely a hallucination as it is the example set: {text}")
+            return f"LIKELY HALLUCINATION: {text}"
+        key = grounding_key(text, class_def.name, plan.config)
+        normalized_id = self.grounding_cache.get(key)
+        if normalized_id is NOT_CACHED:
+            state = self._thread_state()
+            state.grounding_failed = False
+            normalized_id = self._ground_and_normalize(text, class_def)
+            # Do not remember a failure to ground due to an annotator error,
+            # which may be transient
+            if normalized_id is not None or not state.grounding_failed:
+                self.grounding_cache.put(key, normalized_id, text=text, class_name=class_def.name)
+        else:
+            logger.debug(f"Using cached grounding of {text} to {class_def.name}: {normalized_id}")
+        named_entities = self.named_entity_registry()
+        if normalized_id is not None:
+            named_entities.add(NamedEntity(id=normalized_id, label=text))
+            return normalized_id
         logger.info(f"Could not ground and normalize {text} to {class_def.name}")
         if self.auto_prefix:
             obj_id = f"{self.auto_prefix}:{quote(text)}"
-            if not any(e for e in self.named_entities if e.id == obj_id):
-                self.named_entities.append(NamedEntity(id=obj_id, label=text))
+            named_entities.add(NamedEntity(id=obj_id, label=text))
         else:
             obj_id = text
-        if ANNOTATION_KEY_RECURSE in class_def.annotations:
+        if plan.recurse:
             logger.info(f"Using recursive strategy to parse: {text} to {class_def.name}")
             obj = self.extract_from_text(text, class_def).extracted_object
             if obj:
-                if self.named_entities is None:
-                    self.named_entities = []
                 try:
                     obj.id = obj_id
                 except ValueError as e:
                     logger.error(f"No id for {obj} {e}")
-                self.named_entities.append(obj)
+                named_entities.append(obj)
         return obj_id
 
-    def is_valid_identifier(self, input_id: str, class_def: ClassDefinition) -> bool:
-        sv = self.schemaview
+    def _ground_and_normalize(self, text: str, class_def: ClassDefinition) -> Optional[str]:
+        """Get the first grounding of a text that normalizes to a valid identifier, if any."""
+        for obj_id in self.groundings(text, class_def):
+            logger.info(f"Grounding {text} to {obj_id}; next step is to normalize")
+            for normalized_id in self.normalize_identifier(obj_id, class_def):
+                logger.info(f"Normalized {text} with {obj_id} to {normalized_id}")
+                return normalized_id
+        return None
+
+    def grounding_plan(self, class_def: ClassDefinition) -> GroundingPlan:
+        """
+        Get how texts are grounded to a class.
+
+        The plan is compiled from the schema and the engine's annotators on
+        first use, and reused for every text grounded to the class thereafter.
+
+        :param class_def: the class texts are grounded to
+        :return: the plan
+        """
+        plan = self.grounding_plans.get(class_def.name)
+        if plan is not None:
+            return plan
+        plan = GroundingPlan(config=self.grounding_config(class_def))
+        if ANNOTATION_KEY_EXAMPLES in class_def.annotations:
+            examples = class_def.annotations[ANNOTATION_KEY_EXAMPLES].value.split(", ")
+            plan.examples = frozenset(x.lower() for x in examples)
+            logger.debug(f"Will exclude if in list of examples: {sorted(plan.examples)}")
+        for prefix in class_def.id_prefixes or []:
+            plan.id_prefixes.setdefault(prefix.upper(), prefix)
+        annotators = self.class_annotators(class_def)
+        logger.info(f" Annotators: {annotators} [will skip: {self.skip_annotators}]")
+        for selector in annotators:
+            annotator = self.load_annotator(selector, lease=True)
+            if annotator is None:
+                continue
+            if isinstance(selector, str):
+                plan.leases.append((selector, annotator))
+            timeout = self.annotator_timeouts.get(annotator_name(selector), self.annotator_timeout)
+            planned = (selector, annotator, timeout)
+            plan.annotators.append(planned)
+            if supports_partial_matches(annotator):
+                plan.partial_annotators.append(planned)
+            else:
+                # TODO: allow more fine-grained control
+                logger.info(f"Skipping {type(annotator)} as it does not support partial matches")
+        plan.recurse = ANNOTATION_KEY_RECURSE in class_def.annotations
+        compiled = self.grounding_plans.setdefault(class_def.name, plan)
+        if compiled is not plan:
+            # compiled concurrently by another thread
+            self._release_plan(plan)
+        return compiled
+
+    def reset_grounding_plans(self) -> None:
+        """Drop the grounding plans, releasing the adapters they hold."""
+        plans, self.grounding_plans = self.grounding_plans, {}
+        for plan in plans.values():
+            self._release_plan(plan)
+
+    @staticmethod
+    def _release_plan(plan: GroundingPlan) -> None:
+        for selector, adapter in plan.leases:
+            release_shared_adapter(selector, adapter)
+        plan.leases = []
+
+    def grounding_config(self, class_def: ClassDefinition) -> str:
+        """
+        Describe what grounding a text to a class depends on, besides the text.
+
+        This is part of the key of cached groundings: the template and the
+        class's identifier prefixes, the annotators, mappers and dictionary.
+
+        :param class_def: the class texts are grounded to
+        :return: a string that changes whenever the configuration does
+        """
+        if self.dictionary and not self.dictionary_version:
+            content = "\n".join(f"{k}\t{v}" for k, v in sorted(self.dictionary.items()))
+            self.dictionary_version = hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+        def _describe(obj) -> str:
+            if isinstance(obj, MappingIndex):
+                return repr(obj)
+            return obj if isinstance(obj, str) else type(obj).__name__
+
+        return "|".join(
+            [
+                str(self.template),
+                ",".join(class_def.id_prefixes or []),
+                ",".join(_describe(a) for a in self.class_annotators(class_def)),
+                ",".join(sorted(self.skip_annotators or [])),
+                ",".join(_describe(m) for m in self.mappers or []),
+                str(self.dictionary_version if self.dictionary else None),
+                str(self.min_grounding_text_overlap),
+            ]
+        )
+
+    def identifier_validator(self, class_def: ClassDefinition) -> IdentifierValidator:
+        """
+        Get the constraints on the identifiers of a class.
+
+        These are compiled from the schema on first use, and reused for
+        every identifier checked thereafter.
+
+        :param class_def:
+        :return: the allowed prefixes, pattern and value sets
+        """
+        validator = self.identifier_validators.get(class_def.name)
+        if validator is not None:
+            return validator
+        validator = IdentifierValidator()
         if class_def.id_prefixes:
+            validator.prefixes = frozenset(class_def.id_prefixes)
+        id_slot = self.schemaview.get_identifier_slot(class_def.name)
+        if id_slot and id_slot.pattern:
+            validator.pattern = re.compile(id_slot.pattern)
+        if id_slot and id_slot.values_from:
+            validator.value_sets = list(id_slot.values_from)
+        self.identifier_validators[class_def.name] = validator
+        return validator
+
+    def value_set_expansion(self, enum_name: str) -> FrozenSet[str]:
+        """
+        Get the identifiers in the expansion of an enum.
+
+        Expansions are kept for the life of the engine and, if
+        value_set_cache_path is set, stored there for later runs, keyed by
+        the enum definition and the versions of its source ontologies.
+
+        :param enum_name: name of the enum in the template schema
+        :return: the identifiers
+        """
+        expansion = self.value_set_expansions.get(enum_name)
+        if expansion is not None:
+            return expansion
+        sv = self.schemaview
+        range_enum = sv.get_enum(enum_name)
+        cache = key = None
+        if self.value_set_cache_path:
+            cache = get_value_set_cache(self.value_set_cache_path)
+            key = value_set_key(json_dumper.dumps(range_enum), self._ontology_versions(range_enum))
+            expansion = cache.get(key)
+            if expansion is not None:
+                logger.info(f"Using cached expansion of {enum_name}: {len(expansion)} IDs")
+        if expansion is None:
+            # expanding value set for first time
+            pvs = ValueSetExpander().expand_value_set(range_enum, sv.schema)
+            expansion = frozenset(pv.text for pv in pvs)
+            logger.info(f"Expanded {enum_name} to {len(expansion)} IDs")
+            if cache is not None:
+                cache.put(key, expansion, enum_name=enum_name)
+        self.value_set_expansions[enum_name] = expansion
+        return expansion
+
+    def _ontology_versions(self, enum_def: EnumDefinition) -> List[str]:
+        """Get the versions of the ontologies an enum is drawn from, where available."""
+        queries = [enum_def.reachable_from] + [
+            expr.reachable_from for expr in (enum_def.include or []) + (enum_def.minus or [])
+        ]
+        sources = sorted({q.source_ontology for q in queries if q and q.source_ontology})
+        versions = []
+        for source in sources:
+            try:
+                adapter = get_shared_adapter(source)
+                for ontology in adapter.ontologies():
+                    for version in adapter.ontology_versions(ontology):
+                        versions.append(f"{source} {ontology} {version}")
+            except Exception as e:
+                logger.warning(f"Could not get the version of {source}: {e}")
+                versions.append(f"{source} unknown")
+        return versions
+
+    def is_valid_identifier(self, input_id: str, class_def: ClassDefinition) -> bool:
+        validator = self.identifier_validator(class_def)
+        if validator.prefixes:
             if ":" not in input_id:
                 return False
             prefix, _ = input_id.split(":", 1)
-            if prefix not in class_def.id_prefixes:
+            if prefix not in validator.prefixes:
                 logger.debug(f"ID {input_id} not in prefixes {class_def.id_prefixes}")
                 return False
-        id_slot = sv.get_identifier_slot(class_def.name)
-        if id_slot and id_slot.pattern:
-            id_regex = re.compile(id_slot.pattern)
-            m = re.match(id_regex, input_id)
-            if not m:
-                logger.debug(f"ID {input_id} does not match pattern {id_slot.pattern}")
-                return False
-        if id_slot and id_slot.values_from:
-            vse = ValueSetExpander()
-            is_found = False
-            for e in id_slot.values_from:
-                if e not in self.value_set_expansions:
-                    # expanding value set for first time
-                    range_enum = sv.get_enum(e)
-                    pvs = vse.expand_value_set(range_enum, sv.schema)
-                    valid_ids = [pv.text for pv in pvs]
-                    self.value_set_expansions[e] = valid_ids
-                    logger.info(f"Expanded {e} to {len(valid_ids)} IDs")
-                if input_id in self.value_set_expansions[e]:
-                    is_found = True
+        if validator.pattern is not None and not validator.pattern.match(input_id):
+            logger.debug(f"ID {input_id} does not match pattern {validator.pattern.pattern}")
+            return False
+        if validator.value_sets:
+            for e in validator.value_sets:
+                if input_id in self.value_set_expansion(e):
                     logger.info(f"ID {input_id} found in value set {e}")
-                    break
-            if not is_found:
-                logger.info(f"ID {input_id} not in value set {e}")
-                return False
+                    return True
+            logger.info(f"ID {input_id} not in value sets {validator.value_sets}")
+            return False
         return True
 
     def normalize_identifier(self, input_id: str, class_def: ClassDefinition) -> Iterator[str]:
@@ -427,48 +1258,68 @@ class KnowledgeEngine(ABC):
             if not self.mappers:
                 return
             for mapper in self.mappers:
-                if isinstance(mapper, MappingProviderInterface):
+                if isinstance(mapper, MappingIndex):
+                    yield from mapper.mapped_ids(input_id, class_def.id_prefixes)
+                elif isinstance(mapper, MappingProviderInterface):
                     for mapping in mapper.sssom_mappings([input_id]):
                         yield str(mapping.object_id)
                 else:
                     raise ValueError(f"Unknown mapper type {mapper}")
         except (ConnectionError, HTTPError, ProxyError) as e:
             logging.error(f"Encountered error when normalizing {input_id}: {e}")
+            self._thread_state().grounding_failed = True
             return
 
-    def groundings(self, text: str, class_def: ClassDefinition) -> Iterator[str]:
+    def class_annotators(
+        self, class_def: ClassDefinition
+    ) -> List[Union[str, TextAnnotatorInterface]]:
+        """Get the annotators for a class, as set on the engine or annotated in the schema."""
+        if self.annotators and class_def.name in self.annotators:
+            return self.annotators[class_def.name]
+        if ANNOTATION_KEY_ANNOTATORS not in class_def.annotations:
+            return []
+        return class_def.annotations[ANNOTATION_KEY_ANNOTATORS].value.split(", ")
+
+    def load_annotator(
+        self, annotator: Union[str, TextAnnotatorInterface], lease: bool = False
+    ) -> Optional[TextAnnotatorInterface]:
         """
-        Ground the given text to element identifiers.
+        Get an annotator, from the process-wide adapter registry for selectors.
 
-        This can potentially yield multiple possible alternatives; these
-        should be yielded in priority order.
+        :param annotator: an annotator, or the selector of an OAK adapter
+        :param lease: if True, keep the adapter of a selector open until
+            released with release_shared_adapter
+        :return: the annotator, or None if it is to be skipped
+        """
+        if not isinstance(annotator, str):
+            return annotator
+        if self.skip_annotators and annotator in self.skip_annotators:
+            return None
+        if lease:
+            return acquire_shared_adapter(annotator)
+        return get_shared_adapter(annotator)
+
+    def text_variants(self, text: str) -> List[str]:
+        """
+        Get the variants of a text that are grounded before the text itself.
 
-        - if there is a different singular form of the text, yield from that first
-        - dictionary exact matches are yielded first
-        - dictionary partial matches are yielded next
-        - annotators are yielded next, in order in which they are specified in the schema
+        These are its singular form, if different, then the components in
+        parentheses (or brackets), then the text with these removed.
 
-        :param text: text to ground, e.g. gene symbol
-        :param class_def: schema class the ground object should instantiate
-        :return:
+        :param text: text to ground
+        :return: the variants, lowercase, in priority order
         """
-        logger.info(f"GROUNDING {text} using {class_def.name}")
-        id_matches = re.match(r"^(\S+):(\d+)$", text)
-        if id_matches:
-            obj_prefix = id_matches.group(1)
-            matching_prefixes = [x for x in class_def.id_prefixes if x.upper() == obj_prefix.upper()]
-            if matching_prefixes:
-                yield matching_prefixes[0] + ":" + id_matches.group(2)
+        variants = []
         text_lower = text.lower()
         text_singularized = inflection.singularize(text_lower)
         if text_singularized != text_lower:
             logger.info(f"Singularized {text} to {text_singularized}")
-            yield from self.groundings(text_singularized, class_def)
+            variants.append(text_singularized)
         paren_char = "["
-        parenthetical_components = re.findall(r"\[(.*?)\]", text_lower)
+        parenthetical_components = BRACKETED_PATTERN.findall(text_lower)
         if not parenthetical_components:
             paren_char = "("
-            parenthetical_components = re.findall(r"\((.*?)\)", text_lower)
+            parenthetical_components = PARENTHESIZED_PATTERN.findall(text_lower)
         if parenthetical_components:
             logger.info(f"{text_lower} =>paren=> {parenthetical_components}")
             trimmed_text = text_lower
@@ -477,7 +1328,7 @@ class KnowledgeEngine(ABC):
                     logger.debug(
                         f"RECURSIVE GROUNDING OF {component} from {parenthetical_components}"
                     )
-                    yield from self.groundings(component, class_def)
+                    variants.append(component)
                 if paren_char == "(":
                     trimmed_text = trimmed_text.replace(f"({component})", "")
                 elif paren_char == "[":
@@ -493,52 +1344,276 @@ class KnowledgeEngine(ABC):
                 logger.debug(
                     f"{text_lower} =>trimmed=> {trimmed_text}; in {parenthetical_components}"
                 )
-                yield from self.groundings(trimmed_text, class_def)
+                variants.append(trimmed_text)
+        return variants
+
+    def named_entity_mentions(
+        self, ann: dict, class_def: ClassDefinition = None
+    ) -> Dict[str, Set[str]]:
+        """
+        Collect the texts of a parsed completion that are grounded as named entities.
+
+        This follows the fields of the response dictionary as grounding does,
+        including pairs and nested objects.
+
+        :param ann: the response dictionary
+        :param class_def: class of the response dictionary
+        :return: texts, by the name of the class they are grounded to
+        """
+        if class_def is None:
+            class_def = self.template_class
+        mentions: Dict[str, Set[str]] = {}
+        sv = self.schemaview
+
+        def _add(text: Any, range: Optional[str]) -> None:
+            if isinstance(text, str) and text and range and sv.get_class(range) is not None:
+                mentions.setdefault(range, set()).add(text)
+
+        def _collect(obj: dict, cls: ClassDefinition) -> None:
+            index = self.slot_index(cls)
+            for field_name, vals in obj.items():
+                slot_info = index.slots.get(field_name)
+                if slot_info is None:
+                    continue
+                for val in vals if isinstance(vals, list) else [vals]:
+                    if isinstance(val, tuple) and slot_info.range_class:
+                        sub_slots = list(self.slot_index(slot_info.range_class).slots.values())
+                        for sub_val, sub_slot in zip(val, sub_slots):
+                            _add(sub_val, sub_slot.slot.range)
+                    elif isinstance(val, dict) and slot_info.range_class:
+                        _collect(val, slot_info.range_class)
+                    else:
+                        _add(val, slot_info.slot.range)
+
+        if ann:
+            _collect(ann, class_def)
+        return mentions
+
+    def annotate_in_bulk(self, mentions: Dict[str, Set[str]]) -> Dict[tuple, List[str]]:
+        """
+        Query the annotators of each class once for all texts to be grounded to it.
+
+        Texts whose grounding is already cached are left out; for the others,
+        the text and its variants are sent to each annotator of the class,
+        as grounding would, but in bulk (see `annotate_texts`). Annotators are
+        queried concurrently; those failing or timing out are left to be
+        queried on demand.
+
+        :param mentions: texts, by the name of the class they are grounded to
+        :return: object ids, by annotator id, whether matching whole text, and text
+        """
+        results: Dict[tuple, List[str]] = {}
+        cache = self.grounding_cache
+        planned: Set[tuple] = set()
+        requests: List[Tuple[TextAnnotatorInterface, tuple, Future, Optional[float]]] = []
+
+        def _with_variants(text: str) -> Iterator[str]:
+            for variant in self.text_variants(text):
+                yield from _with_variants(variant)
+            yield text
+
+        for class_name, texts in mentions.items():
+            plan = self.grounding_plan(self.schemaview.get_class(class_name))
+            pending = [
+                text
+                for text in sorted(texts)
+                if cache.get(grounding_key(text, class_name, plan.config)) is NOT_CACHED
+            ]
+            if not pending:
+                continue
+            to_annotate = list(dict.fromkeys(t for text in pending for t in _with_variants(text)))
+            for matches_whole_text, config, plan_annotators in [
+                (True, WHOLE_TEXT_CONFIG, plan.annotators),
+                (False, PARTIAL_TEXT_CONFIG, plan.partial_annotators),
+            ]:
+                for selector, annotator, timeout in plan_annotators:
+                    if not supports_bulk_annotation(annotator, config):
+                        # texts are annotated on demand, as many may be grounded otherwise
+                        continue
+                    key = (id(annotator), matches_whole_text)
+                    todo = [text for text in to_annotate if key + (text,) not in planned]
+                    if not todo:
+                        continue
+                    planned.update(key + (text,) for text in todo)
+                    future = self.annotator_executor(selector).submit(
+                        annotate_texts, annotator, todo, config
+                    )
+                    deadline = None if timeout is None else time.time() + timeout
+                    requests.append((annotator, key, future, deadline))
+        for annotator, key, future, deadline in requests:
+            try:
+                timeout = None if deadline is None else max(0.0, deadline - time.time())
+                annotated = future.result(timeout=timeout)
+            except TimeoutError:
+                logger.warning(f"Timed out waiting for {annotator} to annotate in bulk")
+                future.cancel()
+                continue
+            except Exception as e:
+                logger.error(f"Error with {annotator} annotating in bulk: {e}")
+                continue
+            logger.info(f"Annotated {len(annotated)} texts with {annotator}")
+            for text, object_ids in annotated.items():
+                results[key + (text,)] = object_ids
+        return results
+
+    @contextmanager
+    def annotated_in_bulk(self, ann: dict, class_def: ClassDefinition = None):
+        """
+        Annotate the named entities of a parsed completion in bulk while it is grounded.
+
+        Within this context, `groundings` uses the annotations made in bulk
+        rather than calling the annotators for each text.
+
+        Example:
+
+            with self.annotated_in_bulk(raw, class_def):
+                obj = self.ground_annotation_object(raw, class_def)
+
+        :param ann: the response dictionary
+        :param class_def: class of the response dictionary
+        """
+        state = self._thread_state()
+        previous = getattr(state, "bulk_annotations", None)
+        prefetched = self.annotate_in_bulk(self.named_entity_mentions(ann, class_def))
+        state.bulk_annotations = {**(previous or {}), **prefetched}
+        try:
+            yield
+        finally:
+            state.bulk_annotations = previous
+
+    def groundings(self, text: str, class_def: ClassDefinition) -> Iterator[str]:
+        """
+        Ground the given text to element identifiers.
+
+        This can potentially yield multiple possible alternatives; these
+        should be yielded in priority order.
+
+        - if there is a different singular form of the text, yield from that first
+        - dictionary exact matches are yielded first
+        - dictionary partial matches are yielded next
+        - annotators are yielded next, in order in which they are specified in the schema
+
+        :param text: text to ground, e.g. gene symbol
+        :param class_def: schema class the ground object should instantiate
+        :return:
+        """
+        logger.info(f"GROUNDING {text} using {class_def.name}")
+        plan = self.grounding_plan(class_def)
+        id_matches = CURIE_TEXT_PATTERN.match(text)
+        if id_matches:
+            obj_prefix = plan.id_prefixes.get(id_matches.group(1).upper())
+            if obj_prefix:
+                yield obj_prefix + ":" + id_matches.group(2)
+        text_lower = text.lower()
+        for variant in self.text_variants(text):
+            yield from self.groundings(variant, class_def)
         if self.dictionary and text_lower in self.dictionary:
             obj_id = self.dictionary[text_lower]
             logger.debug(f"Found {text} in dictionary: {obj_id}")
             yield obj_id
         if self.dictionary:
-            for syn, obj_id in self.dictionary.items():
-                if syn in text_lower:
-                    if len(syn) / len(text_lower) > self.min_grounding_text_overlap:
-                        logger.debug(f"Found {syn} < {text} in dictionary: {obj_id}")
-                        yield obj_id
-        if self.annotators and class_def.name in self.annotators:
-            annotators = self.annotators[class_def.name]
-        else:
-            if ANNOTATION_KEY_ANNOTATORS not in class_def.annotations:
-                annotators = []
-            else:
-                annotators = class_def.annotations[ANNOTATION_KEY_ANNOTATORS].value.split(", ")
-        logger.info(f" Annotators: {annotators} [will skip: {self.skip_annotators}]")
-        # prioritize whole matches by running these first
-        for matches_whole_text in [True, False]:
-            config = TextAnnotationConfiguration(matches_whole_text=matches_whole_text)
-            for annotator in annotators:
-                if isinstance(annotator, str):
-                    if self.skip_annotators and annotator in self.skip_annotators:
+            for syn in self.synonym_index().matches(text_lower):
+                obj_id = self.dictionary.get(syn)
+                if obj_id and len(syn) / len(text_lower) > self.min_grounding_text_overlap:
+                    logger.debug(f"Found {syn} < {text} in dictionary: {obj_id}")
+                    yield obj_id
+        prefetched = getattr(self._thread_state(), "bulk_annotations", None) or {}
+        # Annotators are all queried at once, and their results yielded in order
+        # of priority, whole matches first; those not needed are cancelled
+        # once the caller stops at a grounding it accepts
+        calls: List[
+            Tuple[Any, TextAnnotatorInterface, Union[List[str], Future], Optional[float]]
+        ] = []
+        try:
+            for matches_whole_text, config, planned in [
+                (True, WHOLE_TEXT_CONFIG, plan.annotators),
+                (False, PARTIAL_TEXT_CONFIG, plan.partial_annotators),
+            ]:
+                for selector, annotator, timeout in planned:
+                    object_ids = prefetched.get((id(annotator), matches_whole_text, text))
+                    if object_ids is None:
+                        object_ids = self.annotator_executor(selector).submit(
+                            _annotated_object_ids, annotator, text, config
+                        )
+                    deadline = None if timeout is None else time.time() + timeout
+                    calls.append((selector, annotator, object_ids, deadline))
+            for selector, annotator, object_ids, deadline in calls:
+                if isinstance(object_ids, Future):
+                    try:
+                        timeout = None if deadline is None else max(0.0, deadline - time.time())
+                        object_ids = object_ids.result(timeout=timeout)
+                    except TimeoutError:
+                        logger.warning(f"Timed out waiting for {annotator} to annotate {text}")
+                        self._thread_state().grounding_failed = True
                         continue
-                    if self.annotators is None:
-                        self.annotators = {}
-                    if annotator not in self.annotators:
-                        logger.info(f"Loading annotator {annotator}")
-                        self.annotators[annotator] = get_adapter(annotator)
-                    annotator = self.annotators[annotator]
-                if not matches_whole_text and not isinstance(
-                    annotator, OntoPortalImplementationBase
-                ):
-                    # TODO: allow more fine-grained control
-                    logger.info(
-                        f"Skipping {type(annotator)} as it does not support partial matches"
-                    )
-                    continue
-                try:
-                    results = annotator.annotate_text(text, config)
-                    for result in results:
-                        yield result.object_id
-                except Exception as e:
-                    logger.error(f"Error with {annotator} for {text}: {e}")
+                    except Exception as e:
+                        logger.error(f"Error with {annotator} for {text}: {e}")
+                        self._thread_state().grounding_failed = True
+                        continue
+                yield from object_ids
+        finally:
+            for _, _, object_ids, _ in calls:
+                if isinstance(object_ids, Future):
+                    object_ids.cancel()
+
+    def annotator_executor(self, selector: Any) -> DaemonThreadPoolExecutor:
+        """
+        Get the thread pool running the requests of an annotator of this engine.
+
+        Requests still running when they time out cannot be cancelled, so
+        each annotator has its own pool: a hung service only delays its own
+        later requests. The threads are daemon threads, so a hung request
+        does not keep the process from exiting; `close` stops them.
+
+        :param selector: the annotator selector, or annotator object
+        :return: the thread pool of the annotator
+        """
+        key = selector if isinstance(selector, str) else id(selector)
+        executors = self.__dict__.get("_annotator_executors")
+        if executors is None:
+            executors = self.__dict__.setdefault("_annotator_executors", {})
+        executor = executors.get(key)
+        if executor is None:
+            executor = executors.setdefault(
+                key,
+                DaemonThreadPoolExecutor(
+                    max_workers=max(1, self.annotator_workers),
+                    thread_name_prefix=f"annotator-{annotator_name(selector)}",
+                ),
+            )
+        return executor
+
+    def lease_adapter(self, selector: str) -> BasicOntologyInterface:
+        """
+        Get a shared adapter for this engine to hold on to, keeping it open until `close`.
+
+        The registry closes adapters got with `get_shared_adapter` once others
+        are opened, so an engine keeping an adapter in an attribute leases it.
+        Each selector is leased once per engine.
+
+        :param selector: an OAK adapter selector, e.g. sqlite:obo:mondo
+        :return: the shared adapter
+        """
+        leases = self.__dict__.setdefault("_adapter_leases", {})
+        with self.__dict__.setdefault("_adapter_leases_lock", threading.Lock()):
+            adapter = leases.get(selector)
+            if adapter is None:
+                adapter = leases[selector] = acquire_shared_adapter(selector)
+        return adapter
+
+    def close(self) -> None:
+        """
+        Stop the annotator threads of this engine, cancelling requests not yet started.
+
+        The adapters leased by the engine and by its grounding plans are released.
+        """
+        executors = self.__dict__.pop("_annotator_executors", {})
+        for executor in executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+        self.reset_grounding_plans()
+        leases = self.__dict__.pop("_adapter_leases", {})
+        for selector, adapter in leases.items():
+            release_shared_adapter(selector, adapter)
 
     # def ground_text_to_id(self, text: str, class_def: ClassDefinition = None) -> str:
     #    raise NotImplementedError
@@ -7,7 +7,7 @@ from pathlib import Path
 from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
 
 from jinja2 import Template
-from oaklib import BasicOntologyInterface, get_adapter
+from oaklib import BasicOntologyInterface
 from oaklib.datamodels.vocabulary import IS_A, SKOS_RELATED_MATCH
 from oaklib.interfaces import MappingProviderInterface
 from oaklib.types import CURIE
@@ -195,10 +195,10 @@ class MappingEngine(KnowledgeEngine):
         for task in task_collection.tasks:
             if task.subject_adapter:
                 # TODO: do not mutate.
-                self.subject_adapter = get_adapter(task.subject_adapter)
+                self.subject_adapter = self.lease_adapter(task.subject_adapter)
             if task.object_adapter:
                 # TODO: do not mutate.
-                self.object_adapter = get_adapter(task.object_adapter)
+                self.object_adapter = self.lease_adapter(task.object_adapter)
             cm = self.categorize_mapping(task.subject, task.ont_object)
             yield cm
 
@@ -283,7 +283,7 @@ class MappingEngine(KnowledgeEngine):
             return curie.split(":")[0]
 
         def _get_adapter(src: str):
-            return get_adapter(f"sqlite:obo:{src.lower()}")
+            return self.lease_adapter(f"sqlite:obo:{src.lower()}")
 
         mapping.subject_source = _get_source(mapping.subject_id)
         mapping.object_source = _get_source(mapping.object_id)
@@ -6,7 +6,6 @@ from pathlib import Path
 from typing import Any, Dict, List, Optional, Union
 
 from jinja2 import Template
-from oaklib import get_adapter
 from oaklib.datamodels.text_annotator import TextAnnotationConfiguration
 from oaklib.interfaces import MappingProviderInterface, TextAnnotatorInterface
 from pydantic import BaseModel
@@ -45,7 +44,7 @@ class PhenoEngine(KnowledgeEngine):
     @property
     def mondo(self):
         if not self._mondo:
-            self._mondo = get_adapter("sqlite:obo:mondo")
+            self._mondo = self.lease_adapter("sqlite:obo:mondo")
         return self._mondo
 
     def predict_disease(
@@ -11,9 +11,10 @@ TODO: add link
 import logging
 import re
 import uuid
-from dataclasses import dataclass
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
 
 import pydantic
 import yaml
@@ -21,16 +22,16 @@ from linkml_runtime.linkml_model import ClassDefinition, SlotDefinition
 from oaklib import BasicOntologyInterface
 
 from ontollm.engines.knowledge_engine import (
-    ANNOTATION_KEY_PROMPT,
-    ANNOTATION_KEY_PROMPT_SKIP,
+    END_OF_TEXT_MARKER,
     EXAMPLE,
     FIELD,
     OBJECT,
     KnowledgeEngine,
-    chunk_text,
 )
 from ontollm.io.yaml_wrapper import dump_minimal_yaml
 from ontollm.templates.core import ExtractionResult
+from ontollm.utils.named_entities import NamedEntityRegistry
+from ontollm.utils.run_journal import content_hash
 
 this_path = Path(__file__).parent
 
@@ -39,6 +40,19 @@ RESPONSE_ATOM = Union[str, "ResponseAtom"]  # type: ignore
 RESPONSE_DICT = Dict[FIELD, Union[RESPONSE_ATOM, List[RESPONSE_ATOM]]]
 
 
+@dataclass
+class DeferredExtraction:
+    """A nested value whose recursive extraction is deferred to a batched pass.
+
+    Placeholders are created while parsing a completion, and resolved
+    together, one recursion depth at a time, by `_resolve_deferred`.
+    """
+
+    text: str
+    class_def: ClassDefinition
+    result: Optional[RESPONSE_DICT] = None
+
+
 # TODO: Enable using the system prompt in client.chat_completion for models such
 # CodeLlama7b-Instruct etc.
 # TODO: Perhaps remove method arguments such as temperature, top_p as they
@@ -62,6 +76,25 @@ class SPIRESEngine(KnowledgeEngine):
     where this value determines the maximum number of sentences per chain.
     The results are then merged together."""
 
+    streaming: bool = False
+    """If true, the completion is parsed line by line while it is being generated,
+    and each completed line is grounded (and recursively extracted) concurrently
+    with the rest of the generation."""
+
+    streaming_workers: int = 4
+    """Number of threads parsing and grounding lines of a streamed completion."""
+
+    nested_extractions: Dict[Tuple[str, str], Optional[RESPONSE_DICT]] = field(
+        default_factory=dict
+    )
+    """Parsed nested extractions, by class name and content hash of the text.
+    Shared by all documents extracted with this engine, so that a sub-text
+    recurring across a run is only sent to the model once."""
+
+    max_nested_extractions: int = 10000
+    """Number of nested extractions kept in nested_extractions;
+    beyond that, the oldest are dropped."""
+
     def extract_from_text(
         self,
         text: str,
@@ -80,31 +113,33 @@ class SPIRESEngine(KnowledgeEngine):
         :param an_object: optional stub object
         :return:
         """
-        if self.sentences_per_window:
-            chunks = chunk_text(text, self.sentences_per_window)
-            extracted_object = None
-            for chunk in chunks:
-                raw_text = self._raw_extract(chunk, class_def=class_def,
-                                             an_object=an_object,
-                                             show_prompt=show_prompt,
-                                             max_gen_len=max_gen_len,
-                                             temperature=temperature,
-                                             top_p=top_p,)
-                logging.info(f"RAW TEXT: {raw_text}")
-                next_object = self.parse_completion_payload(
-                    raw_text, class_def, an_object=an_object  # type: ignore
-                )  
-                if extracted_object is None:
-                    extracted_object = next_object
-                else:
-                    for k, v in next_object.items():
-                        if isinstance(v, list):
-                            extracted_object[k] += v
-                        else:
-                            if k not in extracted_object:
-                                extracted_object[k] = v
-                            else:
-                                extracted_object[k] = v
+        chunks = self.text_windows(text, class_def, an_object=an_object)
+        if len(chunks) > 1:
+
+            def _extract_window(chunk: str) -> Tuple[str, Optional[pydantic.BaseModel]]:
+                window_text = self._raw_extract(chunk, class_def=class_def,
+                                                an_object=an_object,
+                                                show_prompt=show_prompt,
+                                                max_gen_len=max_gen_len,
+                                                temperature=temperature,
+                                                top_p=top_p,)
+                logging.info(f"RAW TEXT: {window_text}")
+                return window_text, self.parse_completion_payload(
+                    window_text, class_def, an_object=an_object  # type: ignore
+                )
+
+            raw_text, extracted_object = self.extract_from_windows(chunks, _extract_window)
+            if chunks:
+                self.last_prompt = self.get_completion_prompt(class_def, chunks[-1],
+                                                              an_object=an_object)
+        elif self.streaming:
+            raw_text, extracted_object = self._streaming_extract(text=text, class_def=class_def,
+                                                                 show_prompt=show_prompt,
+                                                                 max_gen_len=max_gen_len,
+                                                                 temperature=temperature,
+                                                                 top_p=top_p,
+                                                                 an_object=an_object)
+            logging.info(f"RAW TEXT: {raw_text}")
         else:
             raw_text = self._raw_extract(text=text, class_def=class_def,
                                          show_prompt=show_prompt,
@@ -121,7 +156,7 @@ class SPIRESEngine(KnowledgeEngine):
             raw_completion_output=raw_text,
             prompt=self.last_prompt,
             extracted_object=extracted_object,
-            named_entities=self.named_entities,
+            named_entities=self.named_entity_registry().entities(),
         )
 
     def _extract_from_text_to_dict(self, text: str,
@@ -232,6 +267,7 @@ class SPIRESEngine(KnowledgeEngine):
             db["results"].append(result)
             db["processed_entities"].append(next_entity)
             yield result
+            named_entities = NamedEntityRegistry(result.named_entities)
             for s in iteration_slots:
                 # if s not in result.extracted_object:
                 #    raise ValueError(f"Slot {s} not found in {result.extracted_object}")
@@ -243,18 +279,16 @@ class SPIRESEngine(KnowledgeEngine):
                     vals = [vals]
                 for val in vals:
                     entity = val
-                    if result.named_entities is not None:
-                        for ne in result.named_entities:
-                            if ne.id == val:
-                                entity = ne.label
-                                if ne.id.startswith("AUTO"):
-                                    # Sometimes the value of some slots will lack
-                                    context = next_entity
-                                    context = re.sub(r"\(.*\)", "", context)
-                                    entity = f"{entity} ({context})"
-                                else:
-                                    entity = ne.id
-                                break
+                    ne = named_entities.get(val) if isinstance(val, str) else None
+                    if ne is not None:
+                        entity = ne.label
+                        if ne.id.startswith("AUTO"):
+                            # Sometimes the value of some slots will lack
+                            context = next_entity
+                            context = re.sub(r"\(.*\)", "", context)
+                            entity = f"{entity} ({context})"
+                        else:
+                            entity = ne.id
                     queue_deparenthesized = [
                         _remove_parenthetical_context(e) for e in db["entities_in_queue"]
                     ]
@@ -310,7 +344,7 @@ class SPIRESEngine(KnowledgeEngine):
             raw_completion_output=payload,
             # prompt=self.last_prompt,
             results=[prediction],
-            named_entities=self.named_entities,
+            named_entities=self.named_entity_registry().entities(),
         )
 
     def map_terms(
@@ -450,15 +484,126 @@ class SPIRESEngine(KnowledgeEngine):
         """
         prompt = self.get_completion_prompt(class_def, text, an_object=an_object)
         self.last_prompt = prompt
+        stop_condition = self.all_slots_emitted_condition(class_def)
         if max_gen_len is None:
             payload = self.client.complete(prompt, show_prompt, 
-                                           temperature=temperature, top_p=top_p)
+                                           temperature=temperature, top_p=top_p,
+                                           stop=[END_OF_TEXT_MARKER],
+                                           stop_condition=stop_condition)
         else:
             payload = self.client.complete(prompt, show_prompt,
                                            max_gen_len=max_gen_len,
-                                           temperature=temperature, top_p=top_p)
+                                           temperature=temperature, top_p=top_p,
+                                           stop=[END_OF_TEXT_MARKER],
+                                           stop_condition=stop_condition)
         return payload
 
+    def _streaming_extract(
+        self,
+        text,
+        class_def: ClassDefinition = None,
+        an_object: OBJECT = None,
+        show_prompt: bool = False,
+        max_gen_len: int = None,
+        temperature: float = 0.6,
+        top_p: float = 0.9,
+    ) -> Tuple[str, Optional[pydantic.BaseModel]]:
+        """
+        Extract annotations from the given text, parsing the completion as it streams in.
+
+        Each `field: value` line is handed to a worker thread as soon as it is
+        complete; the worker parses it (including any recursive extraction)
+        and grounds it while the client is still generating later lines.
+        The result is the same as parsing and grounding the full payload.
+
+        :param text:
+        :return: the raw completion, and the grounded object
+        """
+        if class_def is None:
+            class_def = self.template_class
+        prompt = self.get_completion_prompt(class_def, text, an_object=an_object)
+        self.last_prompt = prompt
+        completion_args: Dict[str, Any] = dict(
+            temperature=temperature,
+            top_p=top_p,
+            stop=[END_OF_TEXT_MARKER],
+            stop_condition=self.all_slots_emitted_condition(class_def),
+        )
+        if max_gen_len is not None:
+            completion_args["max_gen_len"] = max_gen_len
+        promptable_slots = self.promptable_slots(class_def)
+        futures: List[Future] = []
+        parse_failed = False
+        raw_text = ""
+        buffer = ""
+
+        def _submit(line: str, executor: ThreadPoolExecutor) -> bool:
+            line = line.strip()
+            if not line:
+                return True
+            if ":" not in line:
+                if len(promptable_slots) == 1:
+                    slot = promptable_slots[0]
+                    logging.warning(
+                        f"Coercing to YAML-like with key {slot.name}: Original line: {line}"
+                    )
+                    line = f"{slot.name}: {line}"
+                else:
+                    logging.error(f"Line '{line}' does not contain a colon; ignoring")
+                    return False
+            futures.append(executor.submit(self._parse_and_ground_line, line, class_def))
+            return True
+
+        with ThreadPoolExecutor(max_workers=self.streaming_workers) as executor:
+            for piece in self.client.complete_stream(prompt, show_prompt, **completion_args):
+                raw_text += piece
+                buffer += piece
+                *lines, buffer = buffer.split("\n")
+                for line in lines:
+                    if not parse_failed:
+                        parse_failed = not _submit(line, executor)
+            if not parse_failed:
+                parse_failed = not _submit(buffer, executor)
+            results = [f.result() for f in futures]
+        if parse_failed:
+            return raw_text, self.ground_annotation_object(None, class_def)
+        raw: Dict[str, Any] = {}
+        grounded: Dict[str, Any] = {}
+        for r in results:
+            if r is not None:
+                field_name, val, grounded_val = r
+                raw[field_name] = val
+                grounded[field_name] = grounded_val
+        if an_object:
+            raw = {**an_object, **raw}
+        self._auto_add_ids(raw, class_def)
+        new_ann = {}
+        ungrounded = {k: v for k, v in raw.items() if k not in grounded}
+        with self.annotated_in_bulk(ungrounded, class_def):
+            for field_name, vals in raw.items():
+                if field_name in grounded:
+                    new_ann[field_name] = grounded[field_name]
+                else:
+                    new_ann[field_name] = self._ground_field(field_name, vals, class_def)
+        logging.debug(f"Creating object from dict {new_ann}")
+        py_cls = self.template_module.__dict__[class_def.name]
+        return raw_text, py_cls(**new_ann)
+
+    def _parse_and_ground_line(
+        self, line: str, class_def: ClassDefinition
+    ) -> Optional[Tuple[FIELD, RESPONSE_ATOM, Any]]:
+        """Parse a single line of a completion and ground its value.
+
+        The named entities of the line are annotated in bulk, as those of
+        a whole completion are in `parse_completion_payload`.
+        """
+        r = self._parse_line_to_dict(line, class_def)
+        if r is None:
+            return None
+        field, val = r
+        with self.annotated_in_bulk({field: val}, class_def):
+            return field, val, self._ground_field(field, val, class_def)
+
     def get_completion_prompt(
         self, class_def: ClassDefinition = None, text: str = None, an_object: OBJECT = None
     ) -> str:
@@ -471,23 +616,7 @@ class SPIRESEngine(KnowledgeEngine):
             )
         else:
             prompt = "Split the following piece of text into fields in the following format:\n\n"
-        for slot in self.schemaview.class_induced_slots(class_def.name):
-            if ANNOTATION_KEY_PROMPT_SKIP in slot.annotations:
-                continue
-            if ANNOTATION_KEY_PROMPT in slot.annotations:
-                slot_prompt = slot.annotations[ANNOTATION_KEY_PROMPT].value
-            elif slot.description:
-                slot_prompt = slot.description
-            else:
-                if slot.multivalued:
-                    slot_prompt = f"semicolon-separated list of {slot.name}s"
-                else:
-                    slot_prompt = f"the value for {slot.name}"
-            if slot.range in self.schemaview.all_enums():
-                enum_def = self.schemaview.get_enum(slot.range)
-                pvs = [str(k) for k in enum_def.permissible_values.keys()]
-                slot_prompt += f"Must be one of: {', '.join(pvs)}"
-            prompt += f"{slot.name}: <{slot_prompt}>\n"
+        prompt += self.prompt_header(class_def)
         # prompt += "Do not answer if you don't know\n\n"
         prompt = f"{prompt}\n\nText:\n{text}\n\n===\n\n"
         if an_object:
@@ -502,7 +631,10 @@ class SPIRESEngine(KnowledgeEngine):
         return prompt
 
     def _parse_response_to_dict(
-        self, results: str, class_def: ClassDefinition = None
+        self,
+        results: str,
+        class_def: ClassDefinition = None,
+        deferred: List[DeferredExtraction] = None,
     ) -> Optional[RESPONSE_DICT]:
         """
         Parse the pseudo-YAML response from the LLM into a dictionary object.
@@ -516,6 +648,8 @@ class SPIRESEngine(KnowledgeEngine):
             {"foo": ["a", "b", "c"]}
 
         :param results:
+        :param deferred: if set, nested values are not extracted immediately;
+            a placeholder is returned in their place and appended to this list
         :return:
         """
         lines = results.splitlines()
@@ -535,18 +669,20 @@ class SPIRESEngine(KnowledgeEngine):
                 else:
                     logging.error(f"Line '{line}' does not contain a colon; ignoring")
                     return None
-            r = self._parse_line_to_dict(line, class_def)
+            r = self._parse_line_to_dict(line, class_def, deferred=deferred)
             if r is not None:
                 field, val = r
                 ann[field] = val
         return ann
 
     def _parse_line_to_dict(
-        self, line: str, class_def: ClassDefinition = None
+        self,
+        line: str,
+        class_def: ClassDefinition = None,
+        deferred: List[DeferredExtraction] = None,
     ) -> Optional[Tuple[FIELD, RESPONSE_ATOM]]:
         if class_def is None:
             class_def = self.template_class
-        sv = self.schemaview
         # each line is a key-value pair
         logging.info(f"PARSING LINE: {line}")
         field, val = line.split(":", 1)
@@ -554,20 +690,13 @@ class SPIRESEngine(KnowledgeEngine):
         # The LLML may mutate the output format somewhat,
         # randomly pluralizing or replacing spaces with underscores
         field = field.lower().replace(" ", "_")
-        cls_slots = sv.class_slots(class_def.name)
-        slot = None
-        if field in cls_slots:
-            slot = sv.induced_slot(field, class_def.name)
-        else:
-            # TODO: check this
-            if field.endswith("s"):
-                field = field[:-1]
-            if field in cls_slots:
-                slot = sv.induced_slot(field, class_def.name)
-        if not slot:
+        slot_info = self.slot_index(class_def).lookup(field)
+        if not slot_info:
             logging.error(f"Cannot find slot for {field} in {line}")
             # raise ValueError(f"Cannot find slot for {field} in {line}")
             return None
+        slot = slot_info.slot
+        field = slot.name
         if not val:
             msg = f"Empty value in key-value line: {line}"
             if slot.required:
@@ -575,11 +704,8 @@ class SPIRESEngine(KnowledgeEngine):
             if slot.recommended:
                 logging.warning(msg)
             return None
-        inlined = slot.inlined
-        slot_range = sv.get_class(slot.range)
-        if not inlined:
-            if slot.range in sv.all_classes():
-                inlined = sv.get_identifier_slot(slot_range.name) is None
+        inlined = slot_info.inlined
+        slot_range = slot_info.range_class
         val = val.strip()
         if slot.multivalued:
             vals = [v.strip() for v in val.split(";")]
@@ -589,12 +715,16 @@ class SPIRESEngine(KnowledgeEngine):
         logging.debug(f"SLOT: {slot.name} INL: {inlined} VALS: {vals}")
         if inlined:
             transformed = False
-            slots_of_range = sv.class_slots(slot_range.name)
+            slots_of_range = slot_info.range_slots
             if self.recurse or len(slots_of_range) > 2:
                 logging.debug(f"  RECURSING ON SLOT: {slot.name}, range={slot_range.name}")
-                vals = [
-                    self._extract_from_text_to_dict(v, slot_range) for v in vals  # type: ignore
-                ]  
+                if deferred is not None:
+                    vals = [DeferredExtraction(v, slot_range) for v in vals]  # type: ignore
+                    deferred.extend(vals)  # type: ignore
+                else:
+                    vals = [
+                        self._extract_from_text_to_dict(v, slot_range) for v in vals  # type: ignore
+                    ]
             else:
                 for sep in [" - ", ":", "/", "*", "-"]:
                     if all([sep in v for v in vals]):
@@ -629,12 +759,113 @@ class SPIRESEngine(KnowledgeEngine):
         :param object: stub object
         :return:
         """
-        raw = self._parse_response_to_dict(results, class_def)
+        deferred: List[DeferredExtraction] = []
+        raw = self._parse_response_to_dict(results, class_def, deferred=deferred)
+        self._resolve_deferred(deferred)
+        raw = self._substitute_deferred(raw)
         logging.debug(f"RAW: {raw}")
         if an_object:
             raw = {**an_object, **raw}
         self._auto_add_ids(raw, class_def)
-        return self.ground_annotation_object(raw, class_def)
+        with self.annotated_in_bulk(raw, class_def):
+            return self.ground_annotation_object(raw, class_def)
+
+    def _resolve_deferred(
+        self,
+        deferred: List[DeferredExtraction],
+        max_gen_len: int = None,
+        temperature: float = 0.6,
+        top_p: float = 0.9,
+    ) -> None:
+        """
+        Run deferred nested extractions, one recursion depth at a time.
+
+        All placeholders at a given depth are deduplicated by class and text,
+        and their prompts sent to the client in a single batch; parsing the
+        results yields the placeholders of the next depth. Texts already
+        extracted for an earlier document are taken from `nested_extractions`.
+
+        :param deferred: placeholders collected while parsing; their
+            result is set in place
+        """
+        level = deferred
+        depth = 0
+        resolved: Dict[Tuple[str, str], Optional[RESPONSE_DICT]] = {}
+        while level:
+            depth += 1
+            unique: Dict[Tuple[str, str], List[DeferredExtraction]] = {}
+            for d in level:
+                key = (d.class_def.name, content_hash(d.text))
+                if key in self.nested_extractions:
+                    d.result = self.nested_extractions[key]
+                else:
+                    unique.setdefault(key, []).append(d)
+            if not unique:
+                break
+            keys = list(unique.keys())
+            groups = list(unique.values())
+            logging.info(
+                f"Extracting {len(groups)} distinct nested objects "
+                f"({len(level)} values, {len(level) - sum(map(len, groups))} "
+                f"previously extracted) at depth {depth}"
+            )
+            prompts = [
+                self.get_completion_prompt(group[0].class_def, group[0].text) for group in groups
+            ]
+            conditions = [self.all_slots_emitted_condition(group[0].class_def) for group in groups]
+            payloads = self._complete_prompts(prompts, conditions,
+                                              max_gen_len=max_gen_len,
+                                              temperature=temperature,
+                                              top_p=top_p)
+            next_level: List[DeferredExtraction] = []
+            for key, group, payload in zip(keys, groups, payloads):
+                result = self._parse_response_to_dict(
+                    payload, group[0].class_def, deferred=next_level
+                )
+                resolved[key] = result
+                for d in group:
+                    d.result = result
+            level = next_level
+        # Only shared once fully resolved, as results still hold placeholders until then
+        self.nested_extractions.update(resolved)
+        excess = len(self.nested_extractions) - self.max_nested_extractions
+        if excess > 0:
+            for key in list(self.nested_extractions)[:excess]:
+                self.nested_extractions.pop(key, None)
+
+    def _complete_prompts(
+        self,
+        prompts: List[str],
+        stop_conditions: List[Callable[[str], bool]],
+        max_gen_len: int = None,
+        temperature: float = 0.6,
+        top_p: float = 0.9,
+    ) -> List[str]:
+        """Complete prompts together if the client supports batching, else one by one."""
+        args: Dict[str, Any] = dict(temperature=temperature, top_p=top_p,
+                                    stop=[END_OF_TEXT_MARKER])
+        if max_gen_len is not None:
+            args["max_gen_len"] = max_gen_len
+        if hasattr(self.client, "complete_batch"):
+            return self.client.complete_batch(prompts, stop_conditions=stop_conditions, **args)
+        return [
+            self.client.complete(prompt, stop_condition=condition, **args)
+            for prompt, condition in zip(prompts, stop_conditions)
+        ]
+
+    def _substitute_deferred(self, val: Any) -> Any:
+        """Replace resolved placeholders in a parsed response by their results.
+
+        New containers are built throughout, so a result shared by duplicate
+        placeholders is never aliased.
+        """
+        if isinstance(val, DeferredExtraction):
+            return self._substitute_deferred(val.result)
+        if isinstance(val, dict):
+            return {k: self._substitute_deferred(v) for k, v in val.items()}
+        if isinstance(val, list):
+            return [self._substitute_deferred(v) for v in val]
+        return val
 
     def _auto_add_ids(self, ann: RESPONSE_DICT, class_def: ClassDefinition = None) -> None:
         if ann is None:
@@ -668,62 +899,61 @@ class SPIRESEngine(KnowledgeEngine):
         logging.debug(f"Grounding annotation object {ann}")
         if class_def is None:
             class_def = self.template_class
-        sv = self.schemaview
         new_ann: Dict[str, Any] = {}
         if ann is None:
             logging.error(f"Cannot ground None annotation, class_def={class_def.name}")
             return None
-        for field, vals in ann.items():
-            if isinstance(vals, list):
-                multivalued = True
-            else:
-                multivalued = False
-                vals = [vals]
-            slot = sv.induced_slot(field, class_def.name)
-            rng_cls = sv.get_class(slot.range)
-            enum_def = None
-            if slot.range:
-                if slot.range in self.schemaview.all_enums():
-                    enum_def = self.schemaview.get_enum(slot.range)
-            new_ann[field] = []
-            logging.debug(f"FIELD: {field} SLOT: {slot.name}")
-            for val in vals:
-                if not val:
-                    continue
-                logging.debug(f"   VAL: {val}")
-                if isinstance(val, tuple):
-                    # special case for pairs
-                    sub_slots = sv.class_induced_slots(rng_cls.name)
-                    obj = {}
-                    for i in range(0, len(val)):
-                        sub_slot = sub_slots[i]
-                        sub_rng = sv.get_class(sub_slot.range)
-                        if not sub_rng:
-                            logging.error(f"Cannot find range for {sub_slot.name}")
-                        result = self.normalize_named_entity(val[i], sub_slot.range)
-                        obj[sub_slot.name] = result
-                elif isinstance(val, dict):
-                    # recurse
-                    obj = self.ground_annotation_object(val, rng_cls)
-                else:
-                    obj = self.normalize_named_entity(val, slot.range)  # type: ignore
-                if enum_def:
-                    found = False
-                    logging.info(f"Looking for {obj} in {enum_def.name}")
-                    for k, _pv in enum_def.permissible_values.items():
-                        if type(obj) is str and type(k) is str:
-                            if obj.lower() == k.lower():  # type: ignore
-                                obj = k  # type: ignore
-                                found = True
-                                break
-                    if not found:
-                        logging.info(f"Cannot find enum value for {obj} in {enum_def.name}")
-                        obj = None
-                if multivalued:
-                    new_ann[field].append(obj)
-                else:
-                    new_ann[field] = obj
+        for field_name, vals in ann.items():
+            new_ann[field_name] = self._ground_field(field_name, vals, class_def)
         logging.debug(f"Creating object from dict {new_ann}")
         logging.info(new_ann)
         py_cls = self.template_module.__dict__[class_def.name]
         return py_cls(**new_ann)
+
+    def _ground_field(self, field: FIELD, vals: Any, class_def: ClassDefinition) -> Any:
+        """Ground the parsed value(s) of a single field of a class."""
+        if isinstance(vals, list):
+            multivalued = True
+        else:
+            multivalued = False
+            vals = [vals]
+        slot_info = self.slot_index(class_def).slots.get(field)
+        if slot_info is None:
+            raise ValueError(f"No such slot {field} in class {class_def.name}")
+        slot = slot_info.slot
+        rng_cls = slot_info.range_class
+        enum_def = slot_info.enum_def
+        new_val: Any = []
+        logging.debug(f"FIELD: {field} SLOT: {slot.name}")
+        for val in vals:
+            if not val:
+                continue
+            logging.debug(f"   VAL: {val}")
+            if isinstance(val, tuple):
+                # special case for pairs
+                sub_slots = list(self.slot_index(rng_cls).slots.values())
+                obj = {}
+                for i in range(0, len(val)):
+                    sub_slot = sub_slots[i].slot
+                    sub_rng = sub_slots[i].range_class
+                    if not sub_rng:
+                        logging.error(f"Cannot find range for {sub_slot.name}")
+                    result = self.normalize_named_entity(val[i], sub_slot.range)
+                    obj[sub_slot.name] = result
+            elif isinstance(val, dict):
+                # recurse
+                obj = self.ground_annotation_object(val, rng_cls)
+            else:
+                obj = self.normalize_named_entity(val, slot.range)  # type: ignore
+            if enum_def:
+                logging.info(f"Looking for {obj} in {enum_def.name}")
+                if type(obj) is str and obj.lower() in slot_info.enum_values:
+                    obj = slot_info.enum_values[obj.lower()]
+                else:
+                    logging.info(f"Cannot find enum value for {obj} in {enum_def.name}")
+                    obj = None
+            if multivalued:
+                new_val.append(obj)
+            else:
+                new_val = obj
+        return new_val
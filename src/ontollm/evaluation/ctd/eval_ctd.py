@@ -26,7 +26,7 @@ from typing import Any, Dict, Iterable, List, Set, Tuple
 
 import yaml
 from bioc import biocxml
-from oaklib import BasicOntologyInterface, get_adapter
+from oaklib import BasicOntologyInterface
 from pydantic import BaseModel
 
 from ontollm.engines.knowledge_engine import chunk_text
@@ -38,6 +38,8 @@ from ontollm.templates.ctd import (
     Publication,
     TextWithTriples,
 )
+from ontollm.utils.adapter_registry import get_shared_adapter
+from ontollm.utils.named_entities import NamedEntityRegistry
 
 THIS_DIR = Path(__file__).parent
 DATABASE_DIR = Path(__file__).parent / "database"
@@ -193,7 +195,7 @@ class EvalCTD(SPIRESEvaluationEngine):
 
     def eval(self) -> EvaluationObjectSetRE:
         """Evaluate the ability to extract relations."""
-        labeler = get_adapter("sqlite:obo:mesh")
+        labeler = get_shared_adapter("sqlite:obo:mesh")
         if self.num_tests and isinstance(self.num_tests, int):
             num_test = self.num_tests
         else:
@@ -214,7 +216,8 @@ class EvalCTD(SPIRESEvaluationEngine):
             text = f"Title: {doc.publication.title} Abstract: {doc.publication.abstract}"
             predicted_obj = None
             named_entities: List[str] = []  # This stores the NEs for the whole document
-            ke.named_entities = []  # This stores the NEs the extractor knows about
+            # This stores the NEs the extractor knows about
+            ke.named_entities = NamedEntityRegistry()
 
             if self.chunking:
                 text_list = chunk_text(text)
@@ -13,7 +13,7 @@ import tiktoken
 import yaml
 from cachier import cachier
 from linkml_runtime.dumpers import json_dumper
-from oaklib import get_adapter, get_implementation_from_shorthand
+from oaklib import get_implementation_from_shorthand
 from oaklib.datamodels.association import Association
 from oaklib.datamodels.vocabulary import EQUIVALENT_CLASS, IS_A, PART_OF
 from oaklib.interfaces.class_enrichment_calculation_interface import (
@@ -31,6 +31,7 @@ from ontollm.engines.enrichment import ENTITY_ID, EnrichmentEngine, EnrichmentPa
 from ontollm.engines.knowledge_engine import MODEL_NAME
 from ontollm.evaluation.evaluation_engine import EvaluationEngine
 from ontollm.templates.class_enrichment import ClassEnrichmentResult
+from ontollm.utils.adapter_registry import get_shared_adapter
 from ontollm.utils.gene_set_utils import SYMBOL, GeneSet, drop_genes_from_gene_set, gene_info
 
 THIS_DIR = Path(__file__).parent
@@ -82,7 +83,7 @@ class GeneSetComparison(BaseModel):
 
 @cachier(stale_after=datetime.timedelta(days=3))
 def get_symbol_to_gene_id_map() -> Dict[SYMBOL, ENTITY_ID]:
-    hgnc = get_adapter("sqlite:obo:hgnc")
+    hgnc = get_shared_adapter("sqlite:obo:hgnc")
     label2id = {s: id.upper() for id, s in hgnc.labels(hgnc.entities())}
     return label2id
 
@@ -261,7 +262,7 @@ class EvalEnrichment(EvaluationEngine):
             objects=[term], object_closure_predicates=[IS_A, PART_OF]
         )
         gene_ids = list(set([str(assoc.subject) for assoc in assocs]))
-        hgnc = get_adapter("sqlite:obo:hgnc")
+        hgnc = get_shared_adapter("sqlite:obo:hgnc")
         gene_symbols = [hgnc.label(id) for id in gene_ids]
         gene_symbols = [str(sym) for sym in gene_symbols if sym is not None]
         if name is None:
@@ -7,7 +7,7 @@ from pathlib import Path
 from random import shuffle
 from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
-from oaklib import BasicOntologyInterface, get_adapter
+from oaklib import BasicOntologyInterface
 from oaklib.datamodels.search import SearchConfiguration
 from oaklib.datamodels.search_datamodel import SearchProperty
 from oaklib.interfaces import SearchInterface
@@ -17,6 +17,7 @@ from ontollm.clients.pubmed_client import PubmedClient
 from ontollm.engines.spires_engine import SPIRESEngine
 from ontollm.evaluation.evaluation_engine import SimilarityScore, SPIRESEvaluationEngine
 from ontollm.templates.mendelian_disease import MendelianDisease
+from ontollm.utils.adapter_registry import get_shared_adapter
 
 DATABASE_DIR = Path(__file__).parent / "database"
 TEST_CASES_DIR = Path("tests").joinpath("input")
@@ -70,7 +71,7 @@ class EvalHPOA(SPIRESEvaluationEngine):
 
     def __post_init__(self):
         self.extractor = SPIRESEngine("mendelian_disease.MendelianDisease")
-        self.mondo = get_adapter("sqlite:obo:mondo")
+        self.mondo = get_shared_adapter("sqlite:obo:mondo")
 
     def load_test_cases(self) -> List[MendelianDisease]:
         return []
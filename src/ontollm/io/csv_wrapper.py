@@ -5,9 +5,10 @@ import logging
 from pathlib import Path
 from typing import Any, List
 
-from oaklib import get_adapter
 from pydantic import BaseModel
 
+from ontollm.utils.adapter_registry import get_shared_adapter
+
 logger = logging.getLogger(__name__)
 
 
@@ -97,7 +98,7 @@ def output_parser(obj: Any, file) -> List[str]:
                 try:
                     prefix = elem[: (elem.index(":"))]
                     adapter_str = "sqlite:obo:" + str(prefix)
-                    curr_adapter = get_adapter(adapter_str)
+                    curr_adapter = get_shared_adapter(adapter_str)
                     trimmed_dict[key][index] = curr_adapter.label(elem)
                 except KeyError:
                     continue
@@ -2,11 +2,12 @@
 from dataclasses import dataclass
 from io import BytesIO
 from pathlib import Path
-from typing import Optional, TextIO, Union
+from typing import Any, Optional, TextIO, Union
 
 from linkml_runtime import SchemaView
 
-from ontollm.templates.core import ExtractionResult
+from ontollm.templates.core import ExtractionResult, NamedEntity
+from ontollm.utils.named_entities import NamedEntityRegistry
 
 
 def is_curie(s: str) -> bool:
@@ -22,3 +23,18 @@ class Exporter:
         schemaview: Optional[SchemaView],
     ):
         raise NotImplementedError
+
+    def named_entity(
+        self, value: Any, extraction_output: ExtractionResult
+    ) -> Optional[NamedEntity]:
+        """Get the named entity of an extraction with a value as CURIE, if any.
+
+        The named entities of an extraction are indexed once, on the first lookup.
+        """
+        indexed = self.__dict__.get("_named_entities")
+        if indexed is None or indexed[0] is not extraction_output:
+            indexed = (extraction_output, NamedEntityRegistry(extraction_output.named_entities))
+            self.__dict__["_named_entities"] = indexed
+        if not isinstance(value, str) or not is_curie(value):
+            return None
+        return indexed[1].get(value)
@@ -9,7 +9,7 @@ import pydantic
 import yaml
 from linkml_runtime import SchemaView
 
-from ontollm.io.exporter import Exporter, is_curie
+from ontollm.io.exporter import Exporter
 from ontollm.templates.core import ExtractionResult
 
 
@@ -88,13 +88,10 @@ class HTMLExporter(Exporter):
 
     def export_atom(self, value, extraction_output: ExtractionResult, indent: int):
         output = self.output
-        matches = [
-            ne for ne in extraction_output.named_entities if ne.id == value and is_curie(ne.id)
-        ]
+        match = self.named_entity(value, extraction_output)
         if isinstance(output, BytesIO):
             output = TextIOWrapper(output, encoding="utf-8")
-        if matches:
-            match = matches[0]
+        if match:
             output.write(f"{match.label} {self.link(match.id)}")
         else:
             output.write(str(value))
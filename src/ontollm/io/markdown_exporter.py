@@ -8,7 +8,7 @@ import pydantic
 import yaml
 from linkml_runtime import SchemaView
 
-from ontollm.io.exporter import Exporter, is_curie
+from ontollm.io.exporter import Exporter
 from ontollm.templates.core import ExtractionResult
 
 
@@ -71,12 +71,9 @@ class MarkdownExporter(Exporter):
         output.write("\n")
 
     def export_atom(self, value, extraction_output: ExtractionResult, output: TextIO, indent: int):
-        matches = [
-            ne for ne in extraction_output.named_entities if ne.id == value and is_curie(ne.id)
-        ]
+        match = self.named_entity(value, extraction_output)
         output.write(f"\n{'  ' * indent}- ")
-        if matches:
-            match = matches[0]
+        if match:
             output.write(f"{match.label} {self.link(match.id)}")
         else:
             output.write(f"{value}")
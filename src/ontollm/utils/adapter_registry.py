@@ -0,0 +1,277 @@
+"""A process-wide registry of ontology adapters, shared by selector.
+
+Opening an OAK adapter (e.g. `sqlite:obo:hp`) is slow, and each open
+sqlite adapter holds its own connections and page cache. The registry
+opens an adapter the first time its selector is asked for, then gives the
+same adapter to every engine and thread asking for it again.
+
+At most `max_open` adapters are kept open. Beyond that, the least recently
+used are closed, except those leased with `AdapterRegistry.acquire` (or
+`AdapterRegistry.lease`) and not yet released. Holders of an adapter across
+many uses, such as the grounding plans of an engine or an engine keeping an
+adapter in an attribute (see `KnowledgeEngine.lease_adapter`), lease it. Closing a
+sqlite adapter releases its connections; if it is still referenced and
+used again, they are reopened.
+
+The same adapter is used by many threads. A SQLAlchemy session is not
+thread-safe, so sqlite adapters are opened with a session per thread.
+
+Use `get_shared_adapter` in place of `oaklib.get_adapter`:
+
+    adapter = get_shared_adapter("sqlite:obo:hgnc")
+
+Besides OAK selectors, `lexical:` followed by the selector of an ontology
+opens a local annotator over its labels and synonyms (see
+`ontollm.utils.lexical_annotator`).
+"""
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List
+
+from oaklib import BasicOntologyInterface, get_adapter
+from oaklib.implementations.sqldb.sql_implementation import SqlImplementation
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_OPEN_ADAPTERS = 16
+
+
+def open_adapter(selector: str) -> BasicOntologyInterface:
+    """Open the adapter for a selector, including lexical: annotators."""
+    from ontollm.utils.lexical_annotator import LEXICAL_SELECTOR_PREFIX, open_lexical_annotator
+
+    if selector.startswith(LEXICAL_SELECTOR_PREFIX):
+        return open_lexical_annotator(selector[len(LEXICAL_SELECTOR_PREFIX) :])
+    adapter = get_adapter(selector)
+    if isinstance(adapter, SqlImplementation):
+        use_thread_local_sessions(adapter)
+    return adapter
+
+
+def use_thread_local_sessions(adapter: SqlImplementation) -> None:
+    """
+    Make a sqlite adapter use a separate SQLAlchemy session in each thread.
+
+    The adapter's session is replaced with a scoped session, which proxies
+    to the session of the calling thread, creating it on first use.
+
+    :param adapter: an OAK sql adapter
+    """
+    adapter._session = scoped_session(sessionmaker(adapter.engine))
+
+
+@dataclass
+class _Entry:
+    adapter: BasicOntologyInterface
+    leases: int = 0
+
+
+def close_adapter(adapter: Any) -> None:
+    """
+    Release the resources held by an adapter.
+
+    Adapters with a close method are closed; the sessions and engine of
+    sqlite adapters are closed and disposed of.
+
+    :param adapter: an OAK adapter
+    """
+    close = getattr(adapter, "close", None)
+    if callable(close):
+        close()
+        return
+    attributes = vars(adapter) if hasattr(adapter, "__dict__") else {}
+    session = attributes.get("_session", attributes.get("session"))
+    if isinstance(session, scoped_session):
+        session.remove()
+    elif session is not None and hasattr(session, "close"):
+        session.close()
+    engine = attributes.get("engine")
+    if engine is not None and hasattr(engine, "dispose"):
+        engine.dispose()
+
+
+class AdapterRegistry:
+    """Adapters by selector, opened lazily and closed least recently used first."""
+
+    def __init__(
+        self,
+        max_open: int = DEFAULT_MAX_OPEN_ADAPTERS,
+        opener: Callable[[str], BasicOntologyInterface] = open_adapter,
+    ):
+        """
+        :param max_open: number of adapters kept open, besides those leased
+        :param opener: opens the adapter for a selector
+        """
+        self._max_open = max_open
+        self._opener = opener
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._opening: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, selector: str) -> bool:
+        return selector in self._entries
+
+    @property
+    def max_open(self) -> int:
+        """Number of adapters kept open, besides those leased."""
+        return self._max_open
+
+    @max_open.setter
+    def max_open(self, max_open: int) -> None:
+        with self._lock:
+            self._max_open = max_open
+            evicted = self._evict()
+        self._close(evicted)
+
+    def get(self, selector: str) -> BasicOntologyInterface:
+        """
+        Get the adapter for a selector, opening it if needed.
+
+        Threads asking for the same selector while it is opened wait for
+        it, rather than opening it again.
+
+        :param selector: an OAK adapter selector, e.g. sqlite:obo:hp
+        :return: the shared adapter
+        """
+        return self._get(selector, lease=False)
+
+    def acquire(self, selector: str) -> BasicOntologyInterface:
+        """
+        Get the adapter for a selector, keeping it open until released.
+
+        Each call must be matched by a call to `release`.
+
+        :param selector: an OAK adapter selector, e.g. sqlite:obo:hp
+        :return: the shared adapter
+        """
+        return self._get(selector, lease=True)
+
+    def release(self, selector: str, adapter: BasicOntologyInterface) -> None:
+        """
+        Release an adapter acquired with `acquire`, letting it be closed once unused.
+
+        :param selector: the selector the adapter was acquired with
+        :param adapter: the adapter
+        """
+        with self._lock:
+            entry = self._entries.get(selector)
+            if entry is not None and entry.adapter is adapter and entry.leases > 0:
+                entry.leases -= 1
+            evicted = self._evict()
+        self._close(evicted)
+
+    @contextmanager
+    def lease(self, selector: str) -> Iterator[BasicOntologyInterface]:
+        """Get the adapter for a selector, keeping it open while in use."""
+        adapter = self.acquire(selector)
+        try:
+            yield adapter
+        finally:
+            self.release(selector, adapter)
+
+    def _get(self, selector: str, lease: bool) -> BasicOntologyInterface:
+        with self._lock:
+            adapter = self._reuse(selector, lease)
+            if adapter is not None:
+                return adapter
+            opening = self._opening.setdefault(selector, threading.Lock())
+        with opening:
+            with self._lock:
+                adapter = self._reuse(selector, lease)
+                if adapter is not None:
+                    return adapter
+            logger.info(f"Opening adapter {selector}")
+            adapter = self._opener(selector)
+            with self._lock:
+                self._entries[selector] = _Entry(adapter, leases=1 if lease else 0)
+                self._opening.pop(selector, None)
+                evicted = self._evict()
+        self._close(evicted)
+        return adapter
+
+    def _reuse(self, selector: str, lease: bool):
+        """Get an open adapter, marking it most recently used; call with the lock held."""
+        entry = self._entries.get(selector)
+        if entry is None:
+            return None
+        self._entries.move_to_end(selector)
+        if lease:
+            entry.leases += 1
+        return entry.adapter
+
+    def _evict(self) -> List[tuple]:
+        """Remove least recently used adapters over the limit; call with the lock held."""
+        evicted = []
+        excess = len(self._entries) - self._max_open
+        for selector in list(self._entries):
+            if excess <= 0:
+                break
+            if self._entries[selector].leases > 0:
+                continue
+            evicted.append((selector, self._entries.pop(selector).adapter))
+            excess -= 1
+        return evicted
+
+    def _close(self, evicted: List[tuple]) -> None:
+        for selector, adapter in evicted:
+            logger.info(f"Closing adapter {selector}")
+            try:
+                close_adapter(adapter)
+            except Exception as e:
+                logger.warning(f"Error closing adapter {selector}: {e}")
+
+    def close(self, selector: str) -> bool:
+        """
+        Close the adapter for a selector, even if leased.
+
+        :return: True if the adapter was open
+        """
+        with self._lock:
+            entry = self._entries.pop(selector, None)
+        if entry is None:
+            return False
+        self._close([(selector, entry.adapter)])
+        return True
+
+    def close_all(self) -> None:
+        """Close all adapters."""
+        with self._lock:
+            evicted = [(selector, entry.adapter) for selector, entry in self._entries.items()]
+            self._entries.clear()
+        self._close(evicted)
+
+
+_registry = AdapterRegistry()
+
+
+def adapter_registry() -> AdapterRegistry:
+    """Get the process-wide adapter registry."""
+    return _registry
+
+
+def get_shared_adapter(selector: str) -> BasicOntologyInterface:
+    """Get the adapter for a selector from the process-wide registry."""
+    return _registry.get(selector)
+
+
+def acquire_shared_adapter(selector: str) -> BasicOntologyInterface:
+    """Get the adapter for a selector from the process-wide registry, until released."""
+    return _registry.acquire(selector)
+
+
+def release_shared_adapter(selector: str, adapter: BasicOntologyInterface) -> None:
+    """Release an adapter acquired with `acquire_shared_adapter`."""
+    _registry.release(selector, adapter)
+
+
+@atexit.register
+def _close_adapters():
+    _registry.close_all()
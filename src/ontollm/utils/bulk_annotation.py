@@ -0,0 +1,219 @@
+"""Annotating many short texts, such as the named entities of a completion, at once.
+
+Rather than one `annotate_text` call per text, `annotate_texts` sends all
+texts to an annotator in as few requests as it supports:
+
+- annotators with their own `annotate_texts` method are called once;
+- sqlite (semantic-sql) adapters are queried for whole-text matches of
+  labels and exact synonyms, with batched `IN` queries;
+- OntoPortal annotators (e.g. BioPortal) are sent the texts joined into
+  one text per request, and annotations are assigned back to each text by
+  their offsets;
+- other annotators are called once per distinct text.
+
+`InMemoryTextAnnotator` is a local annotator over a fixed set of labels,
+supporting bulk annotation, for use in tests and with small vocabularies.
+"""
+import logging
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from oaklib.datamodels.text_annotator import TextAnnotation, TextAnnotationConfiguration
+from oaklib.datamodels.vocabulary import HAS_EXACT_SYNONYM, LABEL_PREDICATE
+from oaklib.implementations import OntoPortalImplementationBase
+from oaklib.implementations.sqldb.sql_implementation import SqlImplementation
+
+from ontollm.utils.dictionary_index import DictionaryIndex
+
+logger = logging.getLogger(__name__)
+
+# Texts per batched query to a sqlite adapter, below sqlite's limit on variables
+SQL_BATCH_SIZE = 500
+
+# Characters per joined request to a remote annotator, as texts are sent in the URL
+MAX_JOINED_CHARS = 4000
+
+# Separates texts joined into one request
+JOINED_TEXT_SEPARATOR = "\n\n"
+
+# Annotation and text offsets in OntoPortal annotations start at 1
+ONTOPORTAL_OFFSET_BASE = 1
+
+
+def supports_partial_matches(annotator: Any) -> bool:
+    """Check if an annotator finds entities within a text, not only whole-text matches."""
+    return isinstance(annotator, OntoPortalImplementationBase) or getattr(
+        annotator, "supports_partial_matches", False
+    )
+
+
+def supports_bulk_annotation(annotator: Any, configuration: TextAnnotationConfiguration) -> bool:
+    """Check if annotate_texts sends texts to an annotator in fewer requests than texts."""
+    return (
+        hasattr(annotator, "annotate_texts")
+        or isinstance(annotator, OntoPortalImplementationBase)
+        or (isinstance(annotator, SqlImplementation) and configuration.matches_whole_text)
+    )
+
+
+def annotate_texts(
+    annotator: Any, texts: Iterable[str], configuration: TextAnnotationConfiguration
+) -> Dict[str, List[str]]:
+    """
+    Annotate texts in as few requests to the annotator as possible.
+
+    :param annotator: an OAK text annotator, or any object with annotate_texts
+    :param texts: the texts to annotate; duplicates are annotated once
+    :param configuration: as for annotate_text
+    :return: identifiers of the objects annotated in each text, in the
+        order the annotator gives them
+    """
+    texts = list(dict.fromkeys(t for t in texts if t))
+    if not texts:
+        return {}
+    if hasattr(annotator, "annotate_texts"):
+        return annotator.annotate_texts(texts, configuration)
+    if isinstance(annotator, SqlImplementation) and configuration.matches_whole_text:
+        return _annotate_texts_sql(annotator, texts)
+    if isinstance(annotator, OntoPortalImplementationBase):
+        return _annotate_texts_joined(annotator, texts, configuration)
+    return {
+        text: [a.object_id for a in annotator.annotate_text(text, configuration)]
+        for text in texts
+    }
+
+
+def _annotate_texts_sql(annotator: SqlImplementation, texts: List[str]) -> Dict[str, List[str]]:
+    """Match texts to labels, then exact synonyms, ignoring case, in batched queries."""
+    from semsql.sqla.semsql import Statements
+    from sqlalchemy import func
+
+    predicates = [LABEL_PREDICATE, HAS_EXACT_SYNONYM]
+    texts_by_value: Dict[str, List[str]] = defaultdict(list)
+    for text in texts:
+        texts_by_value[text.lower()].append(text)
+    values = list(texts_by_value)
+    matches: Dict[str, List[tuple]] = defaultdict(list)
+    for i in range(0, len(values), SQL_BATCH_SIZE):
+        batch = values[i : i + SQL_BATCH_SIZE]
+        query = (
+            annotator.session.query(Statements.subject, Statements.predicate, Statements.value)
+            .filter(Statements.predicate.in_(predicates))
+            .filter(func.lower(Statements.value).in_(batch))
+        )
+        for subject, predicate, value in query:
+            matches[value.lower()].append((predicates.index(predicate), subject))
+    logger.info(
+        f"Matched {len(matches)} of {len(values)} texts in {annotator} "
+        f"in {(len(values) - 1) // SQL_BATCH_SIZE + 1} queries"
+    )
+    results: Dict[str, List[str]] = {text: [] for text in texts}
+    for value, rows in matches.items():
+        object_ids = list(dict.fromkeys(subject for _, subject in sorted(rows)))
+        for text in texts_by_value.get(value, []):
+            results[text] = object_ids
+    return results
+
+
+def _joined_batches(texts: List[str]) -> Iterator[List[str]]:
+    batch: List[str] = []
+    size = 0
+    for text in texts:
+        if batch and size + len(text) > MAX_JOINED_CHARS:
+            yield batch
+            batch, size = [], 0
+        batch.append(text)
+        size += len(text) + len(JOINED_TEXT_SEPARATOR)
+    if batch:
+        yield batch
+
+
+def _annotate_texts_joined(
+    annotator: Any, texts: List[str], configuration: TextAnnotationConfiguration
+) -> Dict[str, List[str]]:
+    """Annotate texts joined into one text per request, assigning annotations by offset.
+
+    Annotations spanning more than one text are dropped; for whole-text
+    matching, only those spanning a whole text are kept.
+    """
+    results: Dict[str, List[str]] = {text: [] for text in texts}
+    partial = TextAnnotationConfiguration(matches_whole_text=False)
+    for batch in _joined_batches(texts):
+        starts = []
+        position = 0
+        for text in batch:
+            starts.append(position)
+            position += len(text) + len(JOINED_TEXT_SEPARATOR)
+        joined = JOINED_TEXT_SEPARATOR.join(batch)
+        for annotation in annotator.annotate_text(joined, partial):
+            text_index = _text_at(annotation, starts, batch)
+            if text_index is None:
+                continue
+            text = batch[text_index]
+            if configuration.matches_whole_text and not _spans_whole_text(
+                annotation, starts[text_index], text
+            ):
+                continue
+            if annotation.object_id not in results[text]:
+                results[text].append(annotation.object_id)
+    return results
+
+
+def _text_at(annotation: TextAnnotation, starts: List[int], texts: List[str]) -> Optional[int]:
+    """Get the index of the text an annotation falls within, if any."""
+    if annotation.subject_start is None or annotation.subject_end is None:
+        return None
+    start = annotation.subject_start - ONTOPORTAL_OFFSET_BASE
+    end = annotation.subject_end - ONTOPORTAL_OFFSET_BASE
+    for i in range(len(starts) - 1, -1, -1):
+        if start >= starts[i]:
+            return i if end < starts[i] + len(texts[i]) else None
+    return None
+
+
+def _spans_whole_text(annotation: TextAnnotation, start: int, text: str) -> bool:
+    return (
+        annotation.subject_start - ONTOPORTAL_OFFSET_BASE == start
+        and annotation.subject_end - ONTOPORTAL_OFFSET_BASE == start + len(text) - 1
+    )
+
+
+class InMemoryTextAnnotator:
+    """A text annotator over a fixed set of labels, matched ignoring case.
+
+    Whole-text matching looks a text up among the labels; partial matching
+    finds all labels occurring in a text, longest first.
+    """
+
+    supports_partial_matches = True
+
+    def __init__(self, labels: Dict[str, str]):
+        """
+        :param labels: object identifiers, by label or synonym
+        """
+        self.labels = {label.lower(): object_id for label, object_id in labels.items()}
+        self.index = DictionaryIndex(sorted(self.labels, key=len, reverse=True))
+        self.requests = 0
+
+    def _object_ids(self, text: str, configuration: TextAnnotationConfiguration) -> List[str]:
+        text_lower = text.lower()
+        if configuration.matches_whole_text:
+            object_id = self.labels.get(text_lower)
+            return [object_id] if object_id else []
+        return list(dict.fromkeys(self.labels[label] for label in self.index.matches(text_lower)))
+
+    def annotate_text(
+        self, text: str, configuration: TextAnnotationConfiguration = None
+    ) -> Iterator[TextAnnotation]:
+        """Annotate a text, as an OAK text annotator."""
+        self.requests += 1
+        configuration = configuration or TextAnnotationConfiguration()
+        for object_id in self._object_ids(text, configuration):
+            yield TextAnnotation(object_id=object_id)
+
+    def annotate_texts(
+        self, texts: List[str], configuration: TextAnnotationConfiguration
+    ) -> Dict[str, List[str]]:
+        """Annotate many texts in a single request."""
+        self.requests += 1
+        return {text: self._object_ids(text, configuration) for text in texts}
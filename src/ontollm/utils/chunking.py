@@ -0,0 +1,135 @@
+"""Split long texts into windows that fit a model's context.
+
+Sentences are packed greedily into windows of at most a given number of
+tokens (and, optionally, sentences). Each sentence is sent once, unless
+an overlap is requested, in which case the last few sentences of one
+window are repeated at the start of the next.
+Windows are slices of the original text, so line breaks are preserved.
+"""
+import inspect
+import logging
+import math
+import re
+from typing import Any, Callable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TOKEN_COUNTER = Callable[[str], int]
+
+# Sentence ends, keeping the punctuation with the sentence
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.?!])\s+")
+
+# Rough number of characters per token for English text with BPE tokenizers
+CHARS_PER_TOKEN = 4
+
+
+def approximate_token_count(text: str) -> int:
+    """Estimate the number of tokens in a text without a tokenizer."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def token_counter(tokenizer: Any = None) -> TOKEN_COUNTER:
+    """Get a function counting the tokens of a text with a tokenizer.
+
+    Sentencepiece-style tokenizers, whose encode takes bos and eos flags
+    (as in Llama 2), HuggingFace tokenizers, whose encode takes an
+    add_special_tokens flag, and tokenizers with a plain encode (as in
+    tiktoken) are supported; special tokens are not counted.
+
+    :param tokenizer: a tokenizer, or None to estimate counts from length
+    :return: a function from text to its number of tokens
+    """
+    if tokenizer is None:
+        return approximate_token_count
+    try:
+        parameters = inspect.signature(tokenizer.encode).parameters
+    except (TypeError, ValueError):
+        parameters = {}
+    if "add_special_tokens" in parameters:
+        return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+    if "bos" in parameters and "eos" in parameters:
+        return lambda text: len(tokenizer.encode(text, bos=False, eos=False))
+    return lambda text: len(tokenizer.encode(text))
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split a text into sentences.
+
+    Each sentence keeps its punctuation and the whitespace following it,
+    so joining the sentences gives back the original text.
+    """
+    sentences = []
+    start = 0
+    for m in SENTENCE_BOUNDARY.finditer(text):
+        sentences.append(text[start : m.end()])
+        start = m.end()
+    if start < len(text):
+        sentences.append(text[start:])
+    return sentences
+
+
+def _split_long_sentence(
+    sentence: str, max_tokens: int, count_tokens: TOKEN_COUNTER
+) -> List[str]:
+    """Split a sentence that does not fit in a window at word boundaries."""
+    pieces = []
+    current: List[str] = []
+    for word in sentence.split():
+        if current and count_tokens(" ".join(current + [word])) > max_tokens:
+            pieces.append(" ".join(current) + " ")
+            current = []
+        current.append(word)
+    if current:
+        pieces.append(" ".join(current) + " ")
+    return pieces
+
+
+def chunk_sentences(
+    text: str,
+    max_tokens: Optional[int] = None,
+    count_tokens: TOKEN_COUNTER = approximate_token_count,
+    max_sentences: Optional[int] = None,
+    overlap: int = 0,
+) -> Iterator[str]:
+    """Pack the sentences of a text into windows.
+
+    Windows are filled greedily, in order, until adding the next sentence
+    would exceed max_tokens or max_sentences. A single sentence longer than
+    max_tokens is split at word boundaries.
+    Token counts of sentences are summed, so a window may differ from the
+    budget by the few tokens of the separating spaces.
+
+    :param text: the text to split
+    :param max_tokens: maximum number of tokens per window, or None for no limit
+    :param count_tokens: function counting the tokens in a text
+    :param max_sentences: maximum number of sentences per window, or None for no limit
+    :param overlap: number of sentences at the end of a window to repeat
+        at the start of the next one
+    :return: iterator over windows, in order
+    """
+    sentences: List[str] = []
+    for sentence in split_sentences(text):
+        if max_tokens and count_tokens(sentence.strip()) > max_tokens:
+            logger.warning(f"Splitting sentence of over {max_tokens} tokens: {sentence[:50]}...")
+            sentences.extend(_split_long_sentence(sentence, max_tokens, count_tokens))
+        else:
+            sentences.append(sentence)
+    counts = [count_tokens(s) for s in sentences] if max_tokens else []
+    start = 0
+    while start < len(sentences):
+        end = start
+        total = 0
+        while end < len(sentences):
+            if max_sentences and end - start >= max_sentences:
+                break
+            if max_tokens:
+                if end > start and total + counts[end] > max_tokens:
+                    break
+                total += counts[end]
+            end += 1
+        window = "".join(sentences[start:end]).strip()
+        if window:
+            yield window
+        if end >= len(sentences):
+            break
+        start = max(start + 1, end - overlap)
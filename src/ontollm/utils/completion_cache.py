@@ -0,0 +1,290 @@
+"""A persistent cache of prompt completions, shared by all clients.
+
+Completions are stored in a sqlite database, keyed by a hash over the
+model name, the system and user prompts, and the sampling parameters,
+so that changing any of these results in a fresh completion.
+
+One connection is kept open per database file per process; use
+`get_completion_cache` rather than instantiating `CompletionCache` directly.
+
+Databases written by earlier versions keep their completions in a `cache`
+table, keyed by prompt alone, without the model or sampling parameters.
+A client may still read these for requests made with the parameters the
+entries were made with (its former defaults): a completion missing from
+the current table is then looked up there by its prompts, and copied over
+under its full key when found.
+"""
+import hashlib
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from ontollm.utils.sqlite_store import connect, shared_store
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DB = ".ontollm_cache.db"
+
+# Number of writes held in the open transaction before committing.
+COMMIT_EVERY = 32
+
+CACHE_TABLE = "completions"
+
+LEGACY_CACHE_TABLE = "cache"
+
+
+def completion_key(
+    model: Optional[str], user_prompt: str, system_prompt: Optional[str] = None, **params
+) -> str:
+    """Get the cache key for a completion request.
+
+    :param model: name of the model producing the completion
+    :param user_prompt: the prompt text
+    :param system_prompt: optional system prompt
+    :param params: sampling parameters, e.g. temperature, top_p, max_gen_len
+    :return: a hex digest
+    """
+    content = json.dumps(
+        [model, system_prompt, user_prompt, {k: v for k, v in params.items() if v is not None}],
+        sort_keys=True,
+    )
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def completion_params(
+    stop_condition: Optional[Callable[[str], bool]] = None, **params
+) -> Optional[Dict[str, Any]]:
+    """Get the parameters to key a completion on, or None if it may not be cached.
+
+    A stop condition can cut a completion short, so a completion made with
+    one is keyed on the condition's `cache_key` attribute as well. Conditions
+    without one cannot be told apart, so their completions are not cached.
+
+    :param stop_condition: predicate over the text generated so far, if any
+    :param params: sampling parameters
+    :return: the parameters, including the key of the stop condition
+    """
+    if stop_condition is None:
+        return params
+    key = getattr(stop_condition, "cache_key", None)
+    if key is None:
+        return None
+    return dict(params, stop_condition=key)
+
+
+class CompletionCache:
+    """Read-through/write-through cache of completions in a sqlite database.
+
+    The database is opened once in WAL mode and shared across threads;
+    writes are committed in batches of `commit_every` and on `flush`.
+    The table is clustered on the hashed key, so a lookup is a single
+    index probe that also yields the payload.
+    Completions of a legacy `cache` table in the same database may be
+    read through, and are migrated as they are used; the legacy table is
+    indexed on its prompts on opening.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_DB, commit_every: int = COMMIT_EVERY):
+        self.path = str(path)
+        self.commit_every = commit_every
+        self.hits = 0
+        self.misses = 0
+        self._uncommitted = 0
+        self._lock = threading.RLock()
+        logger.info(f"Caching completions to {Path(self.path).absolute()}")
+        self._connection = connect(
+            self.path,
+            [
+                f"CREATE TABLE IF NOT EXISTS {CACHE_TABLE} ("
+                "key TEXT PRIMARY KEY, model TEXT, system_prompt TEXT, user_prompt TEXT, "
+                "params TEXT, payload TEXT) WITHOUT ROWID"
+            ],
+            synchronous="NORMAL",
+        )
+        self._legacy = (
+            self._connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?",
+                (LEGACY_CACHE_TABLE,),
+            ).fetchone()
+            is not None
+        )
+        if self._legacy:
+            logger.info(f"Indexing legacy completions in {self.path}")
+            with self._lock:
+                self._connection.execute(
+                    f"CREATE INDEX IF NOT EXISTS {LEGACY_CACHE_TABLE}_prompts "
+                    f"ON {LEGACY_CACHE_TABLE} (user_prompt, system_prompt)"
+                )
+                self._connection.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        """Get the payload stored under a key, or None."""
+        with self._lock:
+            row = self._connection.execute(
+                f"SELECT payload FROM {CACHE_TABLE} WHERE key=?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return row[0]
+
+    def get_legacy(self, user_prompt: str, system_prompt: Optional[str] = None) -> Optional[str]:
+        """Get the payload stored for a prompt in the legacy table, or None."""
+        if not self._legacy:
+            return None
+        with self._lock:
+            row = self._connection.execute(
+                f"SELECT payload FROM {LEGACY_CACHE_TABLE} "
+                "WHERE user_prompt=? AND system_prompt IS ?",
+                (user_prompt, system_prompt),
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def put(
+        self,
+        key: str,
+        payload: str,
+        model: Optional[str] = None,
+        user_prompt: Optional[str] = None,
+        system_prompt: Optional[str] = None,
+        params: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """Store a payload under a key."""
+        with self._lock:
+            self._connection.execute(
+                f"INSERT OR REPLACE INTO {CACHE_TABLE} "
+                "(key, model, system_prompt, user_prompt, params, payload) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    model,
+                    system_prompt,
+                    user_prompt,
+                    json.dumps(params or {}, sort_keys=True),
+                    payload,
+                ),
+            )
+            self._uncommitted += 1
+            if self._uncommitted >= self.commit_every:
+                self.flush()
+
+    def lookup(
+        self,
+        model: Optional[str],
+        user_prompt: str,
+        system_prompt: Optional[str] = None,
+        read_legacy: bool = False,
+        **params,
+    ) -> Optional[str]:
+        """Get the cached completion for a request, or None.
+
+        :param read_legacy: if true, the request is made with the parameters
+            of the entries of the legacy table, so a completion only found
+            there is returned, and stored under the key of the request
+        """
+        key = completion_key(model, user_prompt, system_prompt, **params)
+        payload = self.get(key)
+        if payload is None and read_legacy:
+            payload = self.get_legacy(user_prompt, system_prompt)
+            if payload is not None:
+                with self._lock:
+                    self.misses -= 1
+                    self.hits += 1
+                    self.put(key, payload, model, user_prompt, system_prompt, params)
+        if payload is not None:
+            prompt_peek = str(user_prompt)[0:80].replace("\n", "\\n")
+            logger.info(f"Using cached payload for prompt: {prompt_peek}...")
+        return payload
+
+    def store(
+        self,
+        model: Optional[str],
+        user_prompt: str,
+        payload: str,
+        system_prompt: Optional[str] = None,
+        **params,
+    ) -> None:
+        """Store the completion for a request."""
+        logger.info(f"Storing payload of len: {len(payload)}")
+        self.put(
+            completion_key(model, user_prompt, system_prompt, **params),
+            payload,
+            model=model,
+            user_prompt=user_prompt,
+            system_prompt=system_prompt,
+            params=params,
+        )
+
+    def get_or_compute(
+        self,
+        model: Optional[str],
+        user_prompt: str,
+        compute: Callable[[], str],
+        system_prompt: Optional[str] = None,
+        **params,
+    ) -> str:
+        """Get the cached completion for a request, computing and storing it if absent.
+
+        Empty payloads are returned but not stored.
+        """
+        payload = self.lookup(model, user_prompt, system_prompt, **params)
+        if payload is not None:
+            return payload
+        payload = compute()
+        if payload:
+            self.store(model, user_prompt, payload, system_prompt, **params)
+        return payload
+
+    def entries(self, search_term: str = None) -> Iterator[Tuple[str, str, str]]:
+        """Yield (model, user_prompt, payload) for all cached completions.
+
+        Completions of the legacy table not yet migrated have no model.
+
+        :param search_term: if set, only entries whose prompt or payload
+            contains this (case-insensitive) are yielded
+        """
+        if search_term:
+            search_term = search_term.lower()
+        with self._lock:
+            self.flush()
+            rows = self._connection.execute(
+                f"SELECT model, user_prompt, payload FROM {CACHE_TABLE}"
+            ).fetchall()
+            if self._legacy:
+                rows += self._connection.execute(
+                    f"SELECT NULL, user_prompt, payload FROM {LEGACY_CACHE_TABLE} AS legacy "
+                    f"WHERE NOT EXISTS (SELECT 1 FROM {CACHE_TABLE} AS c "
+                    "WHERE c.user_prompt IS legacy.user_prompt "
+                    "AND c.system_prompt IS legacy.system_prompt "
+                    "AND c.payload IS legacy.payload)"
+                ).fetchall()
+        for row in rows:
+            if (
+                search_term
+                and search_term not in (row[1] or "").lower()
+                and search_term not in (row[2] or "").lower()
+            ):
+                continue
+            yield row
+
+    def flush(self) -> None:
+        """Commit any pending writes."""
+        with self._lock:
+            if self._uncommitted:
+                self._connection.commit()
+                self._uncommitted = 0
+
+    def close(self) -> None:
+        """Commit pending writes and close the connection."""
+        with self._lock:
+            self.flush()
+            self._connection.close()
+        logger.info(f"Closed completion cache {self.path}: {self.hits} hits, {self.misses} misses")
+
+
+def get_completion_cache(path: str = DEFAULT_CACHE_DB) -> CompletionCache:
+    """Get the process-wide cache for a database path, opening it if needed."""
+    return shared_store(CompletionCache, path)
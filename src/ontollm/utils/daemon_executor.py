@@ -0,0 +1,87 @@
+"""A thread pool whose threads do not hold up the exit of the process.
+
+The threads of a `concurrent.futures.ThreadPoolExecutor` are joined when
+the interpreter exits, even after `shutdown(wait=False)`, so a request
+that never returns (e.g. to a hung web service) keeps the process from
+exiting. `DaemonThreadPoolExecutor` runs tasks on daemon threads instead,
+which are abandoned at exit. Use it for requests that are waited on with a
+timeout and whose results may be given up on.
+"""
+import queue
+import threading
+from concurrent.futures import Executor, Future
+from typing import Callable, List, Optional
+
+
+class DaemonThreadPoolExecutor(Executor):
+    """Runs tasks on up to max_workers daemon threads, started as needed."""
+
+    def __init__(self, max_workers: int, thread_name_prefix: str = "daemon"):
+        """
+        :param max_workers: maximum number of threads
+        :param thread_name_prefix: prefix of the names of the threads
+        """
+        if max_workers <= 0:
+            raise ValueError(f"max_workers must be positive, not {max_workers}")
+        self.max_workers = max_workers
+        self.thread_name_prefix = thread_name_prefix
+        self._queue: "queue.SimpleQueue[Optional[tuple]]" = queue.SimpleQueue()
+        self._threads: List[threading.Thread] = []
+        self._idle = threading.Semaphore(0)
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def submit(self, fn: Callable, /, *args, **kwargs) -> Future:
+        """Schedule a call, returning its future."""
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("Cannot schedule new tasks after shutdown")
+            future: Future = Future()
+            self._queue.put((future, fn, args, kwargs))
+            if not self._idle.acquire(blocking=False) and len(self._threads) < self.max_workers:
+                thread = threading.Thread(
+                    target=self._work,
+                    name=f"{self.thread_name_prefix}_{len(self._threads)}",
+                    daemon=True,
+                )
+                thread.start()
+                self._threads.append(thread)
+            return future
+
+    def _work(self) -> None:
+        while True:
+            task = self._queue.get()
+            if task is None:
+                return
+            future, fn, args, kwargs = task
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+            del task, future
+            self._idle.release()
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        """
+        Stop accepting tasks, and stop the threads once the queued tasks are done.
+
+        :param wait: if true, wait for the threads to finish
+        :param cancel_futures: if true, cancel the queued tasks not yet started
+        """
+        with self._lock:
+            self._shutdown = True
+            if cancel_futures:
+                while True:
+                    try:
+                        task = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if task is not None:
+                        task[0].cancel()
+            for _ in self._threads:
+                self._queue.put(None)
+            threads = list(self._threads)
+        if wait:
+            for thread in threads:
+                thread.join()
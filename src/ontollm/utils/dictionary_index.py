@@ -0,0 +1,118 @@
+"""An index finding all the synonyms of a dictionary that occur in a text.
+
+The synonyms are compiled into an Aho-Corasick automaton: a trie over the
+synonyms, with failure links from each node to the longest proper suffix
+that is also in the trie, and output links to the nearest suffix that is a
+whole synonym. Matching reads the text once, so its cost depends on the
+length of the text and the number of hits, not the size of the dictionary.
+"""
+import logging
+import threading
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class DictionaryIndex:
+    """Aho-Corasick automaton over a set of synonyms.
+
+    Synonyms are matched as substrings, as given (normalize case before
+    adding them and before matching). The automaton is compiled lazily,
+    on the first match after synonyms are added, once even if several
+    threads match at the same time. Synonyms may not be added while
+    matching in other threads.
+    """
+
+    def __init__(self, synonyms: Optional[Iterable[str]] = None):
+        self._synonyms: List[str] = []
+        self._ids: Dict[str, int] = {}
+        # Trie: transitions, and the synonym ending at each node, if any
+        self._goto: List[Dict[str, int]] = [{}]
+        self._terminal: List[int] = [-1]
+        # Failure and output links of each node, or None until compiled
+        self._links: Optional[Tuple[List[int], List[int]]] = ([0], [-1])
+        self._lock = threading.Lock()
+        if synonyms:
+            for synonym in synonyms:
+                self.add(synonym)
+
+    def __len__(self) -> int:
+        return len(self._synonyms)
+
+    def __contains__(self, synonym: str) -> bool:
+        return synonym in self._ids
+
+    def add(self, synonym: str) -> None:
+        """Add a synonym, unless already there."""
+        if not synonym or synonym in self._ids:
+            return
+        with self._lock:
+            node = 0
+            for char in synonym:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._terminal.append(-1)
+                node = next_node
+            self._ids[synonym] = len(self._synonyms)
+            self._terminal[node] = len(self._synonyms)
+            self._synonyms.append(synonym)
+            self._links = None
+
+    def _compiled_links(self) -> Tuple[List[int], List[int]]:
+        """Get the failure and output links, compiling them if synonyms were added."""
+        links = self._links
+        if links is None:
+            with self._lock:
+                links = self._links
+                if links is None:
+                    links = self._links = self._compile()
+        return links
+
+    def _compile(self) -> Tuple[List[int], List[int]]:
+        """Compute failure and output links, breadth first from the root."""
+        size = len(self._goto)
+        fail = [0] * size
+        output = [-1] * size
+        queue: Deque[int] = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                fallback = fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                fail[child] = target if target != child else 0
+                suffix = fail[child]
+                if self._terminal[suffix] >= 0:
+                    output[child] = suffix
+                else:
+                    output[child] = output[suffix]
+                queue.append(child)
+        logger.debug(f"Compiled index of {len(self._synonyms)} synonyms into {size} states")
+        return fail, output
+
+    def matches(self, text: str) -> List[str]:
+        """Get the distinct synonyms occurring in a text.
+
+        :param text: the text to search
+        :return: synonyms, longest first, then in the order they were added
+        """
+        fail, output = self._compiled_links()
+        goto = self._goto
+        terminal = self._terminal
+        found = set()
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            hit = node if terminal[node] >= 0 else output[node]
+            while hit > 0:
+                found.add(terminal[hit])
+                hit = output[hit]
+        ranked: List[Tuple[int, int]] = sorted((-len(self._synonyms[i]), i) for i in found)
+        return [self._synonyms[i] for _, i in ranked]
@@ -11,9 +11,11 @@ from typing import Dict, List, Optional, Tuple, Union
 
 import requests_cache
 import yaml
-from oaklib import BasicOntologyInterface, get_adapter
+from oaklib import BasicOntologyInterface
 from pydantic import BaseModel
 
+from ontollm.utils.adapter_registry import get_shared_adapter
+
 ENTITY_ID = str
 SYMBOL = str
 DESCRIPTION = str
@@ -193,7 +195,7 @@ def fill_missing_gene_set_values(
         if not ontology_adapter:
             if not _is_human(gene_set):
                 raise ValueError("Gene set is not human and no ontology adapter was provided")
-            ontology_adapter = get_adapter("sqlite:obo:hgnc")
+            ontology_adapter = get_shared_adapter("sqlite:obo:hgnc")
             logger.info(f"Fetching ids for {len(gene_set.gene_symbols)} genes")
             gene_set.gene_ids = []
             for sym in gene_set.gene_symbols:
@@ -1,9 +1,22 @@
 """Tools for loading and working with GPT4All models."""
 
 import logging
+import threading
+from typing import Callable, List, Optional
 
 import llm
 
+from ontollm.utils.completion_cache import (
+    DEFAULT_CACHE_DB,
+    completion_params,
+    get_completion_cache,
+)
+from ontollm.utils.parse_utils import read_until_stop
+
+# A local model runs one generation at a time; concurrent callers
+# (e.g. windows of a chunked text) wait for it here.
+_model_lock = threading.Lock()
+
 
 def set_up_gpt4all_model(modelname):
     """Prepare a GPT4All model for LLM interaction."""
@@ -14,8 +27,37 @@ def set_up_gpt4all_model(modelname):
     return model
 
 
-def chain_gpt4all_model(model, prompt_text):
-    """Interact with a GPT4All model."""
-    raw_output = model.prompt(prompt_text)
-
-    return raw_output.text()
+def chain_gpt4all_model(
+    model,
+    prompt_text,
+    cache_db_path: Optional[str] = None,
+    stop: Optional[List[str]] = None,
+    stop_condition: Optional[Callable[[str], bool]] = None,
+    **options,
+):
+    """Interact with a GPT4All model.
+
+    Completions are cached in the sqlite database at cache_db_path
+    (or the default cache database), keyed on the model, prompt and options,
+    and the stop sequences and condition.
+
+    If stop sequences or a stop condition are given, the response is
+    streamed and generation is halted as soon as one is met.
+    """
+
+    def _prompt():
+        with _model_lock:
+            return _generate()
+
+    def _generate():
+        raw_output = model.prompt(prompt_text, **options)
+        if not stop and stop_condition is None:
+            return raw_output.text()
+        return read_until_stop(raw_output, stop=stop, stop_condition=stop_condition)
+
+    params = completion_params(stop_condition, stop=stop, **options)
+    if params is None:
+        return _prompt()
+    cache = get_completion_cache(cache_db_path or DEFAULT_CACHE_DB)
+    return cache.get_or_compute(getattr(model, "model_id", str(model)), prompt_text, _prompt,
+                                **params)
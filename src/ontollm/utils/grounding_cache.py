@@ -0,0 +1,177 @@
+"""A cache of the identifiers that named entities are grounded to.
+
+Grounding a string runs a cascade of dictionary lookups, annotators (often
+remote services) and identifier mappers. Results are memoized in memory,
+evicting the least recently used, and optionally persisted in a sqlite
+database, so that they carry over across runs. Strings that could not be
+grounded are cached as well, so they are not looked up again.
+
+Keys are a hash over the text, with whitespace normalized, the class it is
+grounded to, and a description of the grounding configuration (annotators,
+mappers, dictionary version), so that changing any of these results in a
+fresh grounding.
+
+One connection is kept open per database file per process; use
+`get_grounding_cache` rather than instantiating `GroundingCache` with a path.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Union
+
+from ontollm.utils.sqlite_store import connect, shared_store
+
+logger = logging.getLogger(__name__)
+
+# Number of groundings held in memory
+DEFAULT_MAX_SIZE = 50000
+
+# Number of writes held in the open transaction before committing.
+COMMIT_EVERY = 64
+
+GROUNDING_TABLE = "groundings"
+
+
+class _NotCached:
+    def __repr__(self) -> str:
+        return "NOT_CACHED"
+
+
+NOT_CACHED = _NotCached()
+"""Returned by `GroundingCache.get` for keys not in the cache,
+as None is a cached result (the text could not be grounded)."""
+
+
+def grounding_key(text: str, class_name: str, config: str = "") -> str:
+    """Get the cache key for grounding a text.
+
+    :param text: text of the named entity
+    :param class_name: name of the class the entity is grounded to
+    :param config: description of the grounding configuration
+    :return: a hex digest
+    """
+    content = json.dumps([" ".join(text.split()), class_name, config])
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class GroundingCache:
+    """Read-through/write-through cache of groundings.
+
+    Up to `max_size` groundings are held in memory; if a database path is
+    given, all are also stored there, and lookups missing in memory fall
+    back to the database. Writes are committed in batches of `commit_every`
+    and on `flush`.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_size: int = DEFAULT_MAX_SIZE,
+        commit_every: int = COMMIT_EVERY,
+    ):
+        self.path = str(path) if path else None
+        self.max_size = max_size
+        self.commit_every = commit_every
+        self.hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, Optional[str]]" = OrderedDict()
+        self._uncommitted = 0
+        self._lock = threading.RLock()
+        self._connection = None
+        if self.path:
+            logger.info(f"Caching groundings to {Path(self.path).absolute()}")
+            self._connection = connect(
+                self.path,
+                [
+                    f"CREATE TABLE IF NOT EXISTS {GROUNDING_TABLE} ("
+                    "key TEXT PRIMARY KEY, text TEXT, class_name TEXT, object_id TEXT, "
+                    "updated REAL) WITHOUT ROWID"
+                ],
+                synchronous="NORMAL",
+            )
+
+    def _remember(self, key: str, object_id: Optional[str]) -> None:
+        if self.max_size <= 0:
+            return
+        self._memory[key] = object_id
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Union[Optional[str], _NotCached]:
+        """Get the identifier cached under a key.
+
+        :return: the identifier, None if the text could not be grounded,
+            or NOT_CACHED
+        """
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+            row = None
+            if self._connection is not None:
+                row = self._connection.execute(
+                    f"SELECT object_id FROM {GROUNDING_TABLE} WHERE key=?", (key,)
+                ).fetchone()
+            if row is None:
+                self.misses += 1
+                return NOT_CACHED
+            self.hits += 1
+            self._remember(key, row[0])
+            return row[0]
+
+    def put(
+        self,
+        key: str,
+        object_id: Optional[str],
+        text: Optional[str] = None,
+        class_name: Optional[str] = None,
+    ) -> None:
+        """Cache the identifier a text is grounded to, or None if it could not be grounded."""
+        with self._lock:
+            self._remember(key, object_id)
+            if self._connection is None:
+                return
+            self._connection.execute(
+                f"INSERT OR REPLACE INTO {GROUNDING_TABLE} "
+                "(key, text, class_name, object_id, updated) VALUES (?, ?, ?, ?, ?)",
+                (key, text, class_name, object_id, time.time()),
+            )
+            self._uncommitted += 1
+            if self._uncommitted >= self.commit_every:
+                self.flush()
+
+    def clear(self) -> None:
+        """Remove all groundings, in memory and in the database."""
+        with self._lock:
+            self._memory.clear()
+            if self._connection is not None:
+                self._connection.execute(f"DELETE FROM {GROUNDING_TABLE}")
+                self._connection.commit()
+                self._uncommitted = 0
+
+    def flush(self) -> None:
+        """Commit any pending writes."""
+        with self._lock:
+            if self._uncommitted:
+                self._connection.commit()
+                self._uncommitted = 0
+
+    def close(self) -> None:
+        """Commit pending writes and close the connection."""
+        with self._lock:
+            if self._connection is not None:
+                self.flush()
+                self._connection.close()
+                self._connection = None
+        logger.info(f"Closed grounding cache {self.path}: {self.hits} hits, {self.misses} misses")
+
+
+def get_grounding_cache(path: str, max_size: int = DEFAULT_MAX_SIZE) -> GroundingCache:
+    """Get the process-wide cache for a database path, opening it if needed."""
+    return shared_store(GroundingCache, path, max_size=max_size)
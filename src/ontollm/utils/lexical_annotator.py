@@ -0,0 +1,304 @@
+"""A local text annotator over the labels and synonyms of ontologies.
+
+Labels and exact synonyms are split into word tokens, lowercased, and
+compiled into a trie over tokens. Annotating a text walks the trie from
+each token in turn, so matches always start and end on word boundaries
+and their cost does not depend on the size of the ontology:
+
+- whole-text matching finds the entities with a label or synonym made of
+  exactly the tokens of the text;
+- partial matching finds the longest label or synonym starting at each
+  token, leftmost first, skipping the tokens it covers.
+
+The lexicon of an ontology is extracted once and kept in a sqlite
+database, rebuilt when the ontology version changes; the trie is compiled
+from it when the annotator is opened.
+
+In the `annotators` annotation of a schema class, or anywhere an adapter
+selector is accepted, use `lexical:` followed by the selector of the
+ontology, e.g. `lexical:sqlite:obo:mondo`.
+"""
+import logging
+import re
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from oaklib.datamodels.text_annotator import TextAnnotation, TextAnnotationConfiguration
+from oaklib.datamodels.vocabulary import HAS_EXACT_SYNONYM, LABEL_PREDICATE
+from oaklib.implementations.sqldb.sql_implementation import SqlImplementation
+
+from ontollm.utils.sqlite_store import connect
+
+logger = logging.getLogger(__name__)
+
+LEXICAL_SELECTOR_PREFIX = "lexical:"
+
+DEFAULT_LEXICON_DB = ".ontollm_lexicons.db"
+
+LEXICON_TABLE = "lexicon"
+LEXICON_SOURCE_TABLE = "lexicon_sources"
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Partial matches shorter than this are ignored, as short synonyms
+# (e.g. abbreviations) occur by chance in longer texts
+DEFAULT_MIN_MATCH_LENGTH = 3
+
+# Predicates of the names indexed, labels first
+LEXICAL_PREDICATES = [LABEL_PREDICATE, HAS_EXACT_SYNONYM]
+
+# Key of the object ids at the node where a name ends; never a token
+_IDS = ""
+
+# (name, object_id, predicate)
+LEXICAL_ENTRY = Tuple[str, str, str]
+
+
+def tokenize(text: str) -> List[Tuple[str, int, int]]:
+    """
+    Split a text into lowercase word tokens.
+
+    :param text: the text
+    :return: tokens, with their start and end offsets (0-based, end exclusive)
+    """
+    return [(m.group().lower(), m.start(), m.end()) for m in TOKEN_PATTERN.finditer(text)]
+
+
+class LexicalAnnotator:
+    """Text annotator over a trie of names, split into tokens."""
+
+    supports_partial_matches = True
+
+    def __init__(
+        self,
+        entries: Optional[Iterable[LEXICAL_ENTRY]] = None,
+        min_match_length: int = DEFAULT_MIN_MATCH_LENGTH,
+    ):
+        """
+        :param entries: (name, object_id, predicate) of each label or synonym
+        :param min_match_length: minimum length of partial matches, in characters
+        """
+        self.min_match_length = min_match_length
+        self._trie: dict = {}
+        self._labels: Dict[str, str] = {}
+        self._size = 0
+        for name, object_id, predicate in entries or []:
+            self.add(name, object_id, predicate)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, name: str, object_id: str, predicate: str = LABEL_PREDICATE) -> None:
+        """Add a label or synonym of an entity."""
+        tokens = [token for token, _, _ in tokenize(name)]
+        if not tokens:
+            return
+        node = self._trie
+        for token in tokens:
+            node = node.setdefault(token, {})
+        object_ids = node.setdefault(_IDS, [])
+        if not object_ids:
+            self._size += 1
+        if object_id not in object_ids:
+            object_ids.append(object_id)
+        if predicate == LABEL_PREDICATE:
+            self._labels.setdefault(object_id, name)
+
+    def _longest_match(self, tokens: List[Tuple[str, int, int]], i: int) -> Tuple[int, list]:
+        """Get the end of the longest name starting at token i, and its object ids."""
+        node = self._trie
+        end, object_ids = i, []
+        for j in range(i, len(tokens)):
+            node = node.get(tokens[j][0])
+            if node is None:
+                break
+            if _IDS in node:
+                end, object_ids = j + 1, node[_IDS]
+        return end, object_ids
+
+    def matches(
+        self, text: str, whole_text: bool = False
+    ) -> List[Tuple[int, int, List[str]]]:
+        """
+        Find the names occurring in a text.
+
+        :param text: the text
+        :param whole_text: if True, only a name made of all the tokens of the text matches
+        :return: start and end offsets (0-based, end exclusive) and object ids of each match
+        """
+        tokens = tokenize(text)
+        if not tokens:
+            return []
+        if whole_text:
+            end, object_ids = self._longest_match(tokens, 0)
+            if end != len(tokens):
+                return []
+            return [(tokens[0][1], tokens[-1][2], object_ids)]
+        results = []
+        i = 0
+        while i < len(tokens):
+            end, object_ids = self._longest_match(tokens, i)
+            if object_ids:
+                start, stop = tokens[i][1], tokens[end - 1][2]
+                if stop - start >= self.min_match_length:
+                    results.append((start, stop, object_ids))
+                    i = end
+                    continue
+            i += 1
+        return results
+
+    def annotate_text(
+        self, text: str, configuration: TextAnnotationConfiguration = None
+    ) -> Iterator[TextAnnotation]:
+        """Annotate a text, as an OAK text annotator; offsets start at 1 and are inclusive."""
+        configuration = configuration or TextAnnotationConfiguration()
+        whole_text = bool(configuration.matches_whole_text)
+        for start, end, object_ids in self.matches(text, whole_text):
+            for object_id in object_ids:
+                yield TextAnnotation(
+                    object_id=object_id,
+                    object_label=self._labels.get(object_id),
+                    subject_start=start + 1,
+                    subject_end=end,
+                    match_string=text[start:end],
+                    matches_whole_text=whole_text,
+                )
+
+    def annotate_texts(
+        self, texts: List[str], configuration: TextAnnotationConfiguration
+    ) -> Dict[str, List[str]]:
+        """Annotate many texts, giving the identifiers of the objects found in each."""
+        whole_text = bool(configuration.matches_whole_text)
+        results = {}
+        for text in texts:
+            object_ids = [i for _, _, ids in self.matches(text, whole_text) for i in ids]
+            results[text] = list(dict.fromkeys(object_ids))
+        return results
+
+
+def lexical_entries(adapter) -> Iterator[LEXICAL_ENTRY]:
+    """
+    Get the labels and exact synonyms of the entities of an ontology.
+
+    :param adapter: an OAK adapter
+    :return: iterator over (name, object_id, predicate)
+    """
+    if isinstance(adapter, SqlImplementation):
+        from semsql.sqla.semsql import Statements
+
+        query = adapter.session.query(
+            Statements.value, Statements.subject, Statements.predicate
+        ).filter(Statements.predicate.in_(LEXICAL_PREDICATES))
+        for value, subject, predicate in query:
+            if value and subject:
+                yield value, subject, predicate
+        return
+    for curie in adapter.entities():
+        for predicate, names in adapter.entity_alias_map(curie).items():
+            if predicate in LEXICAL_PREDICATES:
+                for name in names:
+                    yield name, curie, predicate
+
+
+def _ontology_version(adapter) -> str:
+    try:
+        versions = [
+            f"{ontology} {version}"
+            for ontology in adapter.ontologies()
+            for version in adapter.ontology_versions(ontology)
+        ]
+    except Exception as e:
+        logger.warning(f"Could not get the version of {adapter}: {e}")
+        return ""
+    return "; ".join(sorted(versions))
+
+
+class Lexicon:
+    """The labels and synonyms of ontologies, by source selector, in a sqlite database."""
+
+    def __init__(self, path: str = DEFAULT_LEXICON_DB):
+        self.path = str(path)
+        self._lock = threading.Lock()
+        self._connection = connect(
+            self.path,
+            [
+                f"CREATE TABLE IF NOT EXISTS {LEXICON_TABLE} ("
+                "source TEXT, name TEXT, object_id TEXT, predicate TEXT, "
+                "PRIMARY KEY (source, name, object_id, predicate)) WITHOUT ROWID",
+                f"CREATE TABLE IF NOT EXISTS {LEXICON_SOURCE_TABLE} ("
+                "source TEXT PRIMARY KEY, version TEXT, updated REAL) WITHOUT ROWID",
+            ],
+        )
+
+    def version(self, source: str) -> Optional[str]:
+        """Get the ontology version the entries of a source were extracted from, if any."""
+        with self._lock:
+            row = self._connection.execute(
+                f"SELECT version FROM {LEXICON_SOURCE_TABLE} WHERE source=?", (source,)
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def entries(self, source: str) -> List[LEXICAL_ENTRY]:
+        """Get the entries of a source, labels first."""
+        with self._lock:
+            return self._connection.execute(
+                f"SELECT name, object_id, predicate FROM {LEXICON_TABLE} WHERE source=? "
+                "ORDER BY predicate != ?",
+                (source, LABEL_PREDICATE),
+            ).fetchall()
+
+    def put(self, source: str, version: str, entries: Iterable[LEXICAL_ENTRY]) -> int:
+        """Replace the entries of a source.
+
+        :return: number of entries stored
+        """
+        rows = [(source, name, object_id, predicate) for name, object_id, predicate in entries]
+        with self._lock:
+            with self._connection:
+                self._connection.execute(f"DELETE FROM {LEXICON_TABLE} WHERE source=?", (source,))
+                self._connection.executemany(
+                    f"INSERT OR IGNORE INTO {LEXICON_TABLE} "
+                    "(source, name, object_id, predicate) VALUES (?, ?, ?, ?)",
+                    rows,
+                )
+                self._connection.execute(
+                    f"INSERT OR REPLACE INTO {LEXICON_SOURCE_TABLE} (source, version, updated) "
+                    "VALUES (?, ?, ?)",
+                    (source, version, time.time()),
+                )
+        return len(rows)
+
+    def close(self) -> None:
+        """Close the connection."""
+        with self._lock:
+            self._connection.close()
+
+
+def open_lexical_annotator(source: str, path: str = DEFAULT_LEXICON_DB) -> LexicalAnnotator:
+    """
+    Get an annotator over the labels and synonyms of an ontology.
+
+    The lexicon is extracted from the ontology unless already stored for
+    the same version of it.
+
+    :param source: selector of the ontology, e.g. sqlite:obo:mondo
+    :param path: path to the lexicon database
+    :return: the annotator
+    """
+    from ontollm.utils.adapter_registry import get_shared_adapter
+
+    lexicon = Lexicon(path)
+    try:
+        adapter = get_shared_adapter(source)
+        version = _ontology_version(adapter)
+        stored_version = lexicon.version(source)
+        if stored_version is None or (version and version != stored_version):
+            logger.info(f"Extracting the lexicon of {source} ({version or 'unknown version'})")
+            n = lexicon.put(source, version, lexical_entries(adapter))
+            logger.info(f"Stored {n} names of {source} in {path}")
+        annotator = LexicalAnnotator(lexicon.entries(source))
+    finally:
+        lexicon.close()
+    logger.info(f"Compiled {len(annotator)} names of {source}")
+    return annotator
@@ -0,0 +1,221 @@
+"""A local index of identifier mappings, for normalizing identifiers offline.
+
+Mappings are loaded from SSSOM TSV files, or from the mappings of
+ontologies in semantic-sql databases (e.g. `sqlite:obo:mondo`), into a
+sqlite database clustered on the subject CURIE. Equivalence mappings are
+indexed in both directions. Lookups can be restricted to the prefixes of
+the objects wanted, so each is a single index probe.
+
+The index is an OAK mapping provider, so it can be used wherever the
+`translator:` adapter was, without network access.
+
+Example:
+
+    index = MappingIndex("mappings.db")
+    index.load_sssom_tsv("mondo.sssom.tsv")
+    list(index.mapped_ids("DOID:2841", ["MONDO"]))
+"""
+import csv
+import logging
+import threading
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+
+from oaklib import get_adapter
+from oaklib.interfaces import MappingProviderInterface
+from sssom_schema import Mapping
+
+from ontollm.utils.sqlite_store import connect, shared_store
+
+logger = logging.getLogger(__name__)
+
+MAPPING_TABLE = "mappings"
+
+# Mappings of these predicates hold in both directions
+SYMMETRIC_PREDICATES = {
+    "skos:exactMatch",
+    "skos:closeMatch",
+    "owl:equivalentClass",
+    "oboInOwl:hasDbXref",
+}
+
+DEFAULT_JUSTIFICATION = "semapv:UnspecifiedMatching"
+
+# Rows inserted per transaction when loading
+LOAD_BATCH_SIZE = 10000
+
+# (subject_id, predicate_id, object_id, mapping_justification)
+MAPPING_ROW = Tuple[str, str, str, str]
+
+
+def _prefix(curie: str) -> str:
+    return curie.split(":", 1)[0] if ":" in curie else ""
+
+
+def read_sssom_tsv(path: Union[str, Path]) -> Iterator[MAPPING_ROW]:
+    """
+    Read the mappings of an SSSOM TSV file.
+
+    The metadata block (lines starting with #) is skipped; identifiers are
+    expected to be CURIEs.
+
+    :param path: path to the file
+    :return: iterator over (subject_id, predicate_id, object_id, mapping_justification)
+    """
+    with open(path, encoding="utf-8", newline="") as file:
+        lines = (line for line in file if not line.startswith("#"))
+        for row in csv.DictReader(lines, delimiter="\t"):
+            subject_id = row.get("subject_id")
+            object_id = row.get("object_id")
+            if not subject_id or not object_id:
+                continue
+            yield (
+                subject_id,
+                row.get("predicate_id") or "skos:exactMatch",
+                object_id,
+                row.get("mapping_justification") or row.get("match_type") or DEFAULT_JUSTIFICATION,
+            )
+
+
+class MappingIndex(MappingProviderInterface):
+    """Mappings from subject CURIEs to object CURIEs, in a sqlite database."""
+
+    def __init__(self, path: Union[str, Path]):
+        """
+        :param path: path to the sqlite database, created if absent
+        """
+        self.path = str(path)
+        self._lock = threading.Lock()
+        self._connection = connect(
+            self.path,
+            [
+                f"CREATE TABLE IF NOT EXISTS {MAPPING_TABLE} ("
+                "subject_id TEXT, object_prefix TEXT, object_id TEXT, predicate_id TEXT, "
+                "mapping_justification TEXT, "
+                "PRIMARY KEY (subject_id, object_prefix, object_id, predicate_id)) WITHOUT ROWID"
+            ],
+        )
+
+    def __repr__(self) -> str:
+        return f"MappingIndex({self.path!r})"
+
+    def load(self, mappings: Iterable[MAPPING_ROW]) -> int:
+        """
+        Add mappings to the index; equivalences are added in both directions.
+
+        :param mappings: (subject_id, predicate_id, object_id, mapping_justification)
+        :return: number of mappings read
+        """
+        n = 0
+        batch: List[tuple] = []
+        for subject_id, predicate_id, object_id, justification in mappings:
+            n += 1
+            batch.append((subject_id, _prefix(object_id), object_id, predicate_id, justification))
+            if predicate_id in SYMMETRIC_PREDICATES:
+                batch.append(
+                    (object_id, _prefix(subject_id), subject_id, predicate_id, justification)
+                )
+            if len(batch) >= LOAD_BATCH_SIZE:
+                self._insert(batch)
+                batch = []
+        self._insert(batch)
+        return n
+
+    def _insert(self, rows: List[tuple]) -> None:
+        with self._lock:
+            self._connection.executemany(
+                f"INSERT OR IGNORE INTO {MAPPING_TABLE} "
+                "(subject_id, object_prefix, object_id, predicate_id, mapping_justification) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._connection.commit()
+
+    def load_sssom_tsv(self, path: Union[str, Path]) -> int:
+        """Add the mappings of an SSSOM TSV file."""
+        n = self.load(read_sssom_tsv(path))
+        logger.info(f"Indexed {n} mappings from {path}")
+        return n
+
+    def load_adapter(self, selector: str) -> int:
+        """Add the mappings of an ontology, e.g. sqlite:obo:mondo."""
+        adapter = get_adapter(selector)
+        n = self.load(
+            (
+                str(m.subject_id),
+                str(m.predicate_id),
+                str(m.object_id),
+                str(m.mapping_justification or DEFAULT_JUSTIFICATION),
+            )
+            for m in adapter.all_sssom_mappings()
+        )
+        logger.info(f"Indexed {n} mappings from {selector}")
+        return n
+
+    def mapped_ids(
+        self, curie: str, object_prefixes: Optional[Iterable[str]] = None
+    ) -> Iterator[str]:
+        """
+        Get the identifiers a CURIE maps to.
+
+        :param curie: the subject CURIE
+        :param object_prefixes: if set, only identifiers with these prefixes are returned
+        :return: iterator over object CURIEs
+        """
+        for row in self._lookup(curie, object_prefixes):
+            yield row[1]
+
+    def _lookup(
+        self, curie: str, object_prefixes: Optional[Iterable[str]] = None
+    ) -> List[Tuple[str, str, str]]:
+        query = (
+            f"SELECT predicate_id, object_id, mapping_justification FROM {MAPPING_TABLE} "
+            "WHERE subject_id=?"
+        )
+        args: List[str] = [curie]
+        if object_prefixes:
+            object_prefixes = list(object_prefixes)
+            query += f" AND object_prefix IN ({', '.join('?' * len(object_prefixes))})"
+            args += object_prefixes
+        with self._lock:
+            return self._connection.execute(query, args).fetchall()
+
+    def sssom_mappings(
+        self, curies: Optional[Union[str, Iterable[str]]] = None, source: Optional[str] = None
+    ) -> Iterator[Mapping]:
+        """Get the mappings of CURIEs, as an OAK mapping provider.
+
+        :param curies: subject CURIEs
+        :param source: if set, only mappings to objects with this prefix are returned
+        """
+        if curies is None:
+            return
+        if isinstance(curies, str):
+            curies = [curies]
+        for curie in curies:
+            for predicate_id, object_id, justification in self._lookup(
+                curie, [source] if source else None
+            ):
+                yield Mapping(
+                    subject_id=curie,
+                    predicate_id=predicate_id,
+                    object_id=object_id,
+                    mapping_justification=justification,
+                )
+
+    def count(self) -> int:
+        """Get the number of indexed mappings, counting each direction."""
+        with self._lock:
+            return self._connection.execute(f"SELECT count(*) FROM {MAPPING_TABLE}").fetchone()[0]
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._connection.close()
+
+
+def get_mapping_index(path: Union[str, Path]) -> MappingIndex:
+    """Get the process-wide index for a database path, opening it if needed."""
+    if not Path(path).exists():
+        raise FileNotFoundError(f"No mapping index at {path}")
+    return shared_store(MappingIndex, path)
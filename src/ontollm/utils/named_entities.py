@@ -0,0 +1,84 @@
+"""A registry of the named entities known to an engine or found in an extraction."""
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+# NamedEntity, or any object extracted recursively for a named entity,
+# having an id and possibly a label
+ENTITY = Any
+
+
+class NamedEntityRegistry:
+    """Named entities in insertion order, indexed by id and by label.
+
+    Iterating gives the entities in the order they were added, so the
+    registry serializes to the same list as before. Lookups by id or label
+    give the first entity added with it.
+
+    Entities may be added by several threads at once, e.g. while grounding
+    the windows of a text concurrently.
+    """
+
+    def __init__(self, entities: Optional[Iterable[ENTITY]] = None):
+        self._entities: List[ENTITY] = []
+        self._by_id: Dict[str, ENTITY] = {}
+        self._by_label: Dict[str, ENTITY] = {}
+        self._lock = threading.Lock()
+        for entity in entities or []:
+            self._append(entity)
+
+    def __iter__(self) -> Iterator[ENTITY]:
+        return iter(self._entities)
+
+    def __len__(self) -> int:
+        return len(self._entities)
+
+    def __contains__(self, entity_id: str) -> bool:
+        return entity_id in self._by_id
+
+    def __repr__(self) -> str:
+        return f"NamedEntityRegistry({self._entities!r})"
+
+    def append(self, entity: ENTITY) -> None:
+        """Add an entity, even if another has the same id."""
+        with self._lock:
+            self._append(entity)
+
+    def _append(self, entity: ENTITY) -> None:
+        self._entities.append(entity)
+        entity_id = getattr(entity, "id", None)
+        if entity_id is not None:
+            self._by_id.setdefault(entity_id, entity)
+        label = getattr(entity, "label", None)
+        if isinstance(label, str):
+            self._by_label.setdefault(label.lower(), entity)
+
+    def add(self, entity: ENTITY) -> bool:
+        """Add an entity, unless one with the same id was already added.
+
+        :return: True if the entity was added
+        """
+        with self._lock:
+            if getattr(entity, "id", None) in self._by_id:
+                return False
+            self._append(entity)
+            return True
+
+    def get(self, entity_id: str) -> Optional[ENTITY]:
+        """Get the first entity added with an id."""
+        return self._by_id.get(entity_id)
+
+    def get_by_label(self, label: str) -> Optional[ENTITY]:
+        """Get the first entity added with a label, ignoring case."""
+        return self._by_label.get(label.lower())
+
+    def entities(self) -> List[ENTITY]:
+        """Get the entities, in the order they were added."""
+        with self._lock:
+            return list(self._entities)
+
+    def clear(self) -> None:
+        """Remove all entities."""
+        with self._lock:
+            self._entities.clear()
+            self._by_id.clear()
+            self._by_label.clear()
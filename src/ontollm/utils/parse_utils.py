@@ -1,5 +1,5 @@
 """Utilities for parsing text."""
-from typing import List
+from typing import Callable, Iterable, List, Optional, Sequence
 
 
 def split_on_one_of(text: str, separators: List[str]) -> List[str]:
@@ -8,3 +8,89 @@ def split_on_one_of(text: str, separators: List[str]) -> List[str]:
         if sep in text:
             return text.split(sep)
     return [text]
+
+
+def find_stop_sequence(text: str, stop: Optional[List[str]]) -> Optional[int]:
+    """Find the position of the earliest stop sequence in text, or None."""
+    positions = [text.find(s) for s in stop or [] if s]
+    positions = [p for p in positions if p >= 0]
+    return min(positions) if positions else None
+
+
+def read_until_stop(
+    chunks: Iterable[str],
+    stop: Optional[List[str]] = None,
+    stop_condition: Optional[Callable[[str], bool]] = None,
+) -> str:
+    """Concatenate streamed chunks of generated text, halting early.
+
+    Reading stops as soon as one of the stop sequences appears, in which case
+    the text is truncated before it, or as soon as stop_condition returns
+    True for the text read so far.
+
+    :param chunks: generated text, e.g. one token at a time
+    :param stop: stop sequences
+    :param stop_condition: predicate over the text generated so far
+    :return: the generated text
+    """
+    text = ""
+    lookback = max([len(s) for s in stop or []] + [0])
+    for chunk in chunks:
+        start = max(0, len(text) - lookback)
+        text += chunk
+        pos = find_stop_sequence(text[start:], stop)
+        if pos is not None:
+            return text[: start + pos]
+        if stop_condition is not None and stop_condition(text):
+            break
+    return text
+
+
+class IncrementalDecoder:
+    """Decodes generated tokens into text one token at a time.
+
+    The text of a token can depend on the tokens before it (e.g. the leading
+    space of a SentencePiece token, or a character split over several
+    tokens), so each new token is decoded together with the previous piece,
+    keeping only the text it adds. Each step decodes a few tokens, however
+    long the generated text is.
+    """
+
+    def __init__(self, decode: Callable[[Sequence[int]], str]):
+        """
+        :param decode: decodes a list of token ids, e.g. tokenizer.decode
+        """
+        self.decode = decode
+        self.tokens: List[int] = []
+        self.text = ""
+        self._prefix_offset = 0
+        self._read_offset = 0
+
+    def push(self, token: int) -> str:
+        """
+        Add a generated token.
+
+        :param token: the token id
+        :return: the text added, empty while a character is incomplete
+        """
+        self.tokens.append(token)
+        return self._read(final=False)
+
+    def flush(self) -> str:
+        """
+        Decode any tokens held back as incomplete.
+
+        :return: the text added
+        """
+        return self._read(final=True)
+
+    def _read(self, final: bool) -> str:
+        prefix = self.decode(self.tokens[self._prefix_offset : self._read_offset])
+        text = self.decode(self.tokens[self._prefix_offset :])
+        if not final and (len(text) <= len(prefix) or text.endswith("\ufffd")):
+            return ""
+        added = text[len(prefix) :]
+        self._prefix_offset = self._read_offset
+        self._read_offset = len(self.tokens)
+        self.text += added
+        return added
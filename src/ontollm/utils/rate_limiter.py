@@ -0,0 +1,42 @@
+"""Limiting the rate of requests to a web service, across threads.
+
+The limiter is a token bucket: tokens accumulate at the allowed rate, up
+to the burst size, and each request takes one. A request finding no token
+reserves the next one and waits for it, so concurrent requests are spaced
+out evenly rather than retried.
+"""
+import threading
+import time
+
+
+class RateLimiter:
+    """Token bucket allowing a number of requests per second, shared across threads."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        :param rate: requests allowed per second
+        :param burst: requests allowed at once after a pause
+        """
+        if rate <= 0:
+            raise ValueError(f"Rate must be positive, not {rate}")
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """
+        Wait until a request may be made.
+
+        :return: seconds waited
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
@@ -0,0 +1,179 @@
+"""A journal of the documents processed by a corpus extraction run.
+
+For each input document of a run, the journal records a hash of its
+input id and text, its status and, once its results are written, the
+offset of the output at that point. Rerunning with the same run id skips
+documents already written, retries those that failed or never finished,
+and appends to the existing output. Identical texts under different input
+ids are distinct documents, each with its own results.
+
+The journal also keeps, for each output of a run, the offset up to which
+it holds complete results, so that results partly written when a run was
+killed can be truncated away before appending to it.
+"""
+import hashlib
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from ontollm.utils.sqlite_store import connect
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOURNAL_DB = ".ontollm_runs.db"
+
+JOURNAL_TABLE = "documents"
+OUTPUT_TABLE = "outputs"
+
+STATUS_STARTED = "started"
+STATUS_FAILED = "failed"
+STATUS_DONE = "done"
+
+
+def input_hash(text: str) -> str:
+    """Get the hash identifying an input document by its text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def document_key(text: str, input_id: Optional[str] = None) -> str:
+    """Get the key of an input document in a journal, from its input id and text."""
+    if input_id is None:
+        return input_hash(text)
+    return input_hash(f"{input_id}\0{text}")
+
+
+def content_hash(text: str) -> str:
+    """Get a hash of a text that ignores differences in whitespace."""
+    return input_hash(" ".join(text.split()))
+
+
+class RunJournal:
+    """Status of each input document of a run, in a sqlite database.
+
+    Writes are committed immediately, so the journal survives the run
+    being killed; it may be shared by the threads of a run.
+    """
+
+    def __init__(
+        self,
+        run_id: str,
+        path: str = DEFAULT_JOURNAL_DB,
+        journal_mode: str = "WAL",
+        output: Optional[str] = None,
+    ):
+        """
+        :param run_id: identifier of the run
+        :param path: path to the journal database
+        :param journal_mode: sqlite journal mode; WAL only works on a local file system
+        :param output: path of the file results are written to, whose offsets are recorded
+        """
+        self.run_id = run_id
+        self.path = str(path)
+        self.output = str(Path(output).absolute()) if output else None
+        self._lock = threading.Lock()
+        logger.info(f"Journaling run {run_id} to {Path(self.path).absolute()}")
+        self._connection = connect(
+            self.path,
+            [
+                f"CREATE TABLE IF NOT EXISTS {JOURNAL_TABLE} ("
+                "run_id TEXT, input_hash TEXT, input_id TEXT, status TEXT, "
+                "output_offset INTEGER, error TEXT, updated REAL, "
+                "PRIMARY KEY (run_id, input_hash)) WITHOUT ROWID",
+                f"CREATE TABLE IF NOT EXISTS {OUTPUT_TABLE} ("
+                "run_id TEXT, output TEXT, output_offset INTEGER, "
+                "PRIMARY KEY (run_id, output)) WITHOUT ROWID",
+            ],
+            journal_mode=journal_mode,
+        )
+        self._done = {
+            row[0]
+            for row in self._connection.execute(
+                f"SELECT input_hash FROM {JOURNAL_TABLE} WHERE run_id=? AND status=?",
+                (run_id, STATUS_DONE),
+            )
+        }
+        if self._done:
+            logger.info(f"Resuming run {run_id}: {len(self._done)} documents already done")
+
+    def _record(self, text: str, status: str, input_id: Optional[str] = None,
+                output_offset: Optional[int] = None, error: Optional[str] = None) -> None:
+        key = document_key(text, input_id)
+        with self._lock:
+            self._connection.execute(
+                f"INSERT INTO {JOURNAL_TABLE} "
+                "(run_id, input_hash, input_id, status, output_offset, error, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (run_id, input_hash) DO UPDATE SET "
+                "input_id=coalesce(excluded.input_id, input_id), status=excluded.status, "
+                "output_offset=excluded.output_offset, error=excluded.error, "
+                "updated=excluded.updated",
+                (self.run_id, key, input_id, status, output_offset, error, time.time()),
+            )
+            if status == STATUS_DONE and output_offset is not None:
+                self._record_output_offset(output_offset)
+            self._connection.commit()
+            if status == STATUS_DONE:
+                self._done.add(key)
+
+    def is_done(self, text: str, input_id: Optional[str] = None) -> bool:
+        """Check if the results for a document were written in this run."""
+        return document_key(text, input_id) in self._done
+
+    def start(self, text: str, input_id: Optional[str] = None) -> None:
+        """Record that extraction of a document has started."""
+        self._record(text, STATUS_STARTED, input_id=input_id)
+
+    def fail(self, text: str, error: str, input_id: Optional[str] = None) -> None:
+        """Record that extraction of a document failed; it is retried on rerun."""
+        self._record(text, STATUS_FAILED, input_id=input_id, error=error)
+
+    def done(self, text: str, output_offset: Optional[int] = None,
+             input_id: Optional[str] = None) -> None:
+        """Record that the results for a document were written.
+
+        :param output_offset: position in the output after writing the results
+        """
+        self._record(text, STATUS_DONE, input_id=input_id, output_offset=output_offset)
+
+    def output_offset(self) -> Optional[int]:
+        """Get the offset of the output up to which it holds complete results, if recorded."""
+        if self.output is None:
+            return None
+        with self._lock:
+            row = self._connection.execute(
+                f"SELECT output_offset FROM {OUTPUT_TABLE} WHERE run_id=? AND output=?",
+                (self.run_id, self.output),
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def set_output_offset(self, output_offset: int) -> None:
+        """Record the offset of the output up to which it holds complete results."""
+        with self._lock:
+            self._record_output_offset(output_offset)
+            self._connection.commit()
+
+    def _record_output_offset(self, output_offset: int) -> None:
+        if self.output is None:
+            return
+        self._connection.execute(
+            f"INSERT OR REPLACE INTO {OUTPUT_TABLE} (run_id, output, output_offset) "
+            "VALUES (?, ?, ?)",
+            (self.run_id, self.output, output_offset),
+        )
+
+    def counts(self) -> Dict[str, int]:
+        """Get the number of documents of this run in each status."""
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT status, count(*) FROM {JOURNAL_TABLE} WHERE run_id=? GROUP BY status",
+                (self.run_id,),
+            ).fetchall()
+        return dict(rows)
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._connection.close()
+        logger.info(f"Closed journal of run {self.run_id}")
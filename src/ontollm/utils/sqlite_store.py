@@ -0,0 +1,77 @@
+"""Sqlite databases holding the caches, indexes and journals of a process.
+
+Each store (e.g. the completion cache, or the mapping index) keeps one
+connection to its database, shared across threads and guarded by a lock of
+its own; `connect` opens it, in WAL mode unless another journal mode is
+needed, and creates the tables of the store.
+
+A store is opened once per database file per process: use `shared_store`
+to get the store for a path, opening it on first use. Shared stores are
+closed when the process exits.
+"""
+import atexit
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple, TypeVar, Union
+
+STORE = TypeVar("STORE")
+
+
+def connect(
+    path: Union[str, Path],
+    tables: Iterable[str] = (),
+    journal_mode: str = "WAL",
+    synchronous: Optional[str] = None,
+) -> sqlite3.Connection:
+    """
+    Open a connection to a sqlite database, to be shared across threads.
+
+    :param path: path to the database, created if absent
+    :param tables: CREATE TABLE IF NOT EXISTS statements of the tables of the store
+    :param journal_mode: sqlite journal mode; WAL only works on a local file system
+    :param synchronous: sqlite synchronous setting, e.g. NORMAL, if not the default
+    :return: the connection
+    """
+    connection = sqlite3.connect(str(path), check_same_thread=False)
+    connection.execute(f"PRAGMA journal_mode={journal_mode}")
+    if synchronous:
+        connection.execute(f"PRAGMA synchronous={synchronous}")
+    for statement in tables:
+        connection.execute(statement)
+    connection.commit()
+    return connection
+
+
+_stores: Dict[Tuple[type, str], Any] = {}
+_stores_lock = threading.Lock()
+
+
+def shared_store(
+    store_class: Callable[..., STORE], path: Union[str, Path], **kwargs
+) -> STORE:
+    """
+    Get the process-wide store of a class for a database path, opening it if needed.
+
+    :param store_class: the class of the store, instantiated with the path and kwargs
+    :param path: path to the database
+    :param kwargs: further arguments of the store, used when it is opened
+    :return: the store
+    """
+    key = (store_class, str(Path(path).absolute()))
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = store_class(path, **kwargs)
+        return _stores[key]
+
+
+@atexit.register
+def close_shared_stores():
+    """Close all shared stores."""
+    with _stores_lock:
+        for store in _stores.values():
+            try:
+                store.close()
+            except sqlite3.ProgrammingError:
+                pass
+        _stores.clear()
@@ -0,0 +1,83 @@
+"""A persistent cache of the identifiers in expanded value sets.
+
+Expanding a dynamic enum (e.g. all descendants of a term in an ontology)
+is slow for large ontologies. Expansions are stored in a sqlite database,
+keyed by a hash over the enum definition and the versions of the
+ontologies it is drawn from, so that changing either results in a fresh
+expansion.
+
+One connection is kept open per database file per process; use
+`get_value_set_cache` rather than instantiating `ValueSetCache` directly.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import FrozenSet, Iterable, List, Optional
+
+from ontollm.utils.sqlite_store import connect, shared_store
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VALUE_SET_DB = ".ontollm_value_sets.db"
+
+VALUE_SET_TABLE = "value_sets"
+
+
+def value_set_key(enum_definition: str, ontology_versions: List[str]) -> str:
+    """Get the cache key for the expansion of an enum.
+
+    :param enum_definition: the enum definition, serialized
+    :param ontology_versions: versions of the ontologies the enum is drawn from
+    :return: a hex digest
+    """
+    content = json.dumps([enum_definition, sorted(ontology_versions)])
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class ValueSetCache:
+    """Cache of expanded value sets in a sqlite database, shared across threads."""
+
+    def __init__(self, path: str = DEFAULT_VALUE_SET_DB):
+        self.path = str(path)
+        self._lock = threading.Lock()
+        logger.info(f"Caching value set expansions to {Path(self.path).absolute()}")
+        self._connection = connect(
+            self.path,
+            [
+                f"CREATE TABLE IF NOT EXISTS {VALUE_SET_TABLE} ("
+                "key TEXT PRIMARY KEY, enum_name TEXT, ids TEXT, updated REAL) WITHOUT ROWID"
+            ],
+        )
+
+    def get(self, key: str) -> Optional[FrozenSet[str]]:
+        """Get the identifiers of the expansion stored under a key, or None."""
+        with self._lock:
+            row = self._connection.execute(
+                f"SELECT ids FROM {VALUE_SET_TABLE} WHERE key=?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return frozenset(json.loads(row[0]))
+
+    def put(self, key: str, ids: Iterable[str], enum_name: Optional[str] = None) -> None:
+        """Store the identifiers of an expansion under a key."""
+        with self._lock:
+            self._connection.execute(
+                f"INSERT OR REPLACE INTO {VALUE_SET_TABLE} (key, enum_name, ids, updated) "
+                "VALUES (?, ?, ?, ?)",
+                (key, enum_name, json.dumps(sorted(ids)), time.time()),
+            )
+            self._connection.commit()
+
+    def close(self) -> None:
+        """Close the connection."""
+        with self._lock:
+            self._connection.close()
+
+
+def get_value_set_cache(path: str = DEFAULT_VALUE_SET_DB) -> ValueSetCache:
+    """Get the process-wide cache for a database path, opening it if needed."""
+    return shared_store(ValueSetCache, path)
@@ -0,0 +1,246 @@
+"""Splitting a corpus extraction run across processes and nodes.
+
+Two modes are supported, neither needing any service beyond a file system:
+
+- Static sharding: each process takes the documents whose hash falls in
+  its shard (see `input_shard`), so shards are disjoint and stable
+  regardless of input order.
+- A work queue: the documents of a run are enqueued in a sqlite database
+  on a shared file system, and each process claims one at a time under
+  a lease that it renews while working. Leases of a process that dies
+  expire, and the document is claimed again by another process.
+  Note that sqlite locking requires a file system with working locks.
+  The queue database uses a rollback journal rather than WAL, as WAL
+  needs memory shared between processes and so does not work across
+  nodes on a network file system.
+
+Each process writes its own output; the fragments can be combined with
+the `merge-extractions` command.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Iterable, Iterator, Optional, Set, Tuple
+
+from ontollm.utils.run_journal import (
+    DEFAULT_JOURNAL_DB,
+    JOURNAL_TABLE,
+    STATUS_DONE,
+    STATUS_FAILED,
+    RunJournal,
+    document_key,
+    input_hash,
+)
+
+logger = logging.getLogger(__name__)
+
+LEASE_TABLE = "leases"
+
+# Seconds a claimed document stays leased without a heartbeat
+DEFAULT_LEASE_SECONDS = 600
+
+# Claims of a document before it is given up on
+DEFAULT_MAX_ATTEMPTS = 3
+
+LEASE_PENDING = "pending"
+LEASE_LEASED = "leased"
+LEASE_DONE = "done"
+LEASE_FAILED = "failed"
+
+# WAL needs shared memory, which processes on different nodes do not have
+QUEUE_JOURNAL_MODE = "DELETE"
+
+
+def input_shard(text: str, shard_count: int) -> int:
+    """Get the shard of a document, from 0 to shard_count - 1, by the hash of its text."""
+    return int(input_hash(text)[:16], 16) % shard_count
+
+
+def default_owner() -> str:
+    """Get an identifier for this process that is unique across nodes."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class WorkQueue(RunJournal):
+    """A run journal whose documents are claimed by competing processes.
+
+    Documents are enqueued with `enqueue` (by any or all processes, as
+    enqueuing is idempotent), and claimed one at a time by iterating over
+    `claims`. Outcomes are recorded as for a journal: `done` completes the
+    lease, `fail` releases it for another attempt.
+    """
+
+    def __init__(
+        self,
+        run_id: str,
+        path: str = DEFAULT_JOURNAL_DB,
+        owner: Optional[str] = None,
+        lease_seconds: float = DEFAULT_LEASE_SECONDS,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        journal_mode: str = QUEUE_JOURNAL_MODE,
+        output: Optional[str] = None,
+    ):
+        super().__init__(run_id, path, journal_mode=journal_mode, output=output)
+        self.owner = owner or default_owner()
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._held: Set[str] = set()
+        self._stop = threading.Event()
+        self._heartbeat: Optional[threading.Thread] = None
+        with self._lock:
+            self._connection.execute("PRAGMA busy_timeout=30000")
+            self._connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {LEASE_TABLE} ("
+                "run_id TEXT, input_hash TEXT, input_id TEXT, text TEXT, status TEXT, "
+                "owner TEXT, lease_expires REAL, attempts INTEGER, "
+                "PRIMARY KEY (run_id, input_hash)) WITHOUT ROWID"
+            )
+            self._connection.execute(
+                f"CREATE INDEX IF NOT EXISTS {LEASE_TABLE}_status "
+                f"ON {LEASE_TABLE} (run_id, status)"
+            )
+            self._connection.commit()
+
+    def enqueue(self, documents: Iterable[Tuple[str, str]]) -> int:
+        """Add (input_id, text) documents to the queue, unless already there.
+
+        :return: number of documents added
+        """
+        added = 0
+        with self._lock:
+            for input_id, text in documents:
+                cursor = self._connection.execute(
+                    f"INSERT OR IGNORE INTO {LEASE_TABLE} "
+                    "(run_id, input_hash, input_id, text, status, attempts) "
+                    "VALUES (?, ?, ?, ?, ?, 0)",
+                    (self.run_id, document_key(text, input_id), input_id, text, LEASE_PENDING),
+                )
+                added += cursor.rowcount
+            self._connection.commit()
+        logger.info(f"Enqueued {added} documents in run {self.run_id}")
+        return added
+
+    def claim(self) -> Optional[Tuple[str, str]]:
+        """Claim a pending document, or one whose lease has expired.
+
+        Documents whose lease expired on their last attempt are marked as
+        failed, so they are not left leased.
+
+        :return: (input_id, text) of the claimed document, or None if there is none
+        """
+        now = time.time()
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._expire(now)
+                row = self._connection.execute(
+                    f"SELECT input_hash, input_id, text FROM {LEASE_TABLE} "
+                    "WHERE run_id=? AND attempts<? "
+                    "AND (status=? OR (status=? AND lease_expires<?)) LIMIT 1",
+                    (self.run_id, self.max_attempts, LEASE_PENDING, LEASE_LEASED, now),
+                ).fetchone()
+                if row is not None:
+                    self._connection.execute(
+                        f"UPDATE {LEASE_TABLE} SET status=?, owner=?, lease_expires=?, "
+                        "attempts=attempts+1 WHERE run_id=? AND input_hash=?",
+                        (LEASE_LEASED, self.owner, now + self.lease_seconds, self.run_id, row[0]),
+                    )
+                self._connection.commit()
+            except BaseException:
+                self._connection.rollback()
+                raise
+        if row is None:
+            return None
+        self._held.add(row[0])
+        return row[1], row[2]
+
+    def _expire(self, now: float) -> None:
+        """Fail documents whose last lease expired; call in a transaction."""
+        expired = [
+            row[0]
+            for row in self._connection.execute(
+                f"SELECT input_hash FROM {LEASE_TABLE} "
+                "WHERE run_id=? AND status=? AND lease_expires<? AND attempts>=?",
+                (self.run_id, LEASE_LEASED, now, self.max_attempts),
+            )
+        ]
+        for key in expired:
+            self._connection.execute(
+                f"UPDATE {LEASE_TABLE} SET status=?, owner=NULL, lease_expires=NULL "
+                "WHERE run_id=? AND input_hash=?",
+                (LEASE_FAILED, self.run_id, key),
+            )
+            self._connection.execute(
+                f"UPDATE {JOURNAL_TABLE} SET status=?, error=?, updated=? "
+                "WHERE run_id=? AND input_hash=? AND status!=?",
+                (STATUS_FAILED, "Lease expired", now, self.run_id, key, STATUS_DONE),
+            )
+        if expired:
+            logger.warning(f"Gave up on {len(expired)} documents whose last lease expired")
+
+    def claims(self) -> Iterator[Tuple[str, str]]:
+        """Claim documents until none is left.
+
+        Leases held are renewed in the background until the queue is closed.
+        """
+        self._start_heartbeat()
+        while True:
+            claimed = self.claim()
+            if claimed is None:
+                break
+            yield claimed
+
+    def _start_heartbeat(self) -> None:
+        if self._heartbeat is not None and self._heartbeat.is_alive():
+            return
+        self._stop.clear()
+        self._heartbeat = threading.Thread(target=self._renew_leases, daemon=True)
+        self._heartbeat.start()
+
+    def _renew_leases(self) -> None:
+        while not self._stop.wait(self.lease_seconds / 3):
+            with self._lock:
+                held = list(self._held)
+                for key in held:
+                    self._connection.execute(
+                        f"UPDATE {LEASE_TABLE} SET lease_expires=? "
+                        "WHERE run_id=? AND input_hash=? AND owner=?",
+                        (time.time() + self.lease_seconds, self.run_id, key, self.owner),
+                    )
+                self._connection.commit()
+            logger.debug(f"Renewed {len(held)} leases of {self.owner}")
+
+    def _finish(self, text: str, input_id: Optional[str], failed: bool) -> None:
+        key = document_key(text, input_id)
+        with self._lock:
+            if failed:
+                status = f"CASE WHEN attempts<? THEN '{LEASE_PENDING}' ELSE '{LEASE_FAILED}' END"
+                args: tuple = (self.max_attempts,)
+            else:
+                status = "?"
+                args = (LEASE_DONE,)
+            self._connection.execute(
+                f"UPDATE {LEASE_TABLE} SET status={status}, owner=NULL, lease_expires=NULL "
+                "WHERE run_id=? AND input_hash=?",
+                args + (self.run_id, key),
+            )
+            self._connection.commit()
+            self._held.discard(key)
+
+    def fail(self, text: str, error: str, input_id: Optional[str] = None) -> None:
+        """Record that extraction of a document failed, and release its lease."""
+        super().fail(text, error, input_id=input_id)
+        self._finish(text, input_id, failed=True)
+
+    def done(self, text: str, output_offset: Optional[int] = None,
+             input_id: Optional[str] = None) -> None:
+        """Record that the results for a document were written, completing its lease."""
+        super().done(text, output_offset=output_offset, input_id=input_id)
+        self._finish(text, input_id, failed=False)
+
+    def close(self) -> None:
+        """Stop renewing leases and close the database connection."""
+        self._stop.set()
+        super().close()
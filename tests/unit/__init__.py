@@ -1,4 +1,24 @@
+import tempfile
+import unittest
+from pathlib import Path
+
 from tests import OUTPUT_DIR
 
 UNIT_CACHE_DB = str(OUTPUT_DIR / "unit_test_cache.db")
 GENE_REQUESTS_CACHE_DB = str(OUTPUT_DIR / "gene_requests_cache.db")
+
+
+class TemporaryDirectoryTestCase(unittest.TestCase):
+    """A test case with a temporary directory, removed after each test."""
+
+    def setUp(self) -> None:
+        """Set up."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        """Tear down."""
+        self.tmpdir.cleanup()
+
+    def temporary_path(self, name: str) -> str:
+        """Get the path of a file in the temporary directory."""
+        return str(Path(self.tmpdir.name) / name)
@@ -0,0 +1,238 @@
+"""Llama 2 client tests, with generation replaced by a stand-in."""
+import sqlite3
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from tests.unit import TemporaryDirectoryTestCase
+
+try:
+    from ontollm.clients.llama2_client import Llama2Client, _MicroBatcher
+except ImportError:
+    Llama2Client = None
+
+PIECES = ["genes: ", "cGAS", "; STING\n", "organisms: HSV-1\n"]
+
+
+@unittest.skipIf(Llama2Client is None, "Llama 2 requires torch and codellama")
+class TestCompleteStream(TemporaryDirectoryTestCase):
+    """Test streaming completions."""
+
+    def setUp(self) -> None:
+        """Set up."""
+        super().setUp()
+        self.client = Llama2Client.__new__(Llama2Client)
+        self.client.model_name = "stand-in"
+        self.client.cache_db_path = self.temporary_path("cache.db")
+        self.client.llama = mock.Mock()
+        self.client.llama.tokenizer.encode.return_value = [1, 2, 3]
+        self.generations = []
+
+        def generate_until_stop(prompt_tokens, on_text=None, **kwargs):
+            self.generations.append(kwargs)
+            for piece in PIECES:
+                on_text(0, piece)
+            return ["".join(PIECES)]
+
+        self.client._generate_until_stop = generate_until_stop
+
+    def test_pieces(self):
+        """Test that pieces are yielded as generated, and the payload then cached."""
+        pieces = list(self.client.complete_stream("prompt", stop=["==="]))
+        self.assertEqual(PIECES, pieces)
+        self.assertEqual(["==="], self.generations[0]["stop"])
+        self.assertEqual(
+            "".join(PIECES), self.client.cache.lookup("stand-in", "prompt", **self.params())
+        )
+
+    def test_cached(self):
+        """Test that a cached payload is yielded in one piece, without generating."""
+        list(self.client.complete_stream("prompt", stop=["==="]))
+        pieces = list(self.client.complete_stream("prompt", stop=["==="]))
+        self.assertEqual(["".join(PIECES)], pieces)
+        self.assertEqual(1, len(self.generations))
+
+    def test_deprecated_cache_path(self):
+        """Test that the former name of the cache path still sets it, with a warning."""
+        path = self.temporary_path("other.db")
+        with self.assertWarns(DeprecationWarning):
+            self.client.cache_db_path_str = path
+        self.assertEqual(path, self.client.cache_db_path)
+        with self.assertWarns(DeprecationWarning):
+            self.assertEqual(path, self.client.cache_db_path_str)
+
+    def params(self) -> dict:
+        """Get the default parameters of a completion stopping at ===."""
+        generation = self.generations[0]
+        return dict(
+            max_gen_len=generation["max_gen_len"],
+            temperature=generation["temperature"],
+            top_p=generation["top_p"],
+            stop=["==="],
+        )
+
+
+@unittest.skipIf(Llama2Client is None, "Llama 2 requires torch and codellama")
+class TestLegacyCache(TemporaryDirectoryTestCase):
+    """Test reading the completions cached by earlier versions of the client."""
+
+    def setUp(self) -> None:
+        """Set up."""
+        super().setUp()
+        self.client = Llama2Client.__new__(Llama2Client)
+        self.client.model_name = "stand-in"
+        self.client.batcher = None
+        self.client.cache_db_path = self.temporary_path("legacy.db")
+        connection = sqlite3.connect(self.client.cache_db_path)
+        connection.execute("CREATE TABLE cache (user_prompt, system_prompt, payload)")
+        connection.execute("INSERT INTO cache VALUES ('prompt', NULL, 'old completion')")
+        connection.commit()
+        connection.close()
+        self.client._generate_batch = lambda prompts, **kwargs: ["new completion"] * len(prompts)
+
+    def test_default_params(self):
+        """Test that a legacy completion is used for the former default parameters."""
+        self.assertEqual("old completion", self.client.complete("prompt"))
+        self.assertEqual(["old completion"], self.client.complete_batch(["prompt"]))
+
+    def test_other_params(self):
+        """Test that a legacy completion is not used for other parameters or stops."""
+        self.assertEqual("new completion", self.client.complete("prompt", temperature=0.1))
+        self.assertEqual("new completion", self.client.complete("prompt", stop=["==="]))
+        self.assertEqual(
+            "new completion", self.client.complete("prompt", stop_condition=lambda text: False)
+        )
+
+
+def stop_at_organisms(text: str) -> bool:
+    """Stop once the organisms are named."""
+    return "organisms:" in text
+
+
+stop_at_organisms.cache_key = "organisms"
+
+
+@unittest.skipIf(Llama2Client is None, "Llama 2 requires torch and codellama")
+class TestStopConditionCache(TemporaryDirectoryTestCase):
+    """Test caching completions cut short by a stop condition."""
+
+    def setUp(self) -> None:
+        """Set up."""
+        super().setUp()
+        self.client = Llama2Client.__new__(Llama2Client)
+        self.client.model_name = "stand-in"
+        self.client.batcher = None
+        self.client.cache_db_path = self.temporary_path("cache.db")
+        self.generated = []
+        self.client._generate_batch = self.generate_batch
+
+    def generate_batch(self, prompts, stop_conditions=None, **kwargs):
+        """Complete prompts, truncated for those with a stop condition."""
+        self.generated.extend(prompts)
+        return [
+            "genes: cGAS\norganisms:" if condition else "genes: cGAS\norganisms: HSV-1\n"
+            for condition in stop_conditions
+        ]
+
+    def test_named_condition(self):
+        """Test that a truncated completion is only reused with the same condition."""
+        truncated = self.client.complete("prompt", stop_condition=stop_at_organisms)
+        self.assertEqual("genes: cGAS\norganisms:", truncated)
+        self.assertEqual(
+            truncated, self.client.complete("prompt", stop_condition=stop_at_organisms)
+        )
+        self.assertEqual(["prompt"], self.generated)
+        full = self.client.complete("prompt")
+        self.assertEqual("genes: cGAS\norganisms: HSV-1\n", full)
+        self.assertEqual(
+            [truncated], self.client.complete_batch(["prompt"], stop_conditions=[stop_at_organisms])
+        )
+        self.assertEqual([full], self.client.complete_batch(["prompt"]))
+        self.assertEqual(["prompt", "prompt"], self.generated)
+
+    def test_unnamed_condition(self):
+        """Test that completions with a condition that has no cache key are not cached."""
+        for _ in range(2):
+            self.client.complete("prompt", stop_condition=lambda text: False)
+            self.client.complete_batch(["prompt"], stop_conditions=[lambda text: False])
+        self.assertEqual(["prompt"] * 4, self.generated)
+        self.assertEqual([], list(self.client.cached_completions()))
+        self.client.complete("prompt")
+        self.assertEqual(["prompt"] * 5, self.generated)
+
+
+@unittest.skipIf(Llama2Client is None, "Llama 2 requires torch and codellama")
+class TestMicroBatcher(TemporaryDirectoryTestCase):
+    """Test collecting concurrent completions into batches."""
+
+    def setUp(self) -> None:
+        """Set up."""
+        super().setUp()
+        self.client = Llama2Client.__new__(Llama2Client)
+        self.client.model_name = "stand-in"
+        self.client.max_batch_size = 3
+        self.client.cache_db_path = self.temporary_path("cache.db")
+        self.batches = []
+        self.batches_lock = threading.Lock()
+        self.client._generate_batch = self.generate_batch
+        self.client.batcher = _MicroBatcher(
+            self.client._generate_batch, max_batch_size=3, wait_ms=500
+        )
+
+    def generate_batch(self, prompts, **kwargs):
+        """Complete prompts by upper-casing them, recording each batch."""
+        with self.batches_lock:
+            self.batches.append(list(prompts))
+        return [prompt.upper() for prompt in prompts]
+
+    def complete_concurrently(self, prompts, **kwargs):
+        """Call complete() for each prompt at the same time."""
+        with ThreadPoolExecutor(len(prompts)) as executor:
+            return list(executor.map(lambda p: self.client.complete(p, **kwargs), prompts))
+
+    def test_coalesce(self):
+        """Test that concurrent calls share batches of up to max_batch_size prompts."""
+        prompts = [f"prompt {i}" for i in range(5)]
+        self.assertEqual([p.upper() for p in prompts], self.complete_concurrently(prompts))
+        self.assertEqual([3, 2], [len(batch) for batch in self.batches])
+        self.assertEqual(sorted(prompts), sorted(sum(self.batches, [])))
+
+    def test_params(self):
+        """Test that calls with different sampling parameters are not batched together."""
+        with ThreadPoolExecutor(2) as executor:
+            first = executor.submit(self.client.complete, "first", temperature=0.1)
+            second = executor.submit(self.client.complete, "second", temperature=0.2)
+            self.assertEqual(["FIRST", "SECOND"], [first.result(), second.result()])
+        self.assertEqual([["first"], ["second"]], sorted(self.batches))
+
+    def test_cache_hits(self):
+        """Test that cached completions are not generated again."""
+        self.client.complete("cached")
+        self.batches.clear()
+        self.assertEqual(["CACHED", "NEW"], self.complete_concurrently(["cached", "new"]))
+        self.assertEqual([["new"]], self.batches)
+        self.client.batcher = None
+        self.assertEqual(
+            ["NEW", "OTHER", "CACHED", "OTHER"],
+            self.client.complete_batch(["new", "other", "cached", "other"]),
+        )
+        self.assertEqual([["new"], ["other"]], self.batches)
+
+    def test_failure(self):
+        """Test that a failed batch raises its error in every waiting call."""
+
+        def fail(prompts, **kwargs):
+            with self.batches_lock:
+                self.batches.append(list(prompts))
+            raise RuntimeError("out of memory")
+
+        self.client.batcher.dispatch = fail
+        with ThreadPoolExecutor(3) as executor:
+            futures = [executor.submit(self.client.complete, f"prompt {i}") for i in range(3)]
+            for future in futures:
+                with self.assertRaisesRegex(RuntimeError, "out of memory"):
+                    future.result()
+        self.assertEqual([3], [len(batch) for batch in self.batches])
+        self.client.batcher.dispatch = self.generate_batch
+        self.assertEqual("PROMPT 0", self.client.complete("prompt 0"))
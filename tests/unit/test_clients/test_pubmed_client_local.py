@@ -0,0 +1,87 @@
+"""PubMed client tests, against a local stand-in for the E-utilities."""
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+from ontollm.clients.pubmed_client import PubmedClient
+
+ARTICLE = """<PubmedArticle><MedlineCitation><PMID>{pmid}</PMID><Article>
+<ArticleTitle>Title {pmid}</ArticleTitle><Abstract>Abstract {pmid}.</Abstract>
+</Article></MedlineCitation></PubmedArticle>"""
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Answers esearch and efetch requests; fails the first efetch request."""
+
+    requests = []
+    fail_next_fetch = True
+
+    def log_message(self, format, *args):
+        """Do not log requests."""
+
+    def do_GET(self):
+        """Answer a request."""
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        StandInHandler.requests.append((url.path, params))
+        if url.path.endswith("esearch.fcgi"):
+            retstart = int(params.get("retstart", 0))
+            retmax = int(params["retmax"])
+            ids = [str(i) for i in range(retstart, min(retstart + retmax, 7))]
+            body = json.dumps({"esearchresult": {"count": "7", "idlist": ids}})
+        elif url.path.endswith("efetch.fcgi"):
+            if StandInHandler.fail_next_fetch:
+                StandInHandler.fail_next_fetch = False
+                self.send_response(503)
+                self.end_headers()
+                return
+            articles = "".join(ARTICLE.format(pmid=i) for i in params["id"].split(","))
+            body = f'<?xml version="1.0" ?>\n<!DOCTYPE x>\n<PubmedArticleSet>{articles}'
+            body += "</PubmedArticleSet>"
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(body.encode("utf-8"))
+
+
+class TestPubmedClientLocal(unittest.TestCase):
+    """Test searching and fetching, with retries and concurrent batches."""
+
+    def setUp(self) -> None:
+        """Set up."""
+        StandInHandler.requests = []
+        StandInHandler.fail_next_fetch = True
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = PubmedClient(
+            eutils_url=f"http://127.0.0.1:{self.server.server_port}/",
+            requests_per_second=100,
+        )
+        self.client.email = None
+        self.client.ncbi_key = None
+
+    def tearDown(self) -> None:
+        """Tear down."""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_get_pmids(self):
+        """Test that search results are retrieved, in order."""
+        self.assertEqual([str(i) for i in range(7)], self.client.get_pmids("anything"))
+
+    def test_text(self):
+        """Test that batches are fetched in order, retrying a failed request."""
+        ids = [f"PMID:{i}" for i in range(450)]
+        with mock.patch("ontollm.clients.pubmed_client.RETRY_BACKOFF", 0.01):
+            texts = self.client.text(ids)
+        self.assertEqual(450, len(texts))
+        self.assertTrue(texts[0].startswith("Title: Title 0\n"))
+        self.assertIn("PMID: 449", texts[-1])
+        fetches = [params for path, params in StandInHandler.requests if "efetch" in path]
+        self.assertEqual(4, len(fetches))
@@ -0,0 +1,48 @@
+"""A SPIRES engine answering prompts from a stub client, without a model."""
+from typing import Callable, Iterator, List
+
+from ontollm.engines.spires_engine import SPIRESEngine
+
+
+class StubClient:
+    """Answers prompts with a function of the prompt, recording the prompts."""
+
+    def __init__(self, respond: Callable[[str], str], piece_size: int = 5):
+        """
+        :param respond: gives the completion for a prompt
+        :param piece_size: number of characters of each piece of a streamed completion
+        """
+        self.respond = respond
+        self.piece_size = piece_size
+        self.prompts: List[str] = []
+
+    def complete(self, prompt: str, show_prompt: bool = False, **kwargs) -> str:
+        """Complete a prompt."""
+        self.prompts.append(prompt)
+        return self.respond(prompt)
+
+    def complete_stream(self, prompt: str, show_prompt: bool = False, **kwargs) -> Iterator[str]:
+        """Complete a prompt, in pieces."""
+        completion = self.complete(prompt, show_prompt, **kwargs)
+        for i in range(0, len(completion), self.piece_size):
+            yield completion[i : i + self.piece_size]
+
+    def get_tokenizer(self, model=None):
+        """Get no tokenizer."""
+        return None
+
+
+class StubEngine(SPIRESEngine):
+    """A SPIRES engine whose client is a stub."""
+
+    def set_up_client(self):
+        """Set up a stub client, answering nothing until given a respond function."""
+        self.client = StubClient(lambda prompt: "")
+        self.tokenizer = None
+
+
+def stub_engine(template: str, respond: Callable[[str], str], **kwargs) -> StubEngine:
+    """Create an engine answering prompts with a function, using no mappers."""
+    engine = StubEngine(template=template, mappers=[], **kwargs)
+    engine.client.respond = respond
+    return engine
@@ -0,0 +1,95 @@
+"""Tests for the adapters engines hold on to."""
+import unittest
+from unittest import mock
+
+from ontollm.engines.enrichment import EnrichmentEngine
+from ontollm.engines.mapping_engine import MappingEngine, MappingTask, MappingTaskCollection
+from ontollm.engines.pheno_engine import PhenoEngine
+from ontollm.utils.adapter_registry import AdapterRegistry
+from tests.unit.test_engines import StubEngine, stub_engine
+from tests.unit.test_utils.test_adapter_registry import FakeAdapter
+
+
+class StubPhenoEngine(PhenoEngine):
+    """A pheno engine whose client is a stub."""
+
+    set_up_client = StubEngine.set_up_client
+
+
+class StubEnrichmentEngine(EnrichmentEngine):
+    """An enrichment engine whose client is a stub."""
+
+    set_up_client = StubEngine.set_up_client
+
+
+class StubMappingEngine(MappingEngine):
+    """A mapping engine whose client is a stub, categorizing nothing."""
+
+    set_up_client = StubEngine.set_up_client
+
+    def categorize_mapping(self, subject, ont_object, template_path=None):
+        """Categorize a mapping as nothing."""
+        return None
+
+
+class TestAdapterLeases(unittest.TestCase):
+    """Test that adapters kept by engines are not closed while they are in use."""
+
+    def setUp(self) -> None:
+        """Set up."""
+        self.registry = AdapterRegistry(max_open=0, opener=FakeAdapter)
+        patcher = mock.patch("ontollm.utils.adapter_registry._registry", self.registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self) -> None:
+        """Tear down."""
+        self.registry.close_all()
+
+    def assert_released(self, engine, *adapters):
+        """Assert that adapters are open until the engine is closed."""
+        for adapter in adapters:
+            self.assertFalse(adapter.closed)
+        engine.close()
+        for adapter in adapters:
+            self.assertTrue(adapter.closed)
+
+    def test_lease_adapter(self):
+        """Test that each selector is leased once, until the engine is closed."""
+        engine = stub_engine("gocam.GoCamAnnotations", lambda prompt: "")
+        adapter = engine.lease_adapter("sqlite:obo:hgnc")
+        self.assertIs(adapter, engine.lease_adapter("sqlite:obo:hgnc"))
+        self.registry.get("sqlite:obo:go")
+        self.assert_released(engine, adapter)
+        self.assertNotIn("sqlite:obo:hgnc", self.registry)
+
+    def test_translator(self):
+        """Test that the default mapper is held until the engine is closed."""
+        engine = StubEngine(template="gocam.GoCamAnnotations")
+        self.assertEqual("translator:", engine.mappers[0].selector)
+        self.assert_released(engine, engine.mappers[0])
+
+    def test_pheno_engine(self):
+        """Test that the Mondo adapter of a pheno engine is held."""
+        engine = StubPhenoEngine(mappers=[])
+        self.assertIs(engine.mondo, engine.mondo)
+        self.assert_released(engine, engine.mondo)
+
+    def test_enrichment_engine(self):
+        """Test that the label resolvers of an enrichment engine are held."""
+        engine = StubEnrichmentEngine(mappers=[])
+        engine.add_resolver("sqlite:obo:hgnc")
+        self.assert_released(engine, engine.label_resolvers["sqlite:obo:hgnc"])
+
+    def test_mapping_engine(self):
+        """Test that the adapters of mapping tasks are held."""
+        engine = StubMappingEngine(mappers=[])
+        task = MappingTask(
+            subject="MONDO:0005015",
+            ont_object="DOID:9351",
+            subject_adapter="sqlite:obo:mondo",
+            object_adapter="sqlite:obo:doid",
+        )
+        list(engine.run_tasks(MappingTaskCollection(tasks=[task])))
+        self.assertEqual("sqlite:obo:mondo", engine.subject_adapter.selector)
+        self.assert_released(engine, engine.subject_adapter, engine.object_adapter)
@@ -0,0 +1,86 @@
+"""Tests for running the requests of each annotator in its own threads."""
+import os
+import subprocess
+import sys
+import threading
+import unittest
+
+from ontollm.utils.bulk_annotation import InMemoryTextAnnotator
+from tests.unit.test_engines import stub_engine
+
+TEMPLATE = "gocam.GoCamAnnotations"
+
+LABELS = {"cGAS": "HGNC:21367", "STING": "HGNC:27962", "TBK1": "HGNC:11584"}
+
+HUNG_GROUNDING_SCRIPT = """
+from tests.unit.test_engines import stub_engine
+from tests.unit.test_engines.test_annotator_executors import HangingAnnotator
+engine = stub_engine(
+    "gocam.GoCamAnnotations",
+    lambda prompt: "",
+    annotators={"Gene": [HangingAnnotator({})]},
+    annotator_timeout=0.05,
+)
+print(list(engine.groundings("cGAS", engine.schemaview.get_class("Gene"))))
+"""
+
+
+class HangingAnnotator(InMemoryTextAnnotator):
+    """Never answers until released, like a remote service that hangs."""
+
+    def __init__(self, labels):
+        super().__init__(labels)
+        self.released = threading.Event()
+
+    def annotate_text(self, text, configuration=None):
+        """Wait until released."""
+        self.released.wait()
+        return super().annotate_text(text, configuration)
+
+
+class TestAnnotatorExecutors(unittest.TestCase):
+    """Test that a hung annotator does not hold up the others."""
+
+    def setUp(self) -> None:
+        """Set up."""
+        self.hanging = HangingAnnotator({})
+        self.engine = stub_engine(
+            TEMPLATE,
+            lambda prompt: "",
+            annotators={"Gene": [self.hanging, InMemoryTextAnnotator(LABELS)]},
+            annotator_workers=1,
+            annotator_timeout=2.0,
+            annotator_timeouts={"HangingAnnotator": 0.05},
+        )
+        self.class_def = self.engine.schemaview.get_class("Gene")
+
+    def tearDown(self) -> None:
+        """Tear down."""
+        self.hanging.released.set()
+
+    def test_hung_annotator(self):
+        """Test that other annotators answer while the requests of a hung one time out."""
+        for text, object_id in LABELS.items():
+            self.assertIn(object_id, list(self.engine.groundings(text, self.class_def)))
+        self.assertIsNot(
+            self.engine.annotator_executor(self.hanging),
+            self.engine.annotator_executor(self.engine.annotators["Gene"][1]),
+        )
+
+    def test_close(self):
+        """Test that closing the engine cancels the requests not yet started."""
+        executor = self.engine.annotator_executor(self.hanging)
+        running = executor.submit(self.hanging.annotate_text, "cGAS")
+        queued = executor.submit(self.hanging.annotate_text, "STING")
+        self.engine.close()
+        self.assertTrue(queued.cancelled())
+        self.assertIsNot(executor, self.engine.annotator_executor(self.hanging))
+        self.hanging.released.set()
+        running.result(timeout=5)
+
+    def test_exit(self):
+        """Test that a timed-out request to a hung annotator does not keep the process running."""
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        subprocess.run(
+            [sys.executable, "-c", HUNG_GROUNDING_SCRIPT], env=env, check=True, timeout=60
+        )
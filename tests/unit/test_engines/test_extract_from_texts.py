@@ -0,0 +1,72 @@
+"""Tests for extracting from many texts with a pool of workers."""
+import time
+from unittest import mock
+
+from ontollm.utils.run_journal import RunJournal
+from tests.unit import TemporaryDirectoryTestCase
+from tests.unit.test_engines import stub_engine
+
+TEMPLATE = "gocam.GoCamAnnotations"
+
+
+def respond(prompt: str) -> str:
+    """Name a gene after the text of the prompt."""
+    text = prompt.split("Text:\n", 1)[1].split("\n", 1)[0]
+    return f"genes: {text.replace(' ', '_')}\n"
+
+
+def respond_slowly_to_first(prompt: str) -> str:
+    """Name a gene after the text of the prompt, taking longer for the first text."""
+    if "Text:\ndoc 0\n" in prompt:
+        time.sleep(0.5)
+    return respond(prompt)
+
+
+class TestExtractFromTexts(TemporaryDirectoryTestCase):
+    """Test extracting from a stream of texts."""
+
+    def setUp(self) -> None:
+        """Set up."""
+        super().setUp()
+        self.engine = stub_engine(TEMPLATE, respond, annotators={"Gene": []})
+
+    def test_ordered(self):
+        """Test that results are yielded in input order, with their input ids."""
+        self.engine.client.respond = respond_slowly_to_first
+        texts = [(f"id{i}", f"doc {i}") for i in range(6)]
+        results = list(self.engine.extract_from_texts(texts, workers=3))
+        self.assertEqual([f"id{i}" for i in range(6)], [r.input_id for r in results])
+        self.assertEqual([f"doc {i}" for i in range(6)], [r.input_text for r in results])
+
+    def test_unordered(self):
+        """Test that results are yielded as soon as done, not held up by a slow one."""
+        self.engine.client.respond = respond_slowly_to_first
+        texts = [f"doc {i}" for i in range(6)]
+        results = list(self.engine.extract_from_texts(texts, workers=3, ordered=False))
+        self.assertEqual(sorted(texts), sorted(r.input_text for r in results))
+        self.assertNotEqual("doc 0", results[0].input_text)
+
+    def test_journaled_duplicates(self):
+        """Test that an identical text under another input id has its own result."""
+        journal = RunJournal("run1", self.temporary_path("runs.db"))
+        texts = [("1", "doc a"), ("2", "doc b"), ("3", "doc c"), ("4", "doc a")]
+        input_ids = []
+        for result in self.engine.extract_from_texts(texts, workers=1, journal=journal):
+            input_ids.append(result.input_id)
+            journal.done(result.input_text, input_id=result.input_id)
+        self.assertEqual(["1", "2", "3", "4"], input_ids)
+        self.assertEqual(3, len(self.engine.client.prompts))
+        journal.close()
+
+    def test_deduplication_window(self):
+        """Test that extractions are only kept for deduplication within the window."""
+        texts = ["doc a", "doc b", "doc a"]
+        results = list(self.engine.extract_from_texts(texts, workers=1))
+        self.assertEqual(2, len(self.engine.client.prompts))
+        with mock.patch("ontollm.engines.knowledge_engine.DEDUPLICATION_WINDOW", 1):
+            again = list(self.engine.extract_from_texts(texts, workers=1))
+        self.assertEqual(5, len(self.engine.client.prompts))
+        self.assertEqual(
+            [r.extracted_object.genes for r in results],
+            [r.extracted_object.genes for r in again],
+        )
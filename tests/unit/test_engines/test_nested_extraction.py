@@ -0,0 +1,103 @@
+"""Tests for extracting nested objects one recursion depth at a time."""
+import unittest
+
+from ontollm.engines.spires_engine import DeferredExtraction
+from tests.unit.test_engines import StubClient, stub_engine
+
+TEMPLATE = "recipe.Recipe"
+
+COMPLETIONS = {
+    "2 cups flour": "food_item: flour\namount: 2 cups\n",
+    "3 cups flour": "food_item: flour\namount: 3 cups\n",
+    "flour": "food: flour\nstate: sifted\n",
+    "2 cups": "value: 2\nunit: cups\n",
+    "3 cups": "value: 3\nunit: cups\n",
+}
+
+
+def respond(prompt: str) -> str:
+    """Complete a prompt according to the text it is about."""
+    text = prompt.split("\n\nText:\n", 1)[1].split("\n\n===", 1)[0]
+    return COMPLETIONS[text]
+
+
+class BatchingClient(StubClient):
+    """Completes prompts in batches, recording the prompts of each batch."""
+
+    def __init__(self, respond):
+        super().__init__(respond)
+        self.batches = []
+        self.stop_conditions = []
+
+    def complete_batch(self, prompts, stop_conditions=None, **kwargs):
+        """Complete prompts together."""
+        self.batches.append(list(prompts))
+        self.stop_conditions.append(stop_conditions)
+        return [self.respond(prompt) for prompt in prompts]
+
+
+class TestNestedExtraction(unittest.TestCase):
+    """Test resolving deferred nested extractions."""
+
+    def setUp(self) -> None:
+        """Set up."""
+        self.engine = stub_engine(TEMPLATE, respond)
+        self.engine.client = BatchingClient(respond)
+        self.ingredient = self.engine.schemaview.get_class("Ingredient")
+
+    def deferred(self, *texts):
+        """Create placeholders for ingredients."""
+        return [DeferredExtraction(text, self.ingredient) for text in texts]
+
+    def test_one_batch_per_depth(self):
+        """Test that each depth is one batch of distinct texts."""
+        deferred = self.deferred("2 cups flour", "3 cups flour", "2 cups flour")
+        self.engine._resolve_deferred(deferred)
+        self.assertEqual([2, 3], [len(batch) for batch in self.engine.client.batches])
+        ingredients = self.engine._substitute_deferred(deferred)
+        self.assertEqual(
+            {
+                "food_item": {"food": "flour", "state": "sifted"},
+                "amount": {"value": "2", "unit": "cups"},
+            },
+            ingredients[0],
+        )
+        self.assertEqual("3", ingredients[1]["amount"]["value"])
+        self.assertEqual(ingredients[0], ingredients[2])
+        self.assertIsNot(ingredients[0], ingredients[2])
+        self.assertIsNot(ingredients[0]["food_item"], ingredients[1]["food_item"])
+
+    def test_stop_conditions(self):
+        """Test that each prompt stops once the slots of its class are emitted."""
+        self.engine._resolve_deferred(self.deferred("2 cups flour"))
+        conditions = sum(self.engine.client.stop_conditions, [])
+        ingredient = conditions[0]
+        self.assertTrue(ingredient("food_item: flour\namount: 2 cups\n"))
+        self.assertFalse(ingredient("food_item: flour\n"))
+        self.assertEqual("all_slots_emitted:amount,food_item", ingredient.cache_key)
+        self.assertEqual(3, len({condition.cache_key for condition in conditions}))
+
+    def test_reuse(self):
+        """Test that texts extracted for an earlier document are not sent again."""
+        self.engine._resolve_deferred(self.deferred("2 cups flour"))
+        self.assertEqual(2, len(self.engine.client.batches))
+        deferred = self.deferred("2 cups flour", "3 cups flour")
+        self.engine._resolve_deferred(deferred)
+        self.assertEqual([1, 1], [len(batch) for batch in self.engine.client.batches[2:]])
+        self.assertIn("3 cups flour", self.engine.client.batches[2][0])
+        self.assertEqual("2", self.engine._substitute_deferred(deferred)[0]["amount"]["value"])
+
+    def test_limit(self):
+        """Test that the oldest nested extractions are dropped beyond the limit."""
+        self.engine.max_nested_extractions = 2
+        self.engine._resolve_deferred(self.deferred("2 cups flour"))
+        self.assertEqual(2, len(self.engine.nested_extractions))
+
+    def test_without_batching(self):
+        """Test that prompts are completed one by one if the client cannot batch."""
+        self.engine.client = StubClient(respond)
+        deferred = self.deferred("2 cups flour", "2 cups flour")
+        self.engine._resolve_deferred(deferred)
+        self.assertEqual(3, len(self.engine.client.prompts))
+        ingredients = self.engine._substitute_deferred(deferred)
+        self.assertEqual("cups", ingredients[1]["amount"]["unit"])
@@ -0,0 +1,40 @@
+"""Tests for rendering the slot lines of completion prompts once per class."""
+import unittest
+
+from tests.unit.test_engines import stub_engine
+
+TEMPLATE = "gocam.GoCamAnnotations"
+
+
+class TestPromptHeader(unittest.TestCase):
+    """Test the prompt headers of template classes."""
+
+    def setUp(self) -> None:
+        """Set up."""
+        self.engine = stub_engine(TEMPLATE, lambda prompt: "")
+
+    def test_header(self):
+        """Test that each promptable slot has a line, in slot order."""
+        header = self.engine.prompt_header()
+        names = [line.split(":", 1)[0] for line in header.splitlines()]
+        self.assertEqual("genes", names[0])
+        self.assertIn("organisms", names)
+        self.assertIn(header, self.engine.get_completion_prompt(text="some text"))
+
+    def test_cached(self):
+        """Test that a header is rendered once and reused."""
+        header = self.engine.prompt_header()
+        self.engine.prompt_headers[self.engine.template_class.name] = "genes: <cached>\n"
+        self.assertEqual("genes: <cached>\n", self.engine.prompt_header())
+        self.assertNotEqual(header, self.engine.prompt_header())
+
+    def test_template_change(self):
+        """Test that headers are rendered again for a new template."""
+        self.engine.prompt_header()
+        self.engine.prompt_headers["Recipe"] = "stale: <from another template>\n"
+        self.engine.template_class = self.engine._get_template_class("recipe.Recipe")
+        self.assertEqual({}, self.engine.prompt_headers)
+        header = self.engine.prompt_header()
+        self.assertIn("ingredients: <", header)
+        self.assertNotIn("stale", header)
+        self.assertEqual(["Recipe"], list(self.engine.prompt_headers))
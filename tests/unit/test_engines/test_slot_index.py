@@ -0,0 +1,69 @@
+"""Tests for indexing the slots of template classes."""
+import unittest
+
+from tests.unit.test_engines import stub_engine
+
+TEMPLATE = "ontology_issue.OntologyIssue"
+
+
+class TestSlotIndex(unittest.TestCase):
+    """Test looking up slots by the field names a model uses."""
+
+    def setUp(self) -> None:
+        """Set up."""
+        self.engine = stub_engine(TEMPLATE, lambda prompt: "")
+        self.index = self.engine.slot_index()
+        self.problem = self.engine.schemaview.get_class("OntologyProblem")
+
+    def test_lookup(self):
+        """Test that slots are found by name and plural form, exact names first."""
+        self.assertEqual("title", self.index.lookup("title").slot.name)
+        self.assertEqual("title", self.index.lookup("titles").slot.name)
+        self.assertEqual("domains", self.index.lookup("domains").slot.name)
+        self.assertEqual("domains", self.index.lookup("domainss").slot.name)
+        self.assertIsNone(self.index.lookup("domain"))
+        self.assertIsNone(self.index.lookup("nonexistent"))
+
+    def test_slot_info(self):
+        """Test the range metadata of slots."""
+        problems = self.index.lookup("problem_list")
+        self.assertTrue(problems.inlined)
+        self.assertEqual("OntologyProblem", problems.range_class.name)
+        self.assertIn("category", problems.range_slots)
+        domains = self.index.lookup("domains")
+        self.assertFalse(domains.inlined)
+        self.assertEqual("OntologyClass", domains.range_class.name)
+        category = self.engine.slot_index(self.problem).lookup("category")
+        self.assertEqual("ProblemType", category.enum_def.name)
+        self.assertEqual("MISSING_DEFINITION", category.enum_values["missing_definition"])
+        self.assertNotIn("id", [s.name for s in self.index.promptable_slots])
+
+    def test_cached(self):
+        """Test that an index is built once per class and reset with the template."""
+        self.assertIs(self.index, self.engine.slot_index())
+        self.assertIsNot(self.index, self.engine.slot_index(self.problem))
+        self.engine.template_class = self.engine._get_template_class(TEMPLATE)
+        self.assertIsNot(self.index, self.engine.slot_index())
+
+    def test_parse_line(self):
+        """Test that field names are normalized to the slots they stand for."""
+        self.assertEqual(
+            ("title", "Bone is too vague"),
+            self.engine._parse_line_to_dict("Titles: Bone is too vague"),
+        )
+        self.assertEqual(
+            ("category", "TYPO"),
+            self.engine._parse_line_to_dict("Category: TYPO", self.problem),
+        )
+        deferred = []
+        parsed = self.engine._parse_line_to_dict("Problem list: vague; typo", deferred=deferred)
+        self.assertEqual("problem_list", parsed[0])
+        self.assertEqual(["vague", "typo"], [d.text for d in deferred])
+        self.assertIsNone(self.engine._parse_line_to_dict("Priority: high"))
+
+    def test_ground_field(self):
+        """Test that enum values are matched regardless of case, and unknown fields rejected."""
+        self.assertEqual("TYPO", self.engine._ground_field("category", "typo", self.problem))
+        self.assertIsNone(self.engine._ground_field("category", "misspelling", self.problem))
+        with self.assertRaises(ValueError):
+            self.engine._ground_field("priority", "high", self.problem)
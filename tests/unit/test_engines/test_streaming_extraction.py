@@ -0,0 +1,98 @@
+"""Tests for parsing and grounding completions while they stream."""
+import threading
+import unittest
+
+from ontollm.utils.bulk_annotation import InMemoryTextAnnotator
+from tests.unit.test_engines import StubClient, stub_engine
+
+TEMPLATE = "gocam.GoCamAnnotations"
+
+COMPLETION = "genes: cGAS; STING\norganisms: HSV-1\n"
+
+LABELS = {"cGAS": "HGNC:21367", "STING": "HGNC:27962", "HSV-1": "NCBITaxon:10298"}
+
+
+class CountingAnnotator(InMemoryTextAnnotator):
+    """Counts the requests for single texts."""
+
+    def __init__(self, labels):
+        super().__init__(labels)
+        self.single_requests = 0
+
+    def annotate_text(self, text, configuration=None):
+        """Annotate a single text."""
+        self.single_requests += 1
+        return super().annotate_text(text, configuration)
+
+
+class SignallingAnnotator(InMemoryTextAnnotator):
+    """Signals once it has annotated a given text."""
+
+    def __init__(self, labels, text):
+        super().__init__(labels)
+        self.text = text
+        self.annotated = threading.Event()
+
+    def annotate_texts(self, texts, configuration):
+        """Annotate many texts, signalling if the awaited one is among them."""
+        results = super().annotate_texts(texts, configuration)
+        if self.text in texts:
+            self.annotated.set()
+        return results
+
+
+class PausingClient(StubClient):
+    """Streams the first line of a completion, then waits for a signal before the rest."""
+
+    def __init__(self, respond, signal: threading.Event):
+        super().__init__(respond)
+        self.signal = signal
+        self.signalled_while_generating = None
+
+    def complete_stream(self, prompt, show_prompt=False, **kwargs):
+        """Complete a prompt, pausing after the first line."""
+        first, rest = self.complete(prompt, show_prompt, **kwargs).split("\n", 1)
+        yield first + "\n"
+        self.signalled_while_generating = self.signal.wait(timeout=5)
+        yield rest
+
+
+class TestStreamingExtraction(unittest.TestCase):
+    """Test extracting from a streamed completion."""
+
+    def setUp(self) -> None:
+        """Set up."""
+        self.annotator = CountingAnnotator(LABELS)
+        self.engine = stub_engine(
+            TEMPLATE,
+            lambda prompt: COMPLETION,
+            annotators={"Gene": [self.annotator], "Organism": [self.annotator]},
+        )
+
+    def test_bulk_annotation(self):
+        """Test that the named entities of each streamed line are annotated in bulk."""
+        self.engine.streaming = True
+        result = self.engine.extract_from_text("some text")
+        self.assertEqual(["HGNC:21367", "HGNC:27962"], result.extracted_object.genes)
+        self.assertEqual(["NCBITaxon:10298"], result.extracted_object.organisms)
+        self.assertEqual(0, self.annotator.single_requests)
+
+    def test_same_as_complete(self):
+        """Test that streaming gives the same object and raw completion as a full payload."""
+        expected = self.engine.extract_from_text("some text")
+        self.engine.streaming = True
+        for piece_size in [1, 3, len(COMPLETION)]:
+            self.engine.client.piece_size = piece_size
+            result = self.engine.extract_from_text("some text")
+            self.assertEqual(expected.extracted_object, result.extracted_object)
+            self.assertEqual(COMPLETION, result.raw_completion_output)
+
+    def test_grounding_while_generating(self):
+        """Test that a completed line is grounded while later lines are still generated."""
+        annotator = SignallingAnnotator(LABELS, "cGAS")
+        self.engine.annotators = {"Gene": [annotator], "Organism": [annotator]}
+        self.engine.client = PausingClient(lambda prompt: COMPLETION, annotator.annotated)
+        self.engine.streaming = True
+        result = self.engine.extract_from_text("some text")
+        self.assertTrue(self.engine.client.signalled_while_generating)
+        self.assertEqual(["NCBITaxon:10298"], result.extracted_object.organisms)
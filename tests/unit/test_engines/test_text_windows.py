@@ -0,0 +1,41 @@
+"""Tests for splitting input texts into windows that fit the model's context."""
+import unittest
+
+from ontollm.utils.chunking import approximate_token_count
+from tests.unit.test_engines import stub_engine
+
+TEMPLATE = "gocam.GoCamAnnotations"
+
+TEXT = " ".join(f"Gene {i} regulates the expression of gene {i + 1}." for i in range(300))
+
+
+class TestTextWindows(unittest.TestCase):
+    """Test the token budget of windows."""
+
+    def setUp(self) -> None:
+        """Set up."""
+        self.engine = stub_engine(TEMPLATE, lambda prompt: "")
+        self.class_def = self.engine._get_template_class(TEMPLATE)
+
+    def test_default_completion_budget(self):
+        """Test that a small context still leaves room for text by default."""
+        self.engine.client.max_seq_len = 512
+        with self.assertNoLogs("ontollm.engines.knowledge_engine", level="WARNING"):
+            windows = self.engine.text_windows(TEXT, self.class_def)
+        self.assertGreater(len(windows), 1)
+        self.assertEqual(TEXT, " ".join(windows))
+        header = self.engine.get_completion_prompt(self.class_def, "")
+        budget = 512 - approximate_token_count(header) - 512 // 4
+        for window in windows:
+            self.assertLessEqual(approximate_token_count(window), budget)
+
+    def test_completion_budget_exceeding_context(self):
+        """Test that a completion budget leaving no room for text disables packing."""
+        self.engine.client.max_seq_len = 512
+        self.engine.completion_tokens = 512
+        with self.assertLogs("ontollm.engines.knowledge_engine", level="WARNING"):
+            self.assertEqual([TEXT], self.engine.text_windows(TEXT, self.class_def))
+
+    def test_no_context(self):
+        """Test that a text is not split if the context is unknown."""
+        self.assertEqual([TEXT], self.engine.text_windows(TEXT, self.class_def))
@@ -0,0 +1,81 @@
+"""Tests for extracting from windows of a text and merging the results."""
+import time
+import unittest
+
+from ontollm.engines.knowledge_engine import merge_extracted_objects
+from ontollm.templates.gocam import GoCamAnnotations
+from tests.unit.test_engines import stub_engine
+
+TEMPLATE = "gocam.GoCamAnnotations"
+
+GENES = ["geneA", "geneB", "geneC", "geneD"]
+
+TEXT = " ".join(f"The {gene} protein is expressed." for gene in GENES)
+
+
+def respond(prompt: str) -> str:
+    """Name the gene of the window, taking longer for the first window."""
+    text = prompt.split("Text:\n", 1)[1].split("\n", 1)[0]
+    if GENES[0] in text:
+        time.sleep(0.3)
+    genes = [gene for gene in GENES if gene in text]
+    return f"genes: {'; '.join(genes)}\n"
+
+
+class TestMergeExtractedObjects(unittest.TestCase):
+    """Test merging the objects extracted from successive windows."""
+
+    def test_dicts(self):
+        """Test that lists are concatenated in order and later values replace earlier ones."""
+        merged = merge_extracted_objects(
+            [
+                None,
+                {"genes": ["A"], "label": "first", "organisms": ["X"]},
+                {"genes": ["B", "C"], "label": None, "organisms": []},
+                {"genes": ["D"], "label": "last"},
+            ]
+        )
+        self.assertEqual(
+            {"genes": ["A", "B", "C", "D"], "label": "last", "organisms": ["X"]}, merged
+        )
+
+    def test_models(self):
+        """Test that pydantic objects are merged field by field."""
+        merged = merge_extracted_objects(
+            [
+                GoCamAnnotations(genes=["HGNC:1"], organisms=["NCBITaxon:9606"]),
+                GoCamAnnotations(genes=["HGNC:2"]),
+            ]
+        )
+        self.assertEqual(["HGNC:1", "HGNC:2"], merged.genes)
+        self.assertEqual(["NCBITaxon:9606"], merged.organisms)
+
+    def test_none(self):
+        """Test that there is nothing to merge without objects."""
+        self.assertIsNone(merge_extracted_objects([]))
+        self.assertIsNone(merge_extracted_objects([None, None]))
+
+
+class TestWindowedExtraction(unittest.TestCase):
+    """Test extracting from sentence windows concurrently."""
+
+    def setUp(self) -> None:
+        """Set up."""
+        self.engine = stub_engine(TEMPLATE, respond, annotators={"Gene": []},
+                                  sentences_per_window=1)
+
+    def test_window_order(self):
+        """Test that windows are merged in text order, whatever order they complete in."""
+        self.engine.window_workers = len(GENES)
+        result = self.engine.extract_from_text(TEXT)
+        self.assertEqual(len(GENES), len(self.engine.client.prompts))
+        self.assertEqual(
+            "\n".join(f"genes: {gene}\n" for gene in GENES), result.raw_completion_output
+        )
+        self.assertEqual(GENES, result.extracted_object.genes)
+        self.assertIn(GENES[-1], result.prompt)
+
+    def test_single_window(self):
+        """Test that a text of a single sentence is extracted from directly."""
+        result = self.engine.extract_from_text(f"The {GENES[1]} protein is expressed.")
+        self.assertEqual([GENES[1]], result.extracted_object.genes)
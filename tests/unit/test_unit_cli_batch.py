@@ -0,0 +1,218 @@
+"""Tests for the helpers of the batch extraction commands."""
+import json
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import click
+import yaml
+from click.testing import CliRunner
+
+from ontollm.cli import (
+    _configure_engine,
+    _extraction_kwargs,
+    _open_output,
+    _read_documents,
+    main,
+)
+from ontollm.engines.gpt4all_engine import GPT4AllEngine
+from ontollm.engines.spires_engine import SPIRESEngine
+from ontollm.utils.mapping_index import MappingIndex
+from ontollm.utils.run_journal import RunJournal
+from tests.unit import TemporaryDirectoryTestCase
+from tests.unit.test_engines import StubEngine, stub_engine
+from tests.unit.test_utils.test_mapping_index import SSSOM_TSV
+
+
+def create_stub_engine(template, **kwargs):
+    """Create an engine naming a gene after the first word of each text."""
+    return stub_engine(
+        template,
+        lambda prompt: f"genes: {prompt.split('Text:', 1)[1].split()[0]}\n",
+        annotators={"Gene": []},
+        mapping_index_path=kwargs.get("mapping_index_path"),
+    )
+
+
+class TestReadDocuments(TemporaryDirectoryTestCase):
+    """Test reading the documents of a corpus."""
+
+    def test_directory(self):
+        """Test that files are read in name order, with their path as id."""
+        directory = Path(self.temporary_path("corpus"))
+        directory.mkdir()
+        (directory / "b.txt").write_text("text b")
+        (directory / "a.txt").write_text("text a")
+        self.assertEqual(
+            [(str(directory / "a.txt"), "text a"), (str(directory / "b.txt"), "text b")],
+            list(_read_documents(str(directory))),
+        )
+
+    def test_jsonl(self):
+        """Test that records are read in order, numbered if they have no id."""
+        path = Path(self.temporary_path("corpus.jsonl"))
+        records = [{"pmid": "PMID:1", "abstract": "text 1"}, {"abstract": "text 2"}]
+        path.write_text("".join(json.dumps(record) + "\n" for record in records))
+        self.assertEqual(
+            [("PMID:1", "text 1"), ("1", "text 2")],
+            list(_read_documents(str(path), text_field="abstract", id_field="pmid")),
+        )
+
+    def test_tsv(self):
+        """Test that rows are read in order, numbered if they have no id."""
+        path = Path(self.temporary_path("corpus.tsv"))
+        path.write_text("id\ttext\nd1\ttext 1\n\ttext 2\n")
+        self.assertEqual([("d1", "text 1"), ("1", "text 2")], list(_read_documents(str(path))))
+
+    def test_unsupported(self):
+        """Test that other files are rejected."""
+        path = Path(self.temporary_path("corpus.csv"))
+        path.write_text("id,text\n")
+        with self.assertRaises(click.BadParameter):
+            list(_read_documents(str(path)))
+
+
+class TestExtractionKwargs(unittest.TestCase):
+    """Test passing engines only the arguments they accept."""
+
+    def test_engines(self):
+        """Test that sampling parameters are only passed to engines taking them."""
+        kwargs = dict(show_prompt=True, max_gen_len=100, temperature=0.2, top_p=0.9)
+        spires = SPIRESEngine.__new__(SPIRESEngine)
+        gpt4all = GPT4AllEngine.__new__(GPT4AllEngine)
+        self.assertEqual(kwargs, _extraction_kwargs(spires, **kwargs))
+        self.assertEqual({"show_prompt": True}, _extraction_kwargs(gpt4all, **kwargs))
+
+
+class TestConfigureEngine(TemporaryDirectoryTestCase):
+    """Test applying the global settings to an engine."""
+
+    def test_settings(self):
+        """Test that each setting given is applied, and the others left alone."""
+        engine = create_stub_engine("gocam.GoCamAnnotations")
+        engine.client.cache_db_path = None
+        mappers = engine.mappers
+        _configure_engine(
+            engine,
+            cache_db=self.temporary_path("cache.db"),
+            grounding_cache_db=self.temporary_path("groundings.db"),
+            skip_annotators=["bioportal:"],
+        )
+        self.assertEqual(self.temporary_path("cache.db"), engine.cache_db_path)
+        self.assertEqual(self.temporary_path("cache.db"), engine.client.cache_db_path)
+        self.assertEqual(self.temporary_path("groundings.db"), engine.grounding_cache_path)
+        self.assertEqual(["bioportal:"], engine.skip_annotators)
+        self.assertIs(mappers, engine.mappers)
+
+    def test_mapping_index(self):
+        """Test that an engine given a mapping index does not set up the translator."""
+        tsv_path = Path(self.temporary_path("mondo.sssom.tsv"))
+        tsv_path.write_text(SSSOM_TSV)
+        db_path = self.temporary_path("mappings.db")
+        index = MappingIndex(db_path)
+        index.load_sssom_tsv(tsv_path)
+        index.close()
+        with mock.patch("ontollm.engines.knowledge_engine.acquire_shared_adapter") as acquire:
+            engine = StubEngine(template="gocam.GoCamAnnotations", mapping_index_path=db_path)
+        acquire.assert_not_called()
+        self.assertEqual(1, len(engine.mappers))
+        self.assertIsInstance(engine.mappers[0], MappingIndex)
+        _configure_engine(engine, mapping_index=db_path)
+        with self.assertRaises(ValueError):
+            _configure_engine(engine, mapping_index=self.temporary_path("other.db"))
+
+
+class TestJournaledOutput(TemporaryDirectoryTestCase):
+    """Test resuming the output of a journaled run."""
+
+    def setUp(self) -> None:
+        """Set up."""
+        super().setUp()
+        self.db_path = self.temporary_path("runs.db")
+        self.output = self.temporary_path("results.yaml")
+
+    def test_truncate_partial_results(self):
+        """Test that results partly written when a run stopped are dropped on resume."""
+        Path(self.output).write_bytes(b"---\nearlier: results\n")
+        journal = RunJournal("run1", self.db_path, output=self.output)
+        with _open_output(self.output, journal) as output:
+            output.write(b"---\ninput_id: a\n")
+            output.flush()
+            journal.done("doc a", output_offset=output.tell(), input_id="a")
+            output.write(b"---\ninput_")
+        journal.close()
+        resumed = RunJournal("run1", self.db_path, output=self.output)
+        with _open_output(self.output, resumed) as output:
+            output.write(b"---\ninput_id: b\n")
+        resumed.close()
+        self.assertEqual(
+            "---\nearlier: results\n---\ninput_id: a\n---\ninput_id: b\n",
+            Path(self.output).read_text(),
+        )
+
+    def test_truncate_before_first_result(self):
+        """Test that a run stopped before writing any result resumes where it started."""
+        Path(self.output).write_bytes(b"---\nearlier: results\n")
+        journal = RunJournal("run1", self.db_path, output=self.output)
+        with _open_output(self.output, journal) as output:
+            output.write(b"---\ninput_")
+        journal.close()
+        resumed = RunJournal("run1", self.db_path, output=self.output)
+        with _open_output(self.output, resumed):
+            pass
+        resumed.close()
+        self.assertEqual("---\nearlier: results\n", Path(self.output).read_text())
+
+
+class TestCommands(TemporaryDirectoryTestCase):
+    """Test the batch extraction commands."""
+
+    def setUp(self) -> None:
+        """Set up."""
+        super().setUp()
+        self.runner = CliRunner()
+
+    def test_batch_extract(self):
+        """Test that the documents of a corpus are extracted, in order."""
+        corpus = Path(self.temporary_path("corpus.jsonl"))
+        corpus.write_text(
+            "".join(json.dumps({"id": f"d{i}", "text": f"gene{i} binds"}) + "\n" for i in range(4))
+        )
+        output = self.temporary_path("results.yaml")
+        with mock.patch("ontollm.cli.GPT4AllEngine", create_stub_engine):
+            result = self.runner.invoke(
+                main,
+                ["batch-extract", "-m", "gpt4all-j", "-t", "gocam.GoCamAnnotations",
+                 "-w", "2", "-o", output, str(corpus)],
+            )
+        self.assertEqual(0, result.exit_code, result.output)
+        with open(output) as file:
+            docs = list(yaml.safe_load_all(file))
+        self.assertEqual([f"d{i}" for i in range(4)], [doc["input_id"] for doc in docs])
+        self.assertEqual(["gene2"], docs[2]["extracted_object"]["genes"])
+
+    def test_merge_extractions(self):
+        """Test that results of several files are merged, each input kept once."""
+        first = Path(self.temporary_path("results.0.yaml"))
+        first.write_text("---\ninput_id: b\ninput_text: text b\n---\ninput_id: a\ninput_text: a\n")
+        second = Path(self.temporary_path("results.1.yaml"))
+        second.write_text("---\ninput_id: a\ninput_text: a\n---\ninput_id: c\ninput_text: c\n")
+        output = self.temporary_path("merged.yaml")
+        result = self.runner.invoke(
+            main, ["merge-extractions", "--sort", "-o", output, str(first), str(second)]
+        )
+        self.assertEqual(0, result.exit_code, result.output)
+        with open(output) as file:
+            docs = list(yaml.safe_load_all(file))
+        self.assertEqual(["a", "b", "c"], [doc["input_id"] for doc in docs])
+
+    def test_build_mapping_index(self):
+        """Test that the mappings of an SSSOM file are indexed."""
+        tsv_path = Path(self.temporary_path("mondo.sssom.tsv"))
+        tsv_path.write_text(SSSOM_TSV)
+        db_path = self.temporary_path("mappings.db")
+        result = self.runner.invoke(main, ["build-mapping-index", "-o", db_path, str(tsv_path)])
+        self.assertEqual(0, result.exit_code, result.output)
+        index = MappingIndex(db_path)
+        self.assertEqual(["DOID:9351"], list(index.mapped_ids("MONDO:0005015", ["DOID"])))
+        index.close()
@@ -0,0 +1,126 @@
+"""Tests for the process-wide adapter registry."""
+import sqlite3
+import threading
+import time
+import unittest
+
+from oaklib.implementations.sqldb.sql_implementation import SqlImplementation
+from oaklib.resource import OntologyResource
+from sqlalchemy import text
+
+from ontollm.utils.adapter_registry import (
+    AdapterRegistry,
+    close_adapter,
+    use_thread_local_sessions,
+)
+from tests.unit import TemporaryDirectoryTestCase
+
+
+class FakeAdapter:
+    """An adapter recording whether it was closed."""
+
+    def __init__(self, selector: str):
+        self.selector = selector
+        self.closed = False
+
+    def close(self):
+        """Close."""
+        self.closed = True
+
+
+class TestAdapterRegistry(unittest.TestCase):
+    """Test sharing, opening and closing adapters."""
+
+    def setUp(self) -> None:
+        """Set up."""
+        self.opened = []
+        self.registry = AdapterRegistry(max_open=2, opener=self._open)
+
+    def tearDown(self) -> None:
+        """Tear down."""
+        self.registry.close_all()
+
+    def _open(self, selector: str) -> FakeAdapter:
+        time.sleep(0.05)
+        self.opened.append(selector)
+        return FakeAdapter(selector)
+
+    def test_shared(self):
+        """Test that an adapter is opened once, even by concurrent threads."""
+        adapters = []
+        threads = [
+            threading.Thread(target=lambda: adapters.append(self.registry.get("sqlite:obo:hp")))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(["sqlite:obo:hp"], self.opened)
+        self.assertEqual(1, len({id(adapter) for adapter in adapters}))
+
+    def test_lru_closing(self):
+        """Test that the least recently used adapter is closed beyond the limit."""
+        hp = self.registry.get("sqlite:obo:hp")
+        go = self.registry.get("sqlite:obo:go")
+        self.registry.get("sqlite:obo:hp")
+        self.registry.get("sqlite:obo:mondo")
+        self.assertTrue(go.closed)
+        self.assertFalse(hp.closed)
+        self.assertNotIn("sqlite:obo:go", self.registry)
+        self.assertEqual(2, len(self.registry))
+
+    def test_leased_adapters_stay_open(self):
+        """Test that a leased adapter is not closed until the lease ends."""
+        with self.registry.lease("sqlite:obo:hp") as hp:
+            self.registry.get("sqlite:obo:go")
+            self.registry.get("sqlite:obo:mondo")
+            self.assertFalse(hp.closed)
+            self.assertEqual(2, len(self.registry))
+        self.registry.max_open = 1
+        self.assertTrue(hp.closed)
+        self.assertNotIn("sqlite:obo:hp", self.registry)
+        self.assertIn("sqlite:obo:mondo", self.registry)
+
+    def test_acquire_and_release(self):
+        """Test that an acquired adapter stays open until released."""
+        hp = self.registry.acquire("sqlite:obo:hp")
+        self.registry.get("sqlite:obo:go")
+        self.registry.get("sqlite:obo:mondo")
+        self.assertFalse(hp.closed)
+        self.registry.release("sqlite:obo:hp", hp)
+        self.registry.get("sqlite:obo:uberon")
+        self.assertTrue(hp.closed)
+
+
+class TestThreadLocalSessions(TemporaryDirectoryTestCase):
+    """Test that sqlite adapters use a session per thread."""
+
+    def setUp(self) -> None:
+        """Set up."""
+        super().setUp()
+        path = self.temporary_path("ontology.db")
+        sqlite3.connect(path).close()
+        self.adapter = SqlImplementation(OntologyResource(slug=path))
+        use_thread_local_sessions(self.adapter)
+
+    def tearDown(self) -> None:
+        """Tear down."""
+        close_adapter(self.adapter)
+        super().tearDown()
+
+    def test_session_per_thread(self):
+        """Test that each thread gets its own session, reopened after closing."""
+        sessions = []
+
+        def _session():
+            sessions.append(self.adapter.session.registry())
+
+        threads = [threading.Thread(target=_session) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(3, len({id(session) for session in sessions}))
+        close_adapter(self.adapter)
+        self.assertEqual(1, self.adapter.session.execute(text("SELECT 1")).scalar())
@@ -0,0 +1,60 @@
+"""Tests for annotating texts in bulk."""
+import unittest
+
+from oaklib.datamodels.text_annotator import TextAnnotation, TextAnnotationConfiguration
+
+from ontollm.utils.bulk_annotation import (
+    InMemoryTextAnnotator,
+    _annotate_texts_joined,
+    annotate_texts,
+)
+
+LABELS = {"asthma": "MONDO:0004979", "lung cancer": "MONDO:0008903", "cancer": "MONDO:0004992"}
+
+WHOLE_TEXT = TextAnnotationConfiguration(matches_whole_text=True)
+PARTIAL = TextAnnotationConfiguration(matches_whole_text=False)
+
+
+class JoinedTextAnnotator:
+    """Annotates texts as a remote annotator would, with 1-based inclusive offsets."""
+
+    def __init__(self):
+        self.requests = 0
+
+    def annotate_text(self, text, configuration=None):
+        self.requests += 1
+        lower = text.lower()
+        for label, object_id in LABELS.items():
+            start = lower.find(label)
+            while start >= 0:
+                yield TextAnnotation(
+                    object_id=object_id, subject_start=start + 1, subject_end=start + len(label)
+                )
+                start = lower.find(label, start + 1)
+
+
+class TestBulkAnnotation(unittest.TestCase):
+    """Test annotating the named entities of a completion in few requests."""
+
+    def test_annotate_texts(self):
+        """Test that annotators with bulk support are called once for all texts."""
+        annotator = InMemoryTextAnnotator(LABELS)
+        results = annotate_texts(annotator, ["Asthma", "lung cancer", "Asthma", "flu"], WHOLE_TEXT)
+        self.assertEqual(1, annotator.requests)
+        self.assertEqual(["MONDO:0004979"], results["Asthma"])
+        self.assertEqual([], results["flu"])
+        results = annotate_texts(annotator, ["small cell lung cancer"], PARTIAL)
+        self.assertEqual(["MONDO:0008903", "MONDO:0004992"], results["small cell lung cancer"])
+
+    def test_joined_request(self):
+        """Test that annotations of joined texts are assigned back to each text."""
+        annotator = JoinedTextAnnotator()
+        texts = ["asthma", "lung cancer", "severe asthma"]
+        results = _annotate_texts_joined(annotator, texts, PARTIAL)
+        self.assertEqual(1, annotator.requests)
+        self.assertEqual(["MONDO:0004979"], results["asthma"])
+        self.assertEqual(["MONDO:0008903", "MONDO:0004992"], results["lung cancer"])
+        self.assertEqual(["MONDO:0004979"], results["severe asthma"])
+        results = _annotate_texts_joined(annotator, texts, WHOLE_TEXT)
+        self.assertEqual(["MONDO:0008903"], results["lung cancer"])
+        self.assertEqual([], results["severe asthma"])
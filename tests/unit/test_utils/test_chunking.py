@@ -0,0 +1,68 @@
+"""Tests for splitting texts into windows."""
+import unittest
+
+from ontollm.utils.chunking import chunk_sentences, split_sentences, token_counter
+
+TEXT = "Aspirin treats pain. It may cause bleeding!\nIs it safe? Ask a doctor first."
+
+
+class TestChunking(unittest.TestCase):
+    """Test packing sentences into windows."""
+
+    def test_split_sentences(self):
+        """Test that sentences keep punctuation and rejoin to the original text."""
+        sentences = split_sentences(TEXT)
+        self.assertEqual(4, len(sentences))
+        self.assertEqual("Aspirin treats pain. ", sentences[0])
+        self.assertEqual(TEXT, "".join(sentences))
+
+    def test_no_redundant_windows(self):
+        """Test that each sentence is sent exactly once without overlap."""
+        windows = list(chunk_sentences(TEXT, max_sentences=2))
+        self.assertEqual(
+            ["Aspirin treats pain. It may cause bleeding!", "Is it safe? Ask a doctor first."],
+            windows,
+        )
+
+    def test_token_budget(self):
+        """Test that windows are filled up to the token budget."""
+        windows = list(chunk_sentences(TEXT, max_tokens=45, count_tokens=len))
+        self.assertEqual(
+            ["Aspirin treats pain. It may cause bleeding!", "Is it safe? Ask a doctor first."],
+            windows,
+        )
+        for window in windows:
+            self.assertLessEqual(len(window), 45)
+
+    def test_overlap(self):
+        """Test repeating trailing sentences at the start of the next window."""
+        windows = list(chunk_sentences(TEXT, max_sentences=2, overlap=1))
+        self.assertEqual(3, len(windows))
+        self.assertTrue(windows[1].startswith("It may cause bleeding!"))
+        self.assertTrue(windows[-1].endswith("Ask a doctor first."))
+
+    def test_long_sentence(self):
+        """Test that a sentence over the budget is split between words."""
+        windows = list(chunk_sentences("one two three four five six.", max_tokens=10,
+                                       count_tokens=len))
+        self.assertEqual(["one two", "three four", "five six."], windows)
+
+    def test_token_counter(self):
+        """Test counting with tokenizers with bos/eos flags, special token flags, or neither."""
+
+        class PlainTokenizer:
+            def encode(self, text):
+                return text.split()
+
+        class SentencePieceTokenizer:
+            def encode(self, text, bos, eos):
+                return [0] * bos + text.split() + [0] * eos
+
+        class HuggingFaceTokenizer:
+            def encode(self, text, add_special_tokens=True, **kwargs):
+                return [0] * add_special_tokens + text.split()
+
+        self.assertEqual(3, token_counter(PlainTokenizer())("a b c"))
+        self.assertEqual(3, token_counter(HuggingFaceTokenizer())("a b c"))
+        self.assertEqual(3, token_counter(SentencePieceTokenizer())("a b c"))
+        self.assertEqual(1, token_counter(None)("abcd"))
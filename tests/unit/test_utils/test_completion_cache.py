@@ -0,0 +1,122 @@
+"""Tests for the completion cache."""
+import sqlite3
+
+from ontollm.utils.completion_cache import (
+    CompletionCache,
+    completion_key,
+    completion_params,
+    get_completion_cache,
+)
+from tests.unit import TemporaryDirectoryTestCase
+
+
+class TestCompletionCache(TemporaryDirectoryTestCase):
+    """Test the completion cache."""
+
+    def setUp(self) -> None:
+        """Set up."""
+        super().setUp()
+        self.db_path = self.temporary_path("cache.db")
+        self.cache = CompletionCache(self.db_path, commit_every=2)
+
+    def tearDown(self) -> None:
+        """Tear down."""
+        self.cache.close()
+        super().tearDown()
+
+    def test_key_includes_params(self):
+        """Test that model and sampling parameters are part of the key."""
+        k = completion_key("m1", "prompt", temperature=0.6, top_p=0.9)
+        self.assertEqual(k, completion_key("m1", "prompt", top_p=0.9, temperature=0.6))
+        self.assertNotEqual(k, completion_key("m2", "prompt", temperature=0.6, top_p=0.9))
+        self.assertNotEqual(k, completion_key("m1", "prompt", temperature=0.2, top_p=0.9))
+        self.assertNotEqual(k, completion_key("m1", "prompt", "system", temperature=0.6, top_p=0.9))
+
+    def test_stop_condition_params(self):
+        """Test that completions with a stop condition are keyed on the condition, if named."""
+
+        def condition(text):
+            return text.endswith("\n")
+
+        self.assertEqual({"top_p": 0.9}, completion_params(top_p=0.9))
+        self.assertIsNone(completion_params(condition, top_p=0.9))
+        condition.cache_key = "line"
+        params = completion_params(condition, top_p=0.9)
+        self.assertEqual({"top_p": 0.9, "stop_condition": "line"}, params)
+        self.assertNotEqual(completion_key("m1", "prompt", top_p=0.9),
+                            completion_key("m1", "prompt", **params))
+
+    def test_read_through(self):
+        """Test that completions are computed once and then served from the cache."""
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return "completion"
+
+        for _ in range(3):
+            payload = self.cache.get_or_compute("m1", "prompt", compute, temperature=0.6)
+            self.assertEqual("completion", payload)
+        self.assertEqual(1, len(calls))
+        self.assertEqual(2, self.cache.hits)
+        self.assertEqual(1, self.cache.misses)
+        self.assertIsNone(self.cache.lookup("m1", "prompt", temperature=0.2))
+
+    def test_persistence(self):
+        """Test that entries survive reopening the database."""
+        self.cache.store("m1", "prompt", "completion", top_p=0.9)
+        self.cache.close()
+        self.cache = CompletionCache(self.db_path)
+        self.assertEqual("completion", self.cache.lookup("m1", "prompt", top_p=0.9))
+        entries = list(self.cache.entries("COMPLETION"))
+        self.assertEqual([("m1", "prompt", "completion")], entries)
+
+    def test_shared_per_path(self):
+        """Test that one cache is shared per database path."""
+        path = self.temporary_path("shared.db")
+        self.assertIs(get_completion_cache(path), get_completion_cache(path))
+
+    def test_legacy_table(self):
+        """Test that legacy completions are read through for their parameters, and migrated."""
+        path = self.temporary_path("legacy.db")
+        connection = sqlite3.connect(path)
+        connection.execute("CREATE TABLE cache (user_prompt, system_prompt, payload)")
+        connection.executemany(
+            "INSERT INTO cache (user_prompt, system_prompt, payload) VALUES (?, ?, ?)",
+            [
+                ("prompt", None, "old completion"),
+                ("question", "system", "old answer"),
+                ("unused", None, "never asked for"),
+            ],
+        )
+        connection.commit()
+        connection.close()
+        cache = CompletionCache(path)
+        self.assertIsNone(cache.lookup("m1", "prompt", temperature=0.2))
+        self.assertEqual(
+            "old completion", cache.lookup("m1", "prompt", read_legacy=True, temperature=0.6)
+        )
+        self.assertEqual(
+            "old answer", cache.lookup("m1", "question", "system", read_legacy=True, chat=True)
+        )
+        self.assertIsNone(cache.lookup("m1", "question", read_legacy=True))
+        self.assertEqual(2, cache.hits)
+        self.assertEqual(2, cache.misses)
+        key = completion_key("m1", "prompt", temperature=0.6)
+        self.assertEqual("old completion", cache.get(key))
+        self.assertIsNone(cache.get(completion_key("m1", "prompt", temperature=0.2)))
+        plan = cache._connection.execute(
+            "EXPLAIN QUERY PLAN SELECT payload FROM cache "
+            "WHERE user_prompt=? AND system_prompt IS ?",
+            ("prompt", None),
+        ).fetchall()
+        self.assertIn("cache_prompts", str(plan))
+        self.assertEqual(
+            [
+                ("m1", "prompt", "old completion"),
+                ("m1", "question", "old answer"),
+                (None, "unused", "never asked for"),
+            ],
+            sorted(cache.entries(), key=lambda entry: entry[1]),
+        )
+        cache.close()
@@ -0,0 +1,60 @@
+"""Tests for the thread pool of daemon threads."""
+import os
+import subprocess
+import sys
+import threading
+import time
+import unittest
+
+from ontollm.utils.daemon_executor import DaemonThreadPoolExecutor
+
+HANGING_SCRIPT = """
+import threading
+from ontollm.utils.daemon_executor import DaemonThreadPoolExecutor
+executor = DaemonThreadPoolExecutor(max_workers=1)
+executor.submit(threading.Event().wait)
+"""
+
+
+class TestDaemonThreadPoolExecutor(unittest.TestCase):
+    """Test running tasks on daemon threads."""
+
+    def setUp(self) -> None:
+        """Set up."""
+        self.executor = DaemonThreadPoolExecutor(max_workers=2, thread_name_prefix="test")
+        self.released = threading.Event()
+
+    def tearDown(self) -> None:
+        """Tear down."""
+        self.released.set()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def test_results(self):
+        """Test that results and exceptions are set on the futures of tasks."""
+        self.assertEqual(3, self.executor.submit(sum, [1, 2]).result(timeout=5))
+        with self.assertRaises(ZeroDivisionError):
+            self.executor.submit(lambda: 1 / 0).result(timeout=5)
+
+    def test_max_workers(self):
+        """Test that threads are reused and at most max_workers are started."""
+        futures = [self.executor.submit(time.sleep, 0.01) for _ in range(10)]
+        for future in futures:
+            future.result(timeout=5)
+        self.assertLessEqual(len(self.executor._threads), 2)
+        self.assertTrue(all(thread.daemon for thread in self.executor._threads))
+
+    def test_shutdown(self):
+        """Test that queued tasks are cancelled, and no tasks accepted after shutdown."""
+        running = [self.executor.submit(self.released.wait) for _ in range(2)]
+        queued = self.executor.submit(self.released.wait)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.assertTrue(queued.cancelled())
+        with self.assertRaises(RuntimeError):
+            self.executor.submit(sum, [])
+        self.released.set()
+        self.assertTrue(all(future.result(timeout=5) for future in running))
+
+    def test_exit(self):
+        """Test that a task that never returns does not keep the process from exiting."""
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        subprocess.run([sys.executable, "-c", HANGING_SCRIPT], env=env, check=True, timeout=30)
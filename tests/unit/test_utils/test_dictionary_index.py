@@ -0,0 +1,68 @@
+"""Tests for the dictionary synonym index."""
+import random
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from ontollm.utils.dictionary_index import DictionaryIndex
+
+SYNONYMS = ["lung cancer", "cancer", "lung", "small cell lung cancer", "cell", "ll"]
+
+
+class TestDictionaryIndex(unittest.TestCase):
+    """Test finding dictionary synonyms in texts."""
+
+    def test_matches(self):
+        """Test that all synonyms in a text are found, longest first."""
+        index = DictionaryIndex(SYNONYMS)
+        self.assertEqual(
+            ["small cell lung cancer", "lung cancer", "cancer", "lung", "cell", "ll"],
+            index.matches("non-small cell lung cancer"),
+        )
+        self.assertEqual(["lung"], index.matches("lungs"))
+        self.assertEqual([], index.matches("asthma"))
+
+    def test_same_as_scan(self):
+        """Test that matches are the same as a scan over all synonyms."""
+        rng = random.Random(0)
+        synonyms = [
+            "".join(rng.choice("abc") for _ in range(rng.randint(1, 5))) for _ in range(200)
+        ]
+        index = DictionaryIndex(synonyms)
+        for _ in range(100):
+            text = "".join(rng.choice("abcd") for _ in range(rng.randint(0, 20)))
+            expected = {syn for syn in synonyms if syn in text}
+            self.assertEqual(expected, set(index.matches(text)))
+
+    def test_add_after_matching(self):
+        """Test that synonyms added after a match are found in later ones."""
+        index = DictionaryIndex(["asthma"])
+        self.assertEqual([], index.matches("severe asthma attack"[:10]))
+        index.add("severe")
+        self.assertEqual(["asthma", "severe"], index.matches("severe asthma"))
+        self.assertEqual(2, len(index))
+
+    def test_concurrent_matching(self):
+        """Test that threads matching at once compile the index once, and all match."""
+        index = DictionaryIndex(SYNONYMS)
+        compile_index = DictionaryIndex._compile
+        compiled = []
+        start = threading.Barrier(8)
+
+        def slow_compile(self):
+            compiled.append(1)
+            time.sleep(0.05)
+            return compile_index(self)
+
+        def match(_):
+            start.wait()
+            return index.matches("small cell lung cancer")
+
+        with mock.patch.object(DictionaryIndex, "_compile", slow_compile):
+            with ThreadPoolExecutor(8) as executor:
+                results = list(executor.map(match, range(8)))
+        self.assertEqual(1, len(compiled))
+        self.assertEqual([results[0]] * 8, results)
+        self.assertEqual(6, len(results[0]))
@@ -0,0 +1,50 @@
+"""Tests for the grounding cache."""
+from ontollm.utils.grounding_cache import NOT_CACHED, GroundingCache, grounding_key
+from tests.unit import TemporaryDirectoryTestCase
+
+
+class TestGroundingCache(TemporaryDirectoryTestCase):
+    """Test caching groundings in memory and on disk."""
+
+    def setUp(self) -> None:
+        """Set up."""
+        super().setUp()
+        self.db_path = self.temporary_path("groundings.db")
+
+    def test_key(self):
+        """Test that keys ignore whitespace but not the class or configuration."""
+        key = grounding_key("lung  cancer", "Disease", "mondo")
+        self.assertEqual(key, grounding_key(" lung cancer", "Disease", "mondo"))
+        self.assertNotEqual(key, grounding_key("lung cancer", "Phenotype", "mondo"))
+        self.assertNotEqual(key, grounding_key("lung cancer", "Disease", "mondo|v2"))
+
+    def test_negative_results(self):
+        """Test that failures to ground are cached, distinctly from missing keys."""
+        cache = GroundingCache()
+        self.assertIs(NOT_CACHED, cache.get("a"))
+        cache.put("a", None)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(1, cache.misses)
+
+    def test_lru_eviction(self):
+        """Test that the least recently used grounding is evicted from memory."""
+        cache = GroundingCache(max_size=2)
+        cache.put("a", "MONDO:1")
+        cache.put("b", "MONDO:2")
+        cache.get("a")
+        cache.put("c", "MONDO:3")
+        self.assertEqual("MONDO:1", cache.get("a"))
+        self.assertIs(NOT_CACHED, cache.get("b"))
+
+    def test_persistence(self):
+        """Test that groundings, including failures, survive reopening the database."""
+        cache = GroundingCache(self.db_path)
+        cache.put("a", "MONDO:1", text="asthma", class_name="Disease")
+        cache.put("b", None, text="xyzzy", class_name="Disease")
+        cache.close()
+        cache = GroundingCache(self.db_path, max_size=0)
+        self.assertEqual("MONDO:1", cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIs(NOT_CACHED, cache.get("c"))
+        cache.close()
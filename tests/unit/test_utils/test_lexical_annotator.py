@@ -0,0 +1,62 @@
+"""Tests for the local lexical annotator."""
+from oaklib.datamodels.text_annotator import TextAnnotationConfiguration
+from oaklib.datamodels.vocabulary import HAS_EXACT_SYNONYM, LABEL_PREDICATE
+
+from ontollm.utils.lexical_annotator import LexicalAnnotator, Lexicon
+from tests.unit import TemporaryDirectoryTestCase
+
+ENTRIES = [
+    ("type 2 diabetes mellitus", "MONDO:0005148", LABEL_PREDICATE),
+    ("Type-2 diabetes", "MONDO:0005148", HAS_EXACT_SYNONYM),
+    ("diabetes mellitus", "MONDO:0005015", LABEL_PREDICATE),
+    ("diabetes", "MONDO:0005015", HAS_EXACT_SYNONYM),
+    ("obesity", "MONDO:0011122", LABEL_PREDICATE),
+    ("DM", "MONDO:0005015", HAS_EXACT_SYNONYM),
+]
+
+WHOLE = TextAnnotationConfiguration(matches_whole_text=True)
+PARTIAL = TextAnnotationConfiguration(matches_whole_text=False)
+
+
+class TestLexicalAnnotator(TemporaryDirectoryTestCase):
+    """Test annotating texts with labels and synonyms."""
+
+    def setUp(self) -> None:
+        """Set up."""
+        super().setUp()
+        self.annotator = LexicalAnnotator(ENTRIES)
+
+    def test_whole_text(self):
+        """Test that whole-text matches ignore case and punctuation between tokens."""
+        self.assertEqual(
+            ["MONDO:0005148"],
+            [a.object_id for a in self.annotator.annotate_text("type 2 Diabetes", WHOLE)],
+        )
+        self.assertEqual([], list(self.annotator.annotate_text("type 2 diabetes risk", WHOLE)))
+
+    def test_partial(self):
+        """Test that partial matches are the longest, leftmost, on word boundaries."""
+        text = "Obesity and type 2 diabetes mellitus; diabetes (DM) in obese patients"
+        annotations = list(self.annotator.annotate_text(text, PARTIAL))
+        self.assertEqual(
+            ["MONDO:0011122", "MONDO:0005148", "MONDO:0005015"],
+            [a.object_id for a in annotations],
+        )
+        self.assertEqual("type 2 diabetes mellitus", annotations[1].match_string)
+        self.assertEqual(text.index("type") + 1, annotations[1].subject_start)
+        self.assertEqual("type 2 diabetes mellitus", annotations[1].object_label)
+
+    def test_lexicon(self):
+        """Test that the entries of a source are stored and read back, labels first."""
+        lexicon = Lexicon(self.temporary_path("lexicons.db"))
+        self.assertIsNone(lexicon.version("sqlite:obo:mondo"))
+        self.assertEqual(len(ENTRIES), lexicon.put("sqlite:obo:mondo", "2023-09-12", ENTRIES))
+        self.assertEqual("2023-09-12", lexicon.version("sqlite:obo:mondo"))
+        entries = lexicon.entries("sqlite:obo:mondo")
+        self.assertEqual(set(ENTRIES), set(entries))
+        self.assertEqual(LABEL_PREDICATE, entries[0][2])
+        self.assertEqual(
+            self.annotator.annotate_texts(["diabetes", "obesity"], WHOLE),
+            LexicalAnnotator(entries).annotate_texts(["diabetes", "obesity"], WHOLE),
+        )
+        lexicon.close()
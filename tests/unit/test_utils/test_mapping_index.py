@@ -0,0 +1,55 @@
+"""Tests for the local mapping index."""
+from pathlib import Path
+
+from ontollm.utils.mapping_index import MappingIndex
+from tests.unit import TemporaryDirectoryTestCase
+
+SSSOM_TSV = """# curie_map:
+#   DOID: http://purl.obolibrary.org/obo/DOID_
+#   MONDO: http://purl.obolibrary.org/obo/MONDO_
+subject_id\tpredicate_id\tobject_id\tmapping_justification
+MONDO:0005015\tskos:exactMatch\tDOID:9351\tsemapv:ManualMappingCuration
+MONDO:0005015\tskos:exactMatch\tMESH:D003920\tsemapv:ManualMappingCuration
+MONDO:0005148\tskos:broadMatch\tDOID:9352\tsemapv:ManualMappingCuration
+"""
+
+
+class TestMappingIndex(TemporaryDirectoryTestCase):
+    """Test indexing and looking up mappings."""
+
+    def setUp(self) -> None:
+        """Set up."""
+        super().setUp()
+        self.db_path = self.temporary_path("mappings.db")
+        tsv_path = Path(self.temporary_path("mondo.sssom.tsv"))
+        tsv_path.write_text(SSSOM_TSV)
+        self.index = MappingIndex(self.db_path)
+        self.assertEqual(3, self.index.load_sssom_tsv(tsv_path))
+
+    def tearDown(self) -> None:
+        """Tear down."""
+        self.index.close()
+        super().tearDown()
+
+    def test_mapped_ids(self):
+        """Test lookups, filtered by the prefixes of the objects."""
+        self.assertEqual(
+            {"DOID:9351", "MESH:D003920"}, set(self.index.mapped_ids("MONDO:0005015"))
+        )
+        self.assertEqual(["DOID:9351"], list(self.index.mapped_ids("MONDO:0005015", ["DOID"])))
+        self.assertEqual([], list(self.index.mapped_ids("MONDO:0005015", ["HP"])))
+
+    def test_symmetric_mappings(self):
+        """Test that only equivalences are indexed in both directions."""
+        self.assertEqual(["MONDO:0005015"], list(self.index.mapped_ids("DOID:9351", ["MONDO"])))
+        self.assertEqual([], list(self.index.mapped_ids("DOID:9352")))
+        self.assertEqual(5, self.index.count())
+
+    def test_persistence(self):
+        """Test that loading the same mappings again adds nothing, after reopening."""
+        self.index.close()
+        self.index = MappingIndex(self.db_path)
+        self.index.load(
+            [("MONDO:0005015", "skos:exactMatch", "DOID:9351", "semapv:LexicalMatching")]
+        )
+        self.assertEqual(5, self.index.count())
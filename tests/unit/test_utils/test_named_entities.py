@@ -0,0 +1,47 @@
+"""Tests for the named entity registry."""
+import threading
+import unittest
+
+from ontollm.templates.core import NamedEntity
+from ontollm.utils.named_entities import NamedEntityRegistry
+
+
+class TestNamedEntityRegistry(unittest.TestCase):
+    """Test indexing named entities by id and label."""
+
+    def test_add(self):
+        """Test that entities are kept in order, once per id, unless appended."""
+        registry = NamedEntityRegistry()
+        self.assertTrue(registry.add(NamedEntity(id="MESH:D001241", label="aspirin")))
+        self.assertTrue(registry.add(NamedEntity(id="MONDO:0004979", label="asthma")))
+        self.assertFalse(registry.add(NamedEntity(id="MESH:D001241", label="ASA")))
+        registry.append(NamedEntity(id="MONDO:0004979", label="Asthma attacks"))
+        self.assertEqual(
+            ["aspirin", "asthma", "Asthma attacks"], [e.label for e in registry.entities()]
+        )
+        self.assertIn("MESH:D001241", registry)
+        self.assertEqual("asthma", registry.get("MONDO:0004979").label)
+        self.assertEqual("MONDO:0004979", registry.get_by_label("ASTHMA").id)
+        self.assertIsNone(registry.get("MESH:D000001"))
+
+    def test_from_list(self):
+        """Test building a registry from the named entities of an extraction."""
+        entities = [NamedEntity(id="MESH:D001241", label="aspirin"), NamedEntity(id="X:1")]
+        registry = NamedEntityRegistry(entities)
+        self.assertEqual(entities, list(registry))
+        self.assertEqual(0, len(NamedEntityRegistry(None)))
+
+    def test_concurrent_add(self):
+        """Test that entities added by concurrent threads are kept once per id."""
+        registry = NamedEntityRegistry()
+
+        def _add():
+            for i in range(500):
+                registry.add(NamedEntity(id=f"X:{i}"))
+
+        threads = [threading.Thread(target=_add) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(500, len(registry))
@@ -0,0 +1,73 @@
+"""Tests for text parsing utilities."""
+import unittest
+
+from ontollm.utils.parse_utils import IncrementalDecoder, find_stop_sequence, read_until_stop
+
+# SentencePiece-like vocabulary: a leading space is dropped at the start of
+# the decoded text, and a character may be split over byte tokens
+VOCAB = [b"\xe2\x96\x81label", b":", b"\xe2\x96\x81caf", b"\xc3", b"\xa9", b"\n"]
+
+
+def decode(tokens):
+    """Decode token ids with the vocabulary."""
+    text = b"".join(VOCAB[t] for t in tokens).decode("utf-8", errors="replace")
+    return text.replace("\u2581", " ").lstrip(" ")
+
+
+class TestReadUntilStop(unittest.TestCase):
+    """Test early termination of streamed completions."""
+
+    def test_find_stop_sequence(self):
+        """Test finding the earliest stop sequence."""
+        self.assertEqual(3, find_stop_sequence("ab ### c ===", ["===", "###"]))
+        self.assertIsNone(find_stop_sequence("abc", ["==="]))
+        self.assertIsNone(find_stop_sequence("abc", None))
+
+    def test_stop_sequence_across_chunks(self):
+        """Test that a stop sequence split over chunks is found and removed."""
+        chunks = iter(["label: x\n", "parts: a; b\n=", "==\nignored", "never read"])
+        self.assertEqual("label: x\nparts: a; b\n", read_until_stop(chunks, stop=["==="]))
+        self.assertEqual(["never read"], list(chunks))
+
+    def test_stop_condition(self):
+        """Test halting once a condition on the generated text holds."""
+        chunks = list("a: 1\nb: 2\nc: 3\n")
+        text = read_until_stop(chunks, stop_condition=lambda t: t.endswith("2\n"))
+        self.assertEqual("a: 1\nb: 2\n", text)
+
+    def test_no_stop(self):
+        """Test that all chunks are read if nothing stops generation."""
+        self.assertEqual("abc", read_until_stop(["a", "b", "c"], stop=["==="]))
+
+
+class TestIncrementalDecoder(unittest.TestCase):
+    """Test decoding generated tokens one at a time."""
+
+    def test_push(self):
+        """Test that the pieces add up to the decoded text, keeping spaces and characters."""
+        tokens = [0, 1, 2, 3, 4, 5, 0]
+        decoder = IncrementalDecoder(decode)
+        pieces = [decoder.push(t) for t in tokens]
+        self.assertEqual(["label", ":", " caf", "", "\u00e9", "\n", " label"], pieces)
+        self.assertEqual(decode(tokens), decoder.text)
+
+    def test_flush(self):
+        """Test that an incomplete character is decoded when flushed."""
+        decoder = IncrementalDecoder(decode)
+        self.assertEqual("caf", decoder.push(2))
+        self.assertEqual("", decoder.push(3))
+        self.assertEqual("\ufffd", decoder.flush())
+        self.assertEqual(decode([2, 3]), decoder.text)
+
+    def test_bounded_decoding(self):
+        """Test that each step decodes only the last few tokens."""
+        lengths = []
+
+        def counting_decode(tokens):
+            lengths.append(len(tokens))
+            return decode(tokens)
+
+        decoder = IncrementalDecoder(counting_decode)
+        for _ in range(100):
+            decoder.push(0)
+        self.assertLessEqual(max(lengths), 2)
@@ -0,0 +1,37 @@
+"""Tests for the request rate limiter."""
+import threading
+import time
+import unittest
+
+from ontollm.utils.rate_limiter import RateLimiter
+
+
+class TestRateLimiter(unittest.TestCase):
+    """Test spacing out requests."""
+
+    def test_rate(self):
+        """Test that requests from several threads are spaced out to the rate."""
+        limiter = RateLimiter(rate=20)
+        times = []
+
+        def _request():
+            for _ in range(3):
+                limiter.acquire()
+                times.append(time.monotonic())
+
+        threads = [threading.Thread(target=_request) for _ in range(3)]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertGreaterEqual(time.monotonic() - start, 8 / 20 - 0.01)
+        times.sort()
+        for earlier, later in zip(times, times[1:]):
+            self.assertGreaterEqual(later - earlier, 1 / 20 - 0.01)
+
+    def test_burst(self):
+        """Test that requests up to the burst size are not delayed after a pause."""
+        limiter = RateLimiter(rate=1, burst=3)
+        self.assertEqual([0.0, 0.0, 0.0], [limiter.acquire() for _ in range(3)])
+        self.assertRaises(ValueError, RateLimiter, 0)
@@ -0,0 +1,57 @@
+"""Tests for the run journal."""
+from ontollm.utils.run_journal import RunJournal, content_hash, input_hash
+from tests.unit import TemporaryDirectoryTestCase
+
+
+class TestRunJournal(TemporaryDirectoryTestCase):
+    """Test resuming runs from the journal."""
+
+    def setUp(self) -> None:
+        """Set up."""
+        super().setUp()
+        self.db_path = self.temporary_path("runs.db")
+
+    def test_resume(self):
+        """Test that only documents written in the same run are skipped on rerun."""
+        journal = RunJournal("run1", self.db_path)
+        journal.start("doc a", input_id="a")
+        journal.done("doc a", output_offset=120, input_id="a")
+        journal.start("doc b", input_id="b")
+        journal.fail("doc b", "ValueError()", input_id="b")
+        journal.start("doc c", input_id="c")
+        self.assertEqual({"done": 1, "failed": 1, "started": 1}, journal.counts())
+        journal.close()
+        resumed = RunJournal("run1", self.db_path)
+        self.assertTrue(resumed.is_done("doc a", input_id="a"))
+        self.assertFalse(resumed.is_done("doc b", input_id="b"))
+        self.assertFalse(resumed.is_done("doc c", input_id="c"))
+        resumed.close()
+        other = RunJournal("run2", self.db_path)
+        self.assertFalse(other.is_done("doc a", input_id="a"))
+        other.close()
+
+    def test_identical_texts(self):
+        """Test that identical texts under different input ids are journaled separately."""
+        journal = RunJournal("run1", self.db_path)
+        journal.done("doc a", output_offset=120, input_id="a")
+        self.assertTrue(journal.is_done("doc a", input_id="a"))
+        self.assertFalse(journal.is_done("doc a", input_id="a2"))
+        self.assertFalse(journal.is_done("doc a"))
+        journal.close()
+
+    def test_retry(self):
+        """Test that a failed document is done once a retry succeeds."""
+        journal = RunJournal("run1", self.db_path)
+        journal.fail("doc b", "ValueError()", input_id="b")
+        journal.done("doc b", output_offset=10, input_id="b")
+        self.assertTrue(journal.is_done("doc b", input_id="b"))
+        self.assertEqual({"done": 1}, journal.counts())
+        journal.close()
+
+    def test_content_hash(self):
+        """Test that content hashes ignore whitespace, unlike input hashes."""
+        self.assertEqual(
+            content_hash("aspirin  treats\npain "), content_hash("aspirin treats pain")
+        )
+        self.assertNotEqual(input_hash("aspirin  treats pain"), input_hash("aspirin treats pain"))
+        self.assertNotEqual(content_hash("aspirin treats pain"), content_hash("aspirin treats"))
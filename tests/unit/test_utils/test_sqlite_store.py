@@ -0,0 +1,30 @@
+"""Tests for the sqlite databases of caches, indexes and journals."""
+from ontollm.utils.completion_cache import CompletionCache
+from ontollm.utils.sqlite_store import connect, shared_store
+from ontollm.utils.value_set_cache import ValueSetCache
+from tests.unit import TemporaryDirectoryTestCase
+
+
+class TestSqliteStore(TemporaryDirectoryTestCase):
+    """Test opening stores."""
+
+    def test_connect(self):
+        """Test that tables are created, in the journal mode asked for."""
+        path = self.temporary_path("store.db")
+        connection = connect(path, ["CREATE TABLE IF NOT EXISTS t (k TEXT PRIMARY KEY)"])
+        self.assertEqual("wal", connection.execute("PRAGMA journal_mode").fetchone()[0])
+        connection.execute("INSERT INTO t VALUES ('a')")
+        connection.commit()
+        connection.close()
+        connection = connect(path, journal_mode="DELETE")
+        self.assertEqual("delete", connection.execute("PRAGMA journal_mode").fetchone()[0])
+        self.assertEqual([("a",)], connection.execute("SELECT k FROM t").fetchall())
+        connection.close()
+
+    def test_shared_store(self):
+        """Test that one store of each class is shared per database path."""
+        path = self.temporary_path("store.db")
+        cache = shared_store(CompletionCache, path)
+        self.assertIs(cache, shared_store(CompletionCache, self.temporary_path("./store.db")))
+        self.assertIsNot(cache, shared_store(CompletionCache, self.temporary_path("other.db")))
+        self.assertIsInstance(shared_store(ValueSetCache, path), ValueSetCache)
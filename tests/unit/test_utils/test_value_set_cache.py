@@ -0,0 +1,28 @@
+"""Tests for the value set expansion cache."""
+from ontollm.utils.value_set_cache import ValueSetCache, value_set_key
+from tests.unit import TemporaryDirectoryTestCase
+
+
+class TestValueSetCache(TemporaryDirectoryTestCase):
+    """Test persisting value set expansions."""
+
+    def setUp(self) -> None:
+        """Set up."""
+        super().setUp()
+        self.db_path = self.temporary_path("value_sets.db")
+
+    def test_key(self):
+        """Test that keys change with the enum definition and ontology versions."""
+        key = value_set_key('{"name": "CellTypeSet"}', ["obo:cl 2023-07-20"])
+        self.assertNotEqual(key, value_set_key('{"name": "CellTypeSet"}', ["obo:cl 2023-09-21"]))
+        self.assertNotEqual(key, value_set_key('{"name": "GeneSet"}', ["obo:cl 2023-07-20"]))
+
+    def test_persistence(self):
+        """Test that expansions survive reopening the database, as sets."""
+        cache = ValueSetCache(self.db_path)
+        self.assertIsNone(cache.get("k"))
+        cache.put("k", ["CL:0000236", "CL:0000084"], enum_name="CellTypeSet")
+        cache.close()
+        cache = ValueSetCache(self.db_path)
+        self.assertEqual(frozenset({"CL:0000084", "CL:0000236"}), cache.get("k"))
+        cache.close()
@@ -0,0 +1,79 @@
+"""Tests for sharding and the work queue."""
+import sqlite3
+import time
+
+from ontollm.utils.work_queue import WorkQueue, input_shard
+from tests.unit import TemporaryDirectoryTestCase
+
+DOCUMENTS = [("1", "doc one"), ("2", "doc two"), ("3", "doc three")]
+
+
+class TestWorkQueue(TemporaryDirectoryTestCase):
+    """Test splitting documents between processes."""
+
+    def setUp(self) -> None:
+        """Set up."""
+        super().setUp()
+        self.db_path = self.temporary_path("runs.db")
+        self.queues = []
+
+    def tearDown(self) -> None:
+        """Tear down."""
+        for queue in self.queues:
+            queue.close()
+        super().tearDown()
+
+    def _queue(self, owner: str, **kwargs) -> WorkQueue:
+        queue = WorkQueue("run1", self.db_path, owner=owner, **kwargs)
+        self.queues.append(queue)
+        return queue
+
+    def test_shards(self):
+        """Test that shards are stable and cover all documents once."""
+        shards = [input_shard(text, 4) for _, text in DOCUMENTS]
+        self.assertEqual(shards, [input_shard(text, 4) for _, text in DOCUMENTS])
+        self.assertTrue(all(0 <= s < 4 for s in shards))
+
+    def test_claims_are_exclusive(self):
+        """Test that each document is claimed by a single process."""
+        a = self._queue("a")
+        b = self._queue("b")
+        self.assertEqual(3, a.enqueue(DOCUMENTS))
+        self.assertEqual(0, b.enqueue(DOCUMENTS))
+        claimed = [a.claim(), b.claim(), a.claim()]
+        self.assertCountEqual(DOCUMENTS, claimed)
+        self.assertIsNone(b.claim())
+
+    def test_release_and_expiry(self):
+        """Test that failed and expired documents are claimed again, up to max attempts."""
+        a = self._queue("a", lease_seconds=0.05, max_attempts=2)
+        b = self._queue("b", lease_seconds=0.05, max_attempts=2)
+        a.enqueue(DOCUMENTS[:1])
+        input_id, text = a.claim()
+        a.fail(text, "ValueError()", input_id=input_id)
+        self.assertEqual((input_id, text), b.claim())
+        b.start(text, input_id=input_id)
+        time.sleep(0.1)
+        # b's lease has expired, but the document has had its two attempts
+        self.assertIsNone(a.claim())
+        self.assertEqual({"failed": 1}, a.counts())
+        with sqlite3.connect(self.db_path) as connection:
+            statuses = connection.execute("SELECT status FROM leases").fetchall()
+        self.assertEqual([("failed",)], statuses)
+
+    def test_journal_mode(self):
+        """Test that the queue does not use WAL, which needs shared memory."""
+        self._queue("a")
+        with sqlite3.connect(self.db_path) as connection:
+            mode = connection.execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual("delete", mode)
+
+    def test_done(self):
+        """Test that completed documents are not claimed again."""
+        a = self._queue("a", lease_seconds=0.05)
+        a.enqueue(DOCUMENTS)
+        for input_id, text in a.claims():
+            a.done(text, output_offset=0, input_id=input_id)
+        time.sleep(0.1)
+        self.assertIsNone(a.claim())
+        self.assertEqual({"done": 3}, a.counts())